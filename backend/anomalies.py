@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+# Thresholds mirror the rules the analyst prompt asks the model to look for.
+CPA_SPIKE = 0.20          # CPA more than 20% above the campaign's own baseline...
+CPA_Z = 2.0               # ...and far enough outside its usual day-to-day noise
+SPEND_Z = 3.0             # spend this many standard deviations above baseline
+ROAS_ROBUST_Z = -3.0      # ROAS this far below the account median (median/MAD units)
+HIGH_SPEND_QUANTILE = 0.75
+BASELINE_WINDOW = 14
+BASELINE_MIN_PERIODS = 7
+
+FLAG_COLUMNS = ["campaign", "date", "rule", "metric", "value", "baseline", "delta_pct", "zscore", "severity"]
+
+
+class ScreenResult:
+    """Flagged rows plus compact account-level aggregates from `screen_performance`."""
+
+    def __init__(self, flags, aggregates):
+        self.flags = flags
+        self.aggregates = aggregates
+
+
+def screen_performance(df):
+    """
+    Vectorized statistical pre-pass over a full performance frame.
+
+    Expects `spend` and `conversions`, optionally `conversion_value` and `date`, and a
+    campaign identifier (`campaign_name` or `platform_campaign_id`). With dates, each
+    campaign is compared against its own trailing baseline (CPA spikes, spend z-scores);
+    campaigns are always compared with each other on totals (high spend / low
+    conversions, ROAS outliers).
+    """
+    frame = _prepare(df)
+    parts = [_cross_sectional_flags(frame)]
+    if "date" in frame and frame["date"].notna().any():
+        parts.append(_time_series_flags(frame))
+
+    parts = [p for p in parts if len(p)]
+    flags = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    flags = flags.reindex(columns=FLAG_COLUMNS)
+    if len(flags):
+        order = flags["severity"].map({"high": 0, "medium": 1, "low": 2})
+        flags = flags.assign(_order=order, _size=flags["zscore"].abs().fillna(flags["delta_pct"].abs()))
+        flags = flags.sort_values(["_order", "_size"], ascending=[True, False]).drop(columns=["_order", "_size"])
+    return ScreenResult(flags.reset_index(drop=True), _aggregates(frame))
+
+
+def _prepare(df):
+    campaign_column = _campaign_column(df)
+    frame = pd.DataFrame({
+        "campaign": df[campaign_column].astype(str) if campaign_column else "all",
+        "spend": _numeric(df, "spend"),
+        "conversions": _numeric(df, "conversions"),
+    }, index=df.index)
+    if "conversion_value" in df:
+        frame["conversion_value"] = _numeric(df, "conversion_value")
+    if "date" in df:
+        frame["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return frame
+
+
+def _numeric(df, column):
+    if column not in df:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0.0)
+
+
+def _campaign_column(df):
+    for column in ("campaign_name", "platform_campaign_id", "campaign_key"):
+        if column in df:
+            return column
+    return None
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _cross_sectional_flags(frame):
+    totals = frame.groupby("campaign", sort=False)[["spend", "conversions"]].sum()
+    totals["cpa"] = _ratio(totals["spend"].to_numpy(), totals["conversions"].to_numpy())
+    flags = []
+
+    # High spend, low conversions: top-quartile spenders with no conversions or 2x the median CPA.
+    median_cpa = np.nanmedian(totals["cpa"]) if totals["cpa"].notna().any() else np.nan
+    high_spend = totals["spend"] >= totals["spend"].quantile(HIGH_SPEND_QUANTILE)
+    weak = (totals["conversions"] <= 0) | (totals["cpa"] >= 2 * median_cpa)
+    hit = totals[high_spend & weak & (totals["spend"] > 0)] if len(totals) > 1 else totals.iloc[0:0]
+    if len(hit):
+        flags.append(pd.DataFrame({
+            "campaign": hit.index,
+            "rule": "high_spend_low_conversions",
+            "metric": "cpa",
+            "value": hit["cpa"].to_numpy(),
+            "baseline": median_cpa,
+            "delta_pct": (hit["cpa"] / median_cpa - 1).to_numpy() * 100,
+            "severity": np.where(hit["conversions"] <= 0, "high", "medium"),
+        }))
+
+    # ROAS outliers against the account median, using median/MAD so one huge campaign does not mask others.
+    if "conversion_value" in frame:
+        value = frame.groupby("campaign", sort=False)["conversion_value"].sum()
+        roas = pd.Series(_ratio(value.to_numpy(), totals["spend"].to_numpy()), index=totals.index).dropna()
+        if len(roas) > 2:
+            median = roas.median()
+            mad = (roas - median).abs().median() * 1.4826
+            if mad > 0:
+                z = (roas - median) / mad
+                low = z[z <= ROAS_ROBUST_Z]
+                if len(low):
+                    flags.append(pd.DataFrame({
+                        "campaign": low.index,
+                        "rule": "low_roas_outlier",
+                        "metric": "roas",
+                        "value": roas[low.index].to_numpy(),
+                        "baseline": median,
+                        "delta_pct": (roas[low.index] / median - 1).to_numpy() * 100,
+                        "zscore": low.to_numpy(),
+                        "severity": np.where(low <= 2 * ROAS_ROBUST_Z, "high", "medium"),
+                    }))
+
+    return pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=FLAG_COLUMNS)
+
+
+def _time_series_flags(frame):
+    daily = frame.dropna(subset=["date"]).groupby(["campaign", "date"], sort=True)[["spend", "conversions"]].sum()
+    daily = daily.reset_index()
+    daily["cpa"] = _ratio(daily["spend"].to_numpy(), daily["conversions"].to_numpy())
+    by_campaign = daily.groupby("campaign", sort=False)
+
+    def baseline(column, stat):
+        # Trailing window that excludes the current day.
+        shifted = by_campaign[column].shift(1)
+        rolling = shifted.groupby(daily["campaign"]).rolling(BASELINE_WINDOW, min_periods=BASELINE_MIN_PERIODS)
+        return getattr(rolling, stat)().reset_index(level=0, drop=True)
+
+    cpa_base, cpa_std = baseline("cpa", "mean"), baseline("cpa", "std")
+    spend_mean, spend_std = baseline("spend", "mean"), baseline("spend", "std")
+
+    cpa_delta = daily["cpa"] / cpa_base - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cpa_z = (daily["cpa"] - cpa_base) / cpa_std.where(cpa_std > 0)
+        spend_z = (daily["spend"] - spend_mean) / spend_std.where(spend_std > 0)
+
+    flags = []
+    cpa_hit = (cpa_delta > CPA_SPIKE) & (cpa_z >= CPA_Z)
+    if cpa_hit.any():
+        flags.append(pd.DataFrame({
+            "campaign": daily.loc[cpa_hit, "campaign"],
+            "date": daily.loc[cpa_hit, "date"],
+            "rule": "cpa_spike",
+            "metric": "cpa",
+            "value": daily.loc[cpa_hit, "cpa"],
+            "baseline": cpa_base[cpa_hit],
+            "delta_pct": cpa_delta[cpa_hit] * 100,
+            "zscore": cpa_z[cpa_hit],
+            "severity": np.where(cpa_delta[cpa_hit] >= 0.5, "high", "medium"),
+        }))
+    spend_hit = spend_z > SPEND_Z
+    if spend_hit.any():
+        flags.append(pd.DataFrame({
+            "campaign": daily.loc[spend_hit, "campaign"],
+            "date": daily.loc[spend_hit, "date"],
+            "rule": "spend_spike",
+            "metric": "spend",
+            "value": daily.loc[spend_hit, "spend"],
+            "baseline": spend_mean[spend_hit],
+            "delta_pct": (daily.loc[spend_hit, "spend"] / spend_mean[spend_hit] - 1) * 100,
+            "zscore": spend_z[spend_hit],
+            "severity": np.where(spend_z[spend_hit] >= 2 * SPEND_Z, "high", "medium"),
+        }))
+    return pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=FLAG_COLUMNS)
+
+
+def _aggregates(frame):
+    spend = float(frame["spend"].sum())
+    conversions = float(frame["conversions"].sum())
+    aggregates = {
+        "rows": int(len(frame)),
+        "campaigns": int(frame["campaign"].nunique()),
+        "spend": round(spend, 2),
+        "conversions": round(conversions, 2),
+        "cpa": round(spend / conversions, 2) if conversions else None,
+    }
+    if "conversion_value" in frame:
+        value = float(frame["conversion_value"].sum())
+        aggregates["roas"] = round(value / spend, 2) if spend else None
+    if "date" in frame and frame["date"].notna().any():
+        aggregates["date_range"] = [frame["date"].min().date().isoformat(), frame["date"].max().date().isoformat()]
+    return aggregates
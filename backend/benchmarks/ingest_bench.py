@@ -0,0 +1,238 @@
+"""
+End-to-end ingestion benchmark against the local platform mock
+(benchmarks/mock_platforms.py): every connector on its own, then a
+multi-tenant run through the IngestionOrchestrator and, with --queue, the
+same jobs as queued work items drained by local workers.
+
+    python benchmarks/ingest_bench.py [--days 30] [--latency-ms 20] [--error-rate 0.02]
+                                      [--rate-limit graph.facebook.com=20] [--output ingest.json]
+
+Reports rows/sec, per-request p50/p99 latency, retries and throttled/failed
+responses, and peak traced memory, as JSON so runs can be diffed over time.
+With DATABASE_URL set the rows are also loaded into Postgres.
+
+--rate-limit-redis keeps the limiter's buckets in Redis, running the same Lua
+scripts as RATE_LIMIT_REDIS_URL does in production; `fake` runs them in-process
+with fakeredis (pip install "fakeredis[lua]"), so no server is needed.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform as platform_info
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import ingestion  # noqa: E402
+from benchmarks.mock_platforms import MockConfig, start_server  # noqa: E402
+from connectors.transport import HttpTransport, set_transport  # noqa: E402
+from orchestrator import IngestionJob, IngestionOrchestrator, summarize  # noqa: E402
+from rate_limits import RateLimiter, RedisBucketStore  # noqa: E402
+from work_queue import InMemoryCheckpointStore, InMemoryWorkQueue, IngestionWorker, enqueue_ingestion  # noqa: E402
+
+PLATFORMS = ("Meta", "TikTok", "Reddit", "LinkedIn", "MicrosoftAds", "GoogleAnalytics", "GoogleSearchConsole")
+
+
+class RequestRecorder:
+    """Transport hook collecting per-attempt latency and outcome."""
+
+    def __init__(self):
+        self.latencies = []
+        self.retries = 0
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, status, elapsed, attempt):
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.retries += attempt > 0
+            key = str(status) if status is not None else "connection_error"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.latencies, self.retries, self.statuses = [], 0, {}
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "retries": self.retries,
+            "statuses": dict(sorted(self.statuses.items())),
+            "p50_ms": _ms(_percentile(latencies, 50)),
+            "p99_ms": _ms(_percentile(latencies, 99)),
+        }
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def bench_tenant_id(n):
+    # Fact tables key tenants by UUID.
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"marketing-lens-bench-tenant-{n}"))
+
+
+def measure(recorder, fn):
+    """Runs fn() with tracemalloc on; returns (result, timing/memory/request stats)."""
+    recorder.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    try:
+        result = fn()
+    except Exception as e:
+        result, error = None, f"{e.__class__.__name__}: {e}"
+    duration = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = {"duration_s": round(duration, 3), "peak_memory_mb": round(peak / 2 ** 20, 2), **recorder.summary()}
+    if error:
+        stats["error"] = error
+    return result, stats
+
+
+def bench_connector(recorder, platform_id, start_date, end_date, tenant_id=None):
+    summary, stats = measure(recorder, lambda: ingestion.ingest_platform(
+        platform_id, "bench-token", ingestion.DEFAULT_ACCOUNTS[platform_id], start_date, end_date, tenant_id
+    ))
+    rows = summary["rows"] if summary else 0
+    return {"rows": rows, "rows_per_s": round(rows / stats["duration_s"], 1) if stats["duration_s"] else None, **stats}
+
+
+def bench_multi_tenant(recorder, tenants, platforms, start_date, end_date, max_workers):
+    jobs = [IngestionJob(bench_tenant_id(t), p, None, start_date, end_date) for t in range(tenants) for p in platforms]
+    orchestrator = IngestionOrchestrator(lambda tenant_id, platform_id: "bench-token", max_workers=max_workers)
+    results, stats = measure(recorder, lambda: summarize(orchestrator.run(jobs)))
+    rows = results["rows"] if results else 0
+    report = {"tenants": tenants, "jobs": len(jobs), "rows": rows,
+              "rows_per_s": round(rows / stats["duration_s"], 1) if stats["duration_s"] else None, **stats}
+    if results:
+        report["failed_jobs"] = results["failed"]
+    return report
+
+
+def bench_queue(recorder, tenants, platforms, start_date, end_date, max_workers, chunk_days):
+    """The multi-tenant run as queued work items, drained by `max_workers` local workers."""
+    jobs = [IngestionJob(bench_tenant_id(t), p, None, start_date, end_date) for t in range(tenants) for p in platforms]
+    queue = InMemoryWorkQueue()
+    worker = IngestionWorker(lambda tenant_id, platform_id: "bench-token", queue, InMemoryCheckpointStore())
+
+    def run():
+        runs = enqueue_ingestion(jobs, queue, worker.store, chunk_days)
+        return runs, worker.drain(max_workers=max_workers, retry_delay=0.1)
+
+    result, stats = measure(recorder, run)
+    runs, results = result or ([], [])
+    rows = sum(r["rows"] for r in results)
+    return {"tenants": tenants, "jobs": len(jobs), "work_items": sum(run["items"] for run in runs), "rows": rows,
+            "rows_per_s": round(rows / stats["duration_s"], 1) if stats["duration_s"] else None,
+            "dead_lettered": sum(1 for r in results if r["status"] == "dead"), **stats}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _bucket_store(url):
+    """The limiter's bucket store for --rate-limit-redis; None keeps the in-memory default."""
+    if not url:
+        return None
+    if url == "fake":
+        import fakeredis
+        return RedisBucketStore(fakeredis.FakeRedis())
+    import redis
+    return RedisBucketStore(redis.Redis.from_url(url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--campaigns", type=int, default=MockConfig.campaigns)
+    parser.add_argument("--gsc-rows-per-day", type=int, default=MockConfig.gsc_rows_per_day)
+    parser.add_argument("--latency-ms", type=float, default=MockConfig.latency_ms)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="HOST=RPS",
+                        help="e.g. graph.facebook.com=20; repeatable")
+    parser.add_argument("--tenants", type=int, default=5, help="tenants in the multi-tenant run (0 skips it)")
+    parser.add_argument("--workers", type=int, default=16, help="orchestrator workers in the multi-tenant run")
+    parser.add_argument("--platform", action="append", choices=PLATFORMS, help="only these connectors")
+    parser.add_argument("--no-rate-limiter", action="store_true",
+                        help="send requests without the client-side rate limiter, for comparison")
+    parser.add_argument("--rate-limit-redis", metavar="URL",
+                        help="keep rate-limit buckets in Redis at URL, or `fake` for an in-process fakeredis")
+    parser.add_argument("--queue", action="store_true",
+                        help="also run the multi-tenant jobs as queued work items through local workers")
+    parser.add_argument("--chunk-days", type=int, default=7, help="days per work item with --queue")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    limits = {host: float(rps) for host, rps in (item.split("=", 1) for item in args.rate_limit)}
+    config = MockConfig(campaigns=args.campaigns, gsc_rows_per_day=args.gsc_rows_per_day, latency_ms=args.latency_ms,
+                        error_rate=args.error_rate, rate_limits=limits, retry_after=0.2)
+    server, base_url, mock = start_server(config)
+
+    recorder = RequestRecorder()
+    transport = HttpTransport(base_url=base_url, backoff_base=0.1, backoff_max=2.0,
+                              rate_limiter=None if args.no_rate_limiter else RateLimiter(_bucket_store(args.rate_limit_redis)))
+    transport.add_hook(recorder)
+    previous = set_transport(transport)
+    # The mock finishes reports after `report_polls` polls; don't wait production-sized intervals for them.
+    ingestion.MSADS_POLL_INITIAL_SECONDS = 0.05
+    ingestion.META_POLL_INITIAL_SECONDS = 0.05
+
+    end = datetime.date.today() - datetime.timedelta(days=1)
+    start_date, end_date = (end - datetime.timedelta(days=args.days - 1)).isoformat(), end.isoformat()
+    platforms = args.platform or PLATFORMS
+    try:
+        report = {
+            "meta": {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": _git_commit(),
+                "python": platform_info.python_version(),
+                "database": ingestion.database_configured(),
+                "date_range": [start_date, end_date],
+                "config": {k: v for k, v in vars(args).items() if k not in ("output", "rate_limit")} | {"rate_limits": limits},
+            },
+            "connectors": {p: bench_connector(recorder, p, start_date, end_date,
+                                              bench_tenant_id(0) if ingestion.database_configured() else None)
+                           for p in platforms},
+        }
+        if args.tenants:
+            report["multi_tenant"] = bench_multi_tenant(recorder, args.tenants, platforms, start_date, end_date,
+                                                        args.workers)
+        if args.tenants and args.queue:
+            report["queued"] = bench_queue(recorder, args.tenants, platforms, start_date, end_date, args.workers,
+                                           args.chunk_days)
+        report["mock"] = dict(mock.stats)
+    finally:
+        set_transport(previous)
+        transport.close()
+        server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+Local stand-in for the platform APIs the connectors call: Meta, TikTok, Reddit,
+LinkedIn, Search Console, GA4 and the Microsoft Ads reporting service.
+
+Responses have the real payload shapes and pagination, with deterministic
+synthetic numbers. Latency, error rate and per-platform rate limits (429, or
+Meta's throttling error) are configurable. Point the backend at it with
+
+    python benchmarks/mock_platforms.py --port 8765
+    PLATFORM_API_BASE_URL=http://127.0.0.1:8765 func start
+
+Requests arrive as /{original host}{original path}; HttpTransport rewrites
+them that way when PLATFORM_API_BASE_URL (or `base_url`) is set.
+"""
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class MockConfig:
+    campaigns: int = 20  # campaigns per ad account
+    gsc_rows_per_day: int = 3000  # query/page/device rows per site and day
+    gsc_sites: int = 2
+    ga4_events: int = 8
+    latency_ms: float = 20.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0  # share of requests answered with a 500/503
+    rate_limits: dict = field(default_factory=dict)  # host -> requests per second (unlimited if absent)
+    retry_after: float = 1.0  # seconds advertised on 429s
+    report_polls: int = 1  # MS Ads / Meta async polls answered "Pending" before a report is ready
+    seed: int = 7
+
+
+class _Bucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockPlatforms:
+    """Routing, data generation and fault injection, independent of the HTTP server."""
+
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.buckets = {host: _Bucket(rps) for host, rps in self.config.rate_limits.items()}
+        self.reports = {}
+        self.report_ids = itertools.count(1)
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "batched_calls": 0}
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self.routes = [
+            ("POST", "graph.facebook.com", r"/v[\d.]+/?", self.meta_batch),
+            ("GET", "graph.facebook.com", r"/v[\d.]+/([^/]+)/insights", self.meta_insights),
+            ("POST", "graph.facebook.com", r"/v[\d.]+/([^/]+)/insights", self.meta_insights_job),
+            ("GET", "graph.facebook.com", r"/v[\d.]+/(\d+)", self.meta_report_status),
+            ("GET", "business-api.tiktok.com", r"/open_api/v1\.3/report/integrated/get/?", self.tiktok_report),
+            ("GET", "ads-api.reddit.com", r"/api/v2\.0/scope/([^/]+)/reporting/?", self.reddit_reporting),
+            ("GET", "api.linkedin.com", r"/v2/adAnalyticsV2", self.linkedin_analytics),
+            ("GET", "api.linkedin.com", r"/v2/adCampaignsV2", self.linkedin_campaigns),
+            ("GET", "api.linkedin.com", r"/v2/organizationalEntityShareStatistics", self.linkedin_share_stats),
+            ("GET", "www.googleapis.com", r"/webmasters/v3/sites", self.gsc_sites),
+            ("POST", "www.googleapis.com", r"/webmasters/v3/sites/([^/]+)/searchAnalytics/query", self.gsc_query),
+            ("POST", "analyticsdata.googleapis.com", r"/v1beta/properties/([^/:]+):runReport", self.ga4_report),
+            ("POST", "reporting.api.bingads.microsoft.com", r"/Reporting/v13/GenerateReport/Submit", self.msads_submit),
+            ("POST", "reporting.api.bingads.microsoft.com", r"/Reporting/v13/GenerateReport/Poll", self.msads_poll),
+            ("GET", "download.api.bingads.microsoft.com", r"/ReportDownload/(\d+)\.zip", self.msads_download),
+        ]
+
+    # --- Dispatch and fault injection ---
+
+    def handle(self, method, raw_path, body):
+        """Returns (status, headers, body bytes) for a request to /{host}{path}?{query}."""
+        parsed = urllib.parse.urlsplit(raw_path)
+        host, _, path = parsed.path.lstrip("/").partition("/")
+        path = "/" + path
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        payload = json.loads(body) if body else {}
+
+        with self._lock:
+            self.stats["requests"] += 1
+            fail = self._random.random() < self.config.error_rate
+        delay = self.config.latency_ms + random.uniform(0, self.config.jitter_ms)
+        time.sleep(delay / 1000.0)
+
+        bucket = self.buckets.get(host)
+        if bucket and not bucket.take():
+            with self._lock:
+                self.stats["throttled"] += 1
+            return self._throttled(host)
+        if fail:
+            with self._lock:
+                self.stats["errors"] += 1
+            return random.choice((500, 503)), {}, b'{"error": "injected failure"}'
+
+        return self._dispatch(method, host, path, params, payload, bucket)
+
+    def _dispatch(self, method, host, path, params, payload, bucket=None):
+        for route_method, route_host, pattern, handler in self.routes:
+            if method != route_method or host != route_host:
+                continue
+            match = re.fullmatch(pattern, path)
+            if match:
+                result = handler(*(urllib.parse.unquote(g) for g in match.groups()), params=params, payload=payload)
+                if isinstance(result, tuple):
+                    return result
+                headers = {"Content-Type": "application/json", **self._usage_headers(host, bucket)}
+                return 200, headers, json.dumps(result).encode()
+        return 404, {}, json.dumps({"error": f"no mock for {method} {host}{path}"}).encode()
+
+    def _usage_headers(self, host, bucket):
+        """Quota usage as the platform reports it: Meta's usage percentages, Reddit's x-ratelimit-*."""
+        if bucket is None:
+            return {}
+        if host == "graph.facebook.com":
+            used = round(100 * (1 - bucket.tokens / bucket.rate))
+            usage = {"act_0": [{"type": "ads_insights", "call_count": used, "total_cputime": 1, "total_time": 1,
+                                "estimated_time_to_regain_access": 0}]}
+            return {"x-business-use-case-usage": json.dumps(usage)}
+        if host == "ads-api.reddit.com":
+            return {"x-ratelimit-remaining": str(int(bucket.tokens)), "x-ratelimit-used": str(int(bucket.rate - bucket.tokens)),
+                    "x-ratelimit-reset": "1"}
+        return {}
+
+    def _throttled(self, host):
+        if host == "graph.facebook.com":
+            usage = {"act_0": [{"type": "ads_insights", "call_count": 100, "estimated_time_to_regain_access": 0}]}
+            body = {"error": {"message": "User request limit reached", "type": "OAuthException", "code": 17}}
+            return 400, {"x-business-use-case-usage": json.dumps(usage)}, json.dumps(body).encode()
+        return 429, {"Retry-After": str(self.config.retry_after)}, b'{"error": "rate limited"}'
+
+    # --- Synthetic data ---
+
+    def _days(self, start, end):
+        start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+        return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+    def _metrics(self, *key):
+        rng = random.Random("|".join(map(str, key)))
+        impressions = rng.randint(500, 50000)
+        clicks = int(impressions * rng.uniform(0.005, 0.05))
+        spend = round(clicks * rng.uniform(0.2, 3.0), 2)
+        conversions = int(clicks * rng.uniform(0.0, 0.1))
+        return impressions, clicks, spend, conversions, round(conversions * rng.uniform(10, 120), 2)
+
+    def _campaign_id(self, platform, account, c):
+        return f"{abs(hash((platform, account))) % 10**6}{c:03d}"
+
+    def _campaign_days(self, platform, account, start, end):
+        for day in self._days(start, end):
+            for c in range(self.config.campaigns):
+                yield day, self._campaign_id(platform, account, c), c
+
+    # --- Meta ---
+
+    def meta_batch(self, params, payload):
+        """Graph batch request: each call is routed as if sent alone and counts against the rate limit."""
+        bucket = self.buckets.get("graph.facebook.com")
+        results = []
+        for i, call in enumerate(payload.get("batch", [])):
+            with self._lock:
+                self.stats["batched_calls"] += 1
+            # The batch request itself already took the first call's token.
+            if i and bucket and not bucket.take():
+                with self._lock:
+                    self.stats["throttled"] += 1
+                status, headers, content = self._throttled("graph.facebook.com")
+            else:
+                relative = urllib.parse.urlsplit(call["relative_url"])
+                call_params = dict(urllib.parse.parse_qsl(relative.query))
+                call_params.update(urllib.parse.parse_qsl(call.get("body", "")))
+                status, headers, content = self._dispatch(call.get("method", "GET"), "graph.facebook.com",
+                                                          "/v18.0/" + relative.path.lstrip("/"), call_params, {}, bucket)
+            results.append({"code": status, "headers": [{"name": k, "value": v} for k, v in headers.items()],
+                            "body": content.decode()})
+        return results
+
+    def meta_insights_job(self, account, params, payload):
+        report_id = str(10**9 + next(self.report_ids))
+        with self._lock:
+            self.reports[report_id] = {"account": account, "params": params, "polls": 0}
+        return {"report_run_id": report_id}
+
+    def meta_report_status(self, report_id, params, payload):
+        with self._lock:
+            report = self.reports[report_id]
+            report["polls"] += 1
+            ready = report["polls"] > self.config.report_polls
+        return {"id": report_id, "async_status": "Job Completed" if ready else "Job Running",
+                "async_percent_completion": 100 if ready else 50}
+
+    def meta_insights(self, account, params, payload):
+        if account in self.reports:
+            # Results of an async job: the job's query, paged by this request.
+            report = self.reports[account]
+            account, params = report["account"], {**report["params"], **params}
+        time_range = json.loads(params.get("time_range", "{}"))
+        since = time_range.get("since") or (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        until = time_range.get("until") or since
+        rows = list(self._campaign_days("Meta", account, since, until))
+        offset, limit = int(params.get("after") or 0), int(params.get("limit", 25))
+        data = []
+        for day, campaign_id, c in rows[offset:offset + limit]:
+            impressions, clicks, spend, conversions, value = self._metrics("Meta", account, day, c)
+            data.append({
+                "date_start": day.isoformat(), "date_stop": day.isoformat(),
+                "campaign_id": campaign_id, "campaign_name": f"Meta Campaign {c}",
+                "impressions": str(impressions), "clicks": str(clicks), "spend": f"{spend:.2f}",
+                "conversions": [{"action_type": "omni_purchase", "value": str(conversions)}],
+                "action_values": [{"action_type": "omni_purchase", "value": f"{value:.2f}"}],
+            })
+        end = offset + len(data)
+        paging = {"cursors": {"before": str(offset), "after": str(end)}}
+        if end < len(rows):
+            paging["next"] = f"https://graph.facebook.com/v18.0/{account}/insights?after={end}"
+        return {"data": data, "paging": paging}
+
+    # --- TikTok ---
+
+    def tiktok_report(self, params, payload):
+        advertiser = params.get("advertiser_id")
+        rows = list(self._campaign_days("TikTok", advertiser, params["start_date"], params["end_date"]))
+        page, page_size = int(params.get("page", 1)), int(params.get("page_size", 1000))
+        items = []
+        for day, campaign_id, c in rows[(page - 1) * page_size:page * page_size]:
+            impressions, clicks, spend, conversions, value = self._metrics("TikTok", advertiser, day, c)
+            items.append({
+                "dimensions": {"campaign_id": campaign_id, "stat_time_day": f"{day} 00:00:00"},
+                "metrics": {"campaign_name": f"TikTok Campaign {c}", "spend": f"{spend:.2f}",
+                            "impressions": str(impressions), "clicks": str(clicks),
+                            "conversion": str(conversions), "total_purchase_value": f"{value:.2f}"},
+            })
+        page_info = {"page": page, "page_size": page_size, "total_number": len(rows),
+                     "total_page": max(1, math.ceil(len(rows) / page_size))}
+        return {"code": 0, "message": "OK", "data": {"list": items, "page_info": page_info}}
+
+    # --- Reddit ---
+
+    def reddit_reporting(self, account, params, payload):
+        rows = list(self._campaign_days("Reddit", account, params["starts_at"], params["ends_at"]))
+        page, page_size = int(params.get("page", 1)), int(params.get("page_size", 1000))
+        data = []
+        for day, campaign_id, c in rows[(page - 1) * page_size:page * page_size]:
+            impressions, clicks, spend, conversions, value = self._metrics("Reddit", account, day, c)
+            data.append({"date": day.isoformat(), "campaign_id": campaign_id, "campaign_name": f"Reddit Campaign {c}",
+                         "impressions": impressions, "clicks": clicks, "spend": int(spend * 1e6),
+                         "conversion": conversions, "conversion_value": int(value * 1e6)})
+        next_url = None
+        if page * page_size < len(rows):
+            query = urllib.parse.urlencode({**params, "page": page + 1})
+            next_url = f"https://ads-api.reddit.com/api/v2.0/scope/{account}/reporting/?{query}"
+        return {"data": data, "pagination": {"next_url": next_url}}
+
+    # --- LinkedIn ---
+
+    def linkedin_analytics(self, params, payload):
+        def day(prefix):
+            return datetime.date(int(params[f"{prefix}.year"]), int(params[f"{prefix}.month"]), int(params[f"{prefix}.day"]))
+
+        def restli_list(name):
+            # Rest.li 2.0 list, List(a,b), or a single value.
+            value = params.get(name, "")
+            return value[5:-1].split(",") if value.startswith("List(") else [value]
+
+        start, end = day("dateRange.start"), day("dateRange.end")
+        campaigns = set(restli_list("campaigns")) - {""}
+        elements = []
+        for account in restli_list("accounts"):
+            for d, campaign_id, c in self._campaign_days("LinkedIn", account, start.isoformat(), end.isoformat()):
+                pivot = f"urn:li:sponsoredCampaign:{campaign_id}"
+                if campaigns and pivot not in campaigns:
+                    continue
+                impressions, clicks, spend, conversions, value = self._metrics("LinkedIn", account, d, c)
+                date = {"year": d.year, "month": d.month, "day": d.day}
+                elements.append({
+                    "dateRange": {"start": date, "end": date},
+                    "pivotValues": [pivot],
+                    "impressions": impressions, "clicks": clicks, "costInLocalCurrency": f"{spend:.2f}",
+                    "externalWebsiteConversions": conversions, "conversionValueInLocalCurrency": f"{value:.2f}",
+                })
+        return {"elements": elements, "paging": {"start": 0, "count": len(elements), "links": []}}
+
+    def linkedin_campaigns(self, params, payload):
+        # Keyed by the account URN, as linkedin_analytics is.
+        account = params.get("search.account.values[0]", "")
+        start, count = int(params.get("start", 0)), int(params.get("count", 1000))
+        campaigns = [{"id": int(self._campaign_id("LinkedIn", account, c)), "name": f"LinkedIn Campaign {c}"}
+                     for c in range(self.config.campaigns)]
+        page = campaigns[start:start + count]
+        return {"elements": page, "paging": {"start": start, "count": len(page), "links": []}}
+
+    def linkedin_share_stats(self, params, payload):
+        return {"elements": [{
+            "organizationalEntity": params.get("organizationalEntity"),
+            "totalShareStatistics": {"impressionCount": 12000, "clickCount": 340, "likeCount": 120,
+                                     "shareCount": 14, "engagement": 0.041},
+        }]}
+
+    # --- Search Console ---
+
+    def gsc_sites(self, params, payload):
+        sites = [{"siteUrl": f"https://site{i}.example.com/", "permissionLevel": "siteOwner"}
+                 for i in range(self.config.gsc_sites)]
+        return {"siteEntry": sites}
+
+    def gsc_query(self, site, params, payload):
+        devices = ("DESKTOP", "MOBILE", "TABLET")
+        for group in payload.get("dimensionFilterGroups", []):
+            for f in group.get("filters", []):
+                if f.get("dimension") == "device":
+                    devices = (f["expression"].upper(),)
+        dimensions = payload.get("dimensions", [])
+        per_device = self.config.gsc_rows_per_day // 3
+        days = self._days(payload["startDate"], payload["endDate"])
+        total = len(days) * len(devices) * per_device
+        start, limit = payload.get("startRow", 0), payload.get("rowLimit", 1000)
+
+        rows = []
+        for n in range(start, min(total, start + limit)):
+            day = days[n // (len(devices) * per_device)]
+            device = devices[(n // per_device) % len(devices)]
+            i = n % per_device
+            values = {"date": day.isoformat(), "query": f"query {i % 997}", "page": f"{site}page/{i // 997}",
+                      "device": device, "country": "usa"}
+            rng = random.Random(f"{site}|{day}|{device}|{i}")
+            impressions = rng.randint(1, 2000)
+            clicks = rng.randint(0, impressions // 10)
+            rows.append({"keys": [values.get(d, "") for d in dimensions], "clicks": clicks,
+                         "impressions": impressions, "ctr": clicks / impressions,
+                         "position": round(rng.uniform(1, 40), 1)})
+        return {"rows": rows, "responseAggregationType": "byPage"} if rows else {"responseAggregationType": "byPage"}
+
+    # --- GA4 ---
+
+    def ga4_report(self, property_id, params, payload):
+        date_range = payload["dateRanges"][0]
+        dimensions = [d["name"] for d in payload.get("dimensions", [])]
+        metrics = [m["name"] for m in payload.get("metrics", [])]
+        days = self._days(date_range["startDate"], date_range["endDate"])
+        total = len(days) * self.config.ga4_events
+        offset, limit = payload.get("offset", 0), payload.get("limit", 10000)
+
+        rows = []
+        for n in range(offset, min(total, offset + limit)):
+            day, event = days[n // self.config.ga4_events], f"event_{n % self.config.ga4_events}"
+            values = {"date": day.strftime("%Y%m%d"), "eventName": event}
+            rng = random.Random(f"{property_id}|{day}|{event}")
+            rows.append({
+                "dimensionValues": [{"value": values.get(d, "(not set)")} for d in dimensions],
+                "metricValues": [{"value": str(rng.randint(0, 5000))} for _ in metrics],
+            })
+        return {
+            "dimensionHeaders": [{"name": d} for d in dimensions],
+            "metricHeaders": [{"name": m, "type": "TYPE_INTEGER"} for m in metrics],
+            "rows": rows, "rowCount": total, "kind": "analyticsData#runReport",
+        }
+
+    # --- Microsoft Ads reporting ---
+
+    def msads_submit(self, params, payload):
+        request = payload["ReportRequest"]
+        time_spec = request["Time"]
+
+        def day(spec):
+            return datetime.date(spec["Year"], spec["Month"], spec["Day"]).isoformat()
+
+        start = day(time_spec["CustomDateRangeStart"]) if "CustomDateRangeStart" in time_spec else \
+            (datetime.date.today() - datetime.timedelta(days=7)).isoformat()
+        end = day(time_spec["CustomDateRangeEnd"]) if "CustomDateRangeEnd" in time_spec else \
+            (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        report_id = str(next(self.report_ids))
+        with self._lock:
+            self.reports[report_id] = {"account": request["Scope"]["AccountIds"][0], "start": start, "end": end,
+                                       "columns": request["Columns"], "polls": 0}
+        return {"ReportRequestId": report_id}
+
+    def msads_poll(self, params, payload):
+        report_id = payload["ReportRequestId"]
+        with self._lock:
+            report = self.reports[report_id]
+            report["polls"] += 1
+            ready = report["polls"] > self.config.report_polls
+        if not ready:
+            return {"ReportRequestStatus": {"Status": "Pending", "ReportDownloadUrl": None}}
+        url = f"https://download.api.bingads.microsoft.com/ReportDownload/{report_id}.zip"
+        return {"ReportRequestStatus": {"Status": "Success", "ReportDownloadUrl": url}}
+
+    def msads_download(self, report_id, params, payload):
+        report = self.reports[report_id]
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=report["columns"], extrasaction="ignore")
+        writer.writeheader()
+        account = report["account"]
+        for day, campaign_id, c in self._campaign_days("MicrosoftAds", account, report["start"], report["end"]):
+            impressions, clicks, spend, conversions, value = self._metrics("MicrosoftAds", account, day, c)
+            writer.writerow({"TimePeriod": day.isoformat(), "AccountId": account, "CampaignId": campaign_id,
+                             "CampaignName": f"Bing Campaign {c}", "CurrencyCode": "USD",
+                             "Impressions": impressions, "Clicks": clicks, "Spend": spend,
+                             "Conversions": conversions, "Revenue": value})
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(f"{report_id}.csv", "﻿" + text.getvalue())
+        return 200, {"Content-Type": "application/zip"}, archive.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, content = self.mock.handle(self.command, self.path, body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the mock on a daemon thread. Returns (server, base_url, MockPlatforms)."""
+    mock = MockPlatforms(config)
+    handler = type("MockHandler", (_Handler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=MockConfig.latency_ms)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="HOST=RPS",
+                        help="e.g. graph.facebook.com=50; repeatable")
+    args = parser.parse_args()
+
+    limits = {host: float(rps) for host, rps in (item.split("=", 1) for item in args.rate_limit)}
+    config = MockConfig(latency_ms=args.latency_ms, error_rate=args.error_rate, rate_limits=limits)
+    server, url, _ = start_server(config, args.host, args.port)
+    print(f"Mock platform APIs listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
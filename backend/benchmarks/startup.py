@@ -0,0 +1,109 @@
+"""
+Cold-start benchmark: import time and first-request time, each measured in a
+fresh interpreter so nothing is already cached in sys.modules.
+
+    python benchmarks/startup.py [--runs 5] [--output startup.json]
+
+The TikTok scenario answers HTTP calls from a canned in-process adapter so
+the numbers cover our own code path and not the network.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("pandas", "numpy", "openai", "psycopg2", "requests", "azure.identity", "azure.keyvault.secrets",
+                 "connectors.meta", "connectors.tiktok", "connectors.google", "connectors.linkedin",
+                 "connectors.reddit", "connectors.microsoft")
+
+PRELUDE = """
+import json, sys, time
+started = time.perf_counter()
+def done(**extra):
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+    print(json.dumps({"ms": (time.perf_counter() - started) * 1000, "loaded": loaded, **extra}))
+"""
+
+SCENARIOS = {
+    "import_ingestion": """
+import ingestion, orchestrator, secret_cache
+done()
+""",
+    "import_function_app": """
+import function_app
+done()
+""",
+    "first_ingest_tiktok": """
+import io
+import ingestion
+import requests
+from requests.adapters import BaseAdapter
+from connectors.transport import get_transport
+
+class CannedAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        # A real body stream, so streamed responses are read and closed as on the wire.
+        response.raw = io.BytesIO(json.dumps({"code": 0, "data": {"list": [], "page_info": {"total_page": 1}}}).encode())
+        return response
+    def close(self):
+        pass
+
+get_transport().session.mount("https://", CannedAdapter())
+ingestion.ingest_platform("TikTok", "token", "adv_12345", "2024-01-01", "2024-01-07")
+done()
+""",
+    "first_insights_stats": """
+import pandas as pd
+from intelligence import IntelligenceEngine
+frame = pd.DataFrame({"campaign_name": ["A", "B", "C"], "spend": [1200, 5000, 300], "conversions": [40, 10, 15]})
+IntelligenceEngine(mode="stats").analyze_performance(frame)
+done()
+""",
+}
+
+
+def run_scenario(name, runs):
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + PRELUDE + SCENARIOS[name]
+    timings, loaded = [], []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+            return {"skipped": error}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result["ms"])
+        loaded = result["loaded"]
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "heavy_modules_loaded": loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {name: run_scenario(name, args.runs) for name in (args.scenario or SCENARIOS)}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
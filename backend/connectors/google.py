@@ -1,14 +1,17 @@
-import requests
 import logging
 import urllib.parse
 
+from connectors.json_stream import read_pages
+from connectors.transport import get_transport
+
 class GoogleConnector:
-    def __init__(self, access_token):
+    def __init__(self, access_token, transport=None):
         self.access_token = access_token
         self.headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
+        self.http = transport or get_transport()
 
     # --- Search Analytics ---
     def get_search_console_data(self, site_url, start_date, end_date):
@@ -25,10 +28,49 @@ class GoogleConnector:
             "rowLimit": 5000
         }
 
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.http.post(url, headers=self.headers, json=payload, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json()
 
+    def iter_search_console_data(self, site_url, start_date, end_date,
+                                 dimensions=("date", "query", "page", "device"),
+                                 row_limit=25000, cursor=None, device=None, search_type=None, stream=False):
+        """
+        Streams GSC Search Analytics rows, paging with `startRow` until a short page is returned.
+        `cursor` is the `startRow` to resume from. 25,000 is the API's maximum `rowLimit`.
+        `device` (DESKTOP/MOBILE/TABLET) filters to one device; `search_type` defaults to web.
+        With `stream`, each response is parsed as it arrives and split into smaller Pages.
+        Endpoint: https://www.googleapis.com/webmasters/v3/sites/{siteUrl}/searchAnalytics/query
+        """
+        encoded_site_url = urllib.parse.quote(site_url, safe="")
+        url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}/searchAnalytics/query"
+        payload = {
+            "startDate": start_date,
+            "endDate": end_date,
+            "dimensions": list(dimensions),
+            "rowLimit": row_limit
+        }
+        if device:
+            payload["dimensionFilterGroups"] = [
+                {"filters": [{"dimension": "device", "operator": "equals", "expression": device}]}
+            ]
+        if search_type:
+            payload["type"] = search_type
+
+        start_row = cursor or 0
+        while start_row is not None:
+            payload["startRow"] = start_row
+            response = self.http.post(url, headers=self.headers, json=payload, stream=stream,
+                                      rate_key=("GoogleSearchConsole", site_url))
+            response.raise_for_status()
+
+            # A full page means there may be more rows.
+            pages = read_pages(response, ("rows",), lambda body, rows: start_row + rows if rows == row_limit else None,
+                               start_row, stream)
+            for page in pages:
+                yield page
+            start_row = page.cursor
+
     # --- Sites ---
     def get_site_list(self):
         """
@@ -36,7 +78,7 @@ class GoogleConnector:
         Endpoint: GET /sites
         """
         url = "https://www.googleapis.com/webmasters/v3/sites"
-        response = requests.get(url, headers=self.headers)
+        response = self.http.get(url, headers=self.headers, rate_key=("GoogleSearchConsole", None))
         response.raise_for_status()
         return response.json()
 
@@ -47,7 +89,7 @@ class GoogleConnector:
         """
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}"
-        response = requests.get(url, headers=self.headers)
+        response = self.http.get(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json()
 
@@ -58,7 +100,7 @@ class GoogleConnector:
         """
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}"
-        response = requests.put(url, headers=self.headers)
+        response = self.http.put(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json() # Usually returns 204 No Content, but check docs
 
@@ -69,7 +111,7 @@ class GoogleConnector:
         """
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}"
-        response = requests.delete(url, headers=self.headers)
+        response = self.http.delete(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.text
 
@@ -81,7 +123,7 @@ class GoogleConnector:
         """
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}/sitemaps"
-        response = requests.get(url, headers=self.headers)
+        response = self.http.get(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json()
 
@@ -93,7 +135,7 @@ class GoogleConnector:
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         encoded_feed_path = urllib.parse.quote(feed_path, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}/sitemaps/{encoded_feed_path}"
-        response = requests.get(url, headers=self.headers)
+        response = self.http.get(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json()
 
@@ -105,7 +147,7 @@ class GoogleConnector:
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         encoded_feed_path = urllib.parse.quote(feed_path, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}/sitemaps/{encoded_feed_path}"
-        response = requests.put(url, headers=self.headers)
+        response = self.http.put(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.text
 
@@ -117,7 +159,7 @@ class GoogleConnector:
         encoded_site_url = urllib.parse.quote(site_url, safe="")
         encoded_feed_path = urllib.parse.quote(feed_path, safe="")
         url = f"https://www.googleapis.com/webmasters/v3/sites/{encoded_site_url}/sitemaps/{encoded_feed_path}"
-        response = requests.delete(url, headers=self.headers)
+        response = self.http.delete(url, headers=self.headers, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.text
 
@@ -133,7 +175,7 @@ class GoogleConnector:
             "siteUrl": site_url,
             "languageCode": "en-US"
         }
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.http.post(url, headers=self.headers, json=payload, rate_key=("GoogleSearchConsole", site_url))
         response.raise_for_status()
         return response.json()
 
@@ -154,6 +196,38 @@ class GoogleConnector:
             ]
         }
 
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.http.post(url, headers=self.headers, json=payload, rate_key=("GoogleAnalytics", property_id))
         response.raise_for_status()
         return response.json()
+
+    def iter_ga4_report(self, property_id, start_date, end_date,
+                        dimensions=("date", "eventName"),
+                        metrics=("sessions", "totalUsers", "conversions"),
+                        page_size=100000, cursor=None, stream=False):
+        """
+        Streams GA4 report rows, paging with `offset`/`limit` until `rowCount` is reached.
+        `cursor` is the row offset to resume from. With `stream`, each response is
+        parsed as it arrives and split into smaller Pages.
+        Endpoint: https://analyticsdata.googleapis.com/v1beta/properties/{propertyId}:runReport
+        """
+        url = f"https://analyticsdata.googleapis.com/v1beta/properties/{property_id}:runReport"
+        payload = {
+            "dateRanges": [{"startDate": start_date, "endDate": end_date}],
+            "dimensions": [{"name": d} for d in dimensions],
+            "metrics": [{"name": m} for m in metrics],
+            "limit": page_size
+        }
+
+        offset = cursor or 0
+        while offset is not None:
+            payload["offset"] = offset
+            response = self.http.post(url, headers=self.headers, json=payload, stream=stream,
+                                      rate_key=("GoogleAnalytics", property_id))
+            response.raise_for_status()
+
+            pages = read_pages(response, ("rows",),
+                               lambda body, rows: offset + rows if rows and offset + rows < body.get("rowCount", 0) else None,
+                               offset, stream)
+            for page in pages:
+                yield page
+            offset = page.cursor
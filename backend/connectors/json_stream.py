@@ -0,0 +1,153 @@
+import codecs
+import json
+import os
+import re
+
+from connectors.pagination import Page
+
+# Whether ingestion asks connectors for streamed pages (STREAM_RESPONSES=false reads whole bodies).
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "true").lower() == "true"
+# Rows per Page when a response is streamed, and bytes read from the socket at a time.
+STREAM_BATCH_ROWS = 1000
+READ_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DELIMITERS = frozenset(" \t\n\r,:]}")
+_DECODER = json.JSONDecoder()
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON object whose bulk is one array of rows, e.g.
+    `{"rows": [...]}` or `{"data": {"list": [...], "page_info": {...}}}`.
+
+    Iterating yields the elements of the array at `path` one at a time, as the
+    bytes arrive; only the element being decoded is held in memory. Everything
+    else in the document is collected into `skeleton` (complete once iteration
+    has finished), so pagination metadata before or after the array is kept.
+    """
+
+    def __init__(self, chunks, path):
+        self.path = tuple(path)
+        self.skeleton = {}
+        self.rows = 0
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        self._expect("{")
+        yield from self._object(self.skeleton, self.path)
+
+    def _object(self, target, path):
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if path and key == path[0] and self._peek() == ("[" if len(path) == 1 else "{"):
+                self._pos += 1
+                if len(path) == 1:
+                    yield from self._array()
+                else:
+                    yield from self._object(target.setdefault(key, {}), path[1:])
+            else:
+                target[key] = self._value()
+            if self._next_separator("}"):
+                return
+
+    def _array(self):
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            self.rows += 1
+            if self._next_separator("]"):
+                return
+
+    def _next_separator(self, closing):
+        """Consumes `,` (returns False) or `closing` (returns True)."""
+        char = self._peek()
+        self._pos += 1
+        if char == closing:
+            return True
+        if char != ",":
+            raise ValueError(f"Malformed JSON stream: expected ',' or {closing!r}, got {char!r}")
+        return False
+
+    def _value(self):
+        """Decodes one complete value, reading more input while it is cut off."""
+        self._peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+                # A number cut off by a chunk boundary ("12" of "12.5") decodes too early,
+                # so the value only counts once the character after it is a delimiter.
+                if self._eof or (end < len(self._buffer) and self._buffer[end] in _DELIMITERS):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON stream: expected {char!r}, got {found!r}")
+        self._pos += 1
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError("Truncated JSON stream")
+            self._fill()
+
+    def _fill(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            text, self._eof = self._decoder.decode(b"", final=True), True
+        else:
+            text = self._decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+
+
+def read_pages(response, path, next_cursor, cursor=None, stream=False, batch_size=STREAM_BATCH_ROWS):
+    """
+    Pages of rows from the array at `path` in a JSON response.
+
+    Without `stream` the body is parsed whole into a single Page. With `stream`
+    (the request must have been sent with stream=True) it is parsed as it arrives
+    and yielded as Pages of up to `batch_size` rows; all but the last are
+    `partial` and carry `cursor`, which re-fetches this response. The last Page
+    carries `next_cursor(body, rows)`, where `body` is the response without the
+    row array, and is yielded even when the array is empty.
+    """
+    if not stream:
+        body = response.json()
+        rows = body
+        for key in path:
+            rows = (rows or {}).get(key)
+        rows = rows or []
+        yield Page(rows, next_cursor(body, len(rows)))
+        return
+
+    try:
+        parser = JsonArrayStream(response.iter_content(chunk_size=READ_SIZE), path)
+        batch = []
+        for row in parser:
+            if len(batch) >= batch_size:
+                yield Page(batch, cursor, partial=True)
+                batch = []
+            batch.append(row)
+        yield Page(batch, next_cursor(parser.skeleton, parser.rows))
+    finally:
+        response.close()
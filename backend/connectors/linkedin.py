@@ -1,21 +1,35 @@
-import requests
+import datetime
 import logging
+import urllib.parse
+
+from connectors.json_stream import read_pages
+from connectors.transport import get_transport
+
+# Ad accounts per analytics request. A request returns at most 15,000 elements, so
+# accounts x campaigns x days in a window must stay under that.
+ACCOUNTS_PER_REQUEST = 10
 
 class LinkedInConnector:
-    def __init__(self, access_token):
+    def __init__(self, access_token, transport=None):
         self.base_url = "https://api.linkedin.com/v2"
         self.access_token = access_token
         self.headers = {
             "Authorization": f"Bearer {self.access_token}",
             "X-Restli-Protocol-Version": "2.0.0"
         }
+        self.http = transport or get_transport()
 
-    def get_ad_analytics(self, ad_account_id, start_date, end_date):
+    def get_ad_analytics(self, ad_account_ids, start_date, end_date, campaign_ids=None):
         """
-        Fetches ad analytics.
+        Fetches ad analytics for one account, or several (a list) in one request.
         Endpoint: /adAnalyticsV2
         """
-        url = f"{self.base_url}/adAnalyticsV2"
+        response = self._request_ad_analytics(ad_account_ids, start_date, end_date, campaign_ids=campaign_ids)
+        return response.json()
+
+    def _request_ad_analytics(self, ad_account_ids, start_date, end_date, stream=False, campaign_ids=None):
+        if isinstance(ad_account_ids, str):
+            ad_account_ids = [ad_account_ids]
         params = {
             "q": "analytics",
             "pivot": "CAMPAIGN",
@@ -25,13 +39,88 @@ class LinkedInConnector:
             "dateRange.end.day": end_date.day,
             "dateRange.end.month": end_date.month,
             "dateRange.end.year": end_date.year,
-            "timeGranularity": "DAILY",
-            "accounts": f"urn:li:sponsoredAccount:{ad_account_id}"
+            "timeGranularity": "DAILY"
         }
+        # Rest.li 2.0 lists are List(a,b) with each URN encoded inside, which `params`
+        # would encode a second time, so the query is built here.
+        query = urllib.parse.urlencode(params) + "&accounts=" + _restli_list("urn:li:sponsoredAccount:", ad_account_ids)
+        if campaign_ids:
+            query += "&campaigns=" + _restli_list("urn:li:sponsoredCampaign:", campaign_ids)
+        url = f"{self.base_url}/adAnalyticsV2?{query}"
 
-        response = requests.get(url, headers=self.headers, params=params)
+        # LinkedIn counts one call per request, however many accounts it covers.
+        account = ad_account_ids[0] if len(ad_account_ids) == 1 else None
+        response = self.http.get(url, headers=self.headers, stream=stream, rate_key=("LinkedIn", account))
         response.raise_for_status()
-        return response.json()
+        return response
+
+    def iter_ad_analytics(self, ad_account_ids, start_date, end_date, window_days=30, cursor=None, stream=False,
+                          campaign_ids=None, accounts_per_request=ACCOUNTS_PER_REQUEST):
+        """
+        Streams daily ad analytics for one account or a list of them, in date windows.
+        The analytics finder is not paginated and caps each response at 15,000 elements,
+        so long ranges are split into `window_days` windows instead, and accounts are
+        requested `accounts_per_request` at a time, each group in one call per window.
+        `campaign_ids` narrows the report to those campaigns. `cursor` is the ISO start
+        date of the next window, prefixed with "<group>:" when there are several groups.
+        With `stream`, each response is parsed as it arrives and split into smaller Pages.
+        Endpoint: /adAnalyticsV2
+        """
+        if isinstance(ad_account_ids, str):
+            ad_account_ids = [ad_account_ids]
+        groups = [ad_account_ids[i:i + accounts_per_request]
+                  for i in range(0, len(ad_account_ids), accounts_per_request)]
+
+        def position(group, day):
+            return day.isoformat() if len(groups) == 1 else f"{group}:{day.isoformat()}"
+
+        group, window_start = 0, start_date
+        if cursor:
+            group, _, day = cursor.rpartition(":")
+            group, window_start = int(group or 0), datetime.date.fromisoformat(day)
+
+        for group in range(group, len(groups)):
+            while window_start <= end_date:
+                window_end = min(end_date, window_start + datetime.timedelta(days=window_days - 1))
+                response = self._request_ad_analytics(groups[group], window_start, window_end, stream, campaign_ids)
+
+                next_start = window_end + datetime.timedelta(days=1)
+                if next_start <= end_date:
+                    next_cursor = position(group, next_start)
+                else:
+                    next_cursor = position(group + 1, start_date) if group + 1 < len(groups) else None
+                yield from read_pages(response, ("elements",), lambda body, rows: next_cursor,
+                                      position(group, window_start), stream)
+                window_start = next_start
+            window_start = start_date
+
+    def get_campaign_names(self, ad_account_ids, page_size=1000):
+        """
+        Maps campaign id -> name for every campaign in the given accounts. Analytics
+        rows only carry the campaign URN, so names have to be looked up here.
+        Endpoint: /adCampaignsV2
+        """
+        if isinstance(ad_account_ids, str):
+            ad_account_ids = [ad_account_ids]
+        names = {}
+        for account_id in ad_account_ids:
+            start = 0
+            while True:
+                params = {
+                    "q": "search",
+                    "search.account.values[0]": f"urn:li:sponsoredAccount:{account_id}",
+                    "start": start,
+                    "count": page_size
+                }
+                response = self.http.get(f"{self.base_url}/adCampaignsV2", headers=self.headers, params=params,
+                                         rate_key=("LinkedIn", account_id))
+                response.raise_for_status()
+                elements = response.json().get("elements", [])
+                names.update({str(e["id"]): e.get("name") for e in elements})
+                if len(elements) < page_size:
+                    break
+                start += page_size
+        return names
 
     def get_company_page_stats(self, organization_urn):
         """
@@ -44,6 +133,10 @@ class LinkedInConnector:
             "organizationalEntity": organization_urn
         }
 
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.http.get(url, headers=self.headers, params=params, rate_key=("LinkedIn", organization_urn))
         response.raise_for_status()
         return response.json()
+
+
+def _restli_list(prefix, ids):
+    return "List(" + ",".join(urllib.parse.quote(f"{prefix}{i}", safe="") for i in ids) + ")"
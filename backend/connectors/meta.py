@@ -1,10 +1,26 @@
-import requests
+import json
 import logging
+import time
+import urllib.parse
+
+from connectors.json_stream import read_pages
+from connectors.pagination import Page
+from connectors.transport import get_transport
+
+# Calls per Graph API batch request, the API's maximum.
+BATCH_LIMIT = 50
+# Times a batched call that failed with a transient or throttling error is re-sent.
+BATCH_RETRIES = 3
+# Graph error codes worth retrying: unknown/service errors and the rate limits.
+_RETRYABLE_ERRORS = {1, 2, 4, 17, 32, 341, 613, 80000, 80003, 80004}
+
+INSIGHTS_FIELDS = 'campaign_name,campaign_id,impressions,clicks,spend,conversions,action_values'
 
 class MetaConnector:
-    def __init__(self, access_token):
+    def __init__(self, access_token, transport=None):
         self.base_url = "https://graph.facebook.com/v18.0"
         self.access_token = access_token
+        self.http = transport or get_transport()
 
     def get_ads_insights(self, ad_account_id, date_preset='yesterday'):
         """
@@ -16,14 +32,164 @@ class MetaConnector:
             'access_token': self.access_token,
             'level': 'campaign',
             'date_preset': date_preset,
-            'fields': 'campaign_name,campaign_id,impressions,clicks,spend,conversions,action_values',
+            'fields': INSIGHTS_FIELDS,
             'limit': 100
         }
 
-        response = requests.get(url, params=params)
+        response = self.http.get(url, params=params, rate_key=('Meta', ad_account_id))
         response.raise_for_status()
         return response.json()
 
+    def iter_ads_insights(self, ad_account_id, date_preset='yesterday', time_range=None,
+                          time_increment=1, page_size=500, cursor=None, stream=False):
+        """
+        Streams daily campaign insights, following `paging.cursors.after` until the last page.
+        `time_range` is a (since, until) pair of YYYY-MM-DD strings and overrides `date_preset`.
+        With `stream`, each response is parsed as it arrives and split into smaller Pages.
+        Endpoint: /{ad_account_id}/insights
+        """
+        params = _insights_params(date_preset, time_range, time_increment, page_size)
+        yield from self._iter_insights(f"{ad_account_id}/insights", ad_account_id, params, cursor, stream)
+
+    def _iter_insights(self, path, ad_account_id, params, cursor=None, stream=False):
+        url = f"{self.base_url}/{path}"
+        params = {**params, 'access_token': self.access_token}
+        while True:
+            if cursor:
+                params['after'] = cursor
+            response = self.http.get(url, params=params, stream=stream, rate_key=('Meta', ad_account_id))
+            response.raise_for_status()
+
+            for page in read_pages(response, ('data',), _next_after, cursor, stream):
+                yield page
+            cursor = page.cursor
+            if not cursor:
+                return
+
+    def iter_ads_insights_batch(self, ad_account_ids, date_preset='yesterday', time_range=None,
+                                time_increment=1, page_size=500):
+        """
+        Daily campaign insights for many accounts, fetched through batch requests: each round
+        sends one insights call per account still paging (up to BATCH_LIMIT per request), so
+        N small accounts cost about N / 50 round trips instead of N. Yields one Page per
+        account per round; there is no resume cursor. Accounts whose call fails are logged
+        and raised together once the others finish.
+        Endpoint: POST / (batch of /{ad_account_id}/insights)
+        """
+        params = _insights_params(date_preset, time_range, time_increment, page_size)
+        # account -> `after` cursor of its next page
+        pending = {account_id: None for account_id in ad_account_ids}
+        failed = {}
+        while pending:
+            accounts = list(pending)
+            calls = []
+            for account_id in accounts:
+                query = {**params, 'after': pending[account_id]} if pending[account_id] else params
+                calls.append({'method': 'GET',
+                              'relative_url': f"{account_id}/insights?{urllib.parse.urlencode(query)}"})
+
+            for account_id, (code, body) in zip(accounts, self.batch(calls, accounts)):
+                if code != 200:
+                    logging.error(f"Meta insights for {account_id} failed in batch: {code} {body}")
+                    failed[account_id] = code
+                    del pending[account_id]
+                    continue
+                after = _paging_after(body)
+                if after:
+                    pending[account_id] = after
+                else:
+                    del pending[account_id]
+                yield Page(body.get('data', []))
+
+        if failed:
+            raise RuntimeError(f"Meta insights failed for accounts: {failed}")
+
+    def start_insights_job(self, ad_account_id, time_range, time_increment=1):
+        """
+        Starts an async insights report for a (since, until) range and returns its report_run_id.
+        Endpoint: POST /{ad_account_id}/insights
+        """
+        url = f"{self.base_url}/{ad_account_id}/insights"
+        params = {**_insights_params(None, time_range, time_increment), 'access_token': self.access_token}
+        response = self.http.post(url, params=params, rate_key=('Meta', ad_account_id))
+        response.raise_for_status()
+        return response.json()['report_run_id']
+
+    def get_insights_job(self, report_run_id, ad_account_id=None):
+        """
+        Status of an async insights report (`async_status`, `async_percent_completion`).
+        Endpoint: /{report_run_id}
+        """
+        url = f"{self.base_url}/{report_run_id}"
+        response = self.http.get(url, params={'access_token': self.access_token},
+                                 rate_key=('Meta', ad_account_id))
+        response.raise_for_status()
+        return response.json()
+
+    def iter_ads_insights_async(self, ad_account_ids, time_range, time_increment=1, page_size=500,
+                                poll_initial=5.0, poll_max=60.0, timeout=3600, stream=False):
+        """
+        Daily campaign insights for long ranges, run as async report jobs.
+
+        A large synchronous insights call can time out or be rejected as too much data;
+        an async job is computed server side and then paged like a normal response.
+        Jobs for all accounts are started, and polled, through batch requests. Pending
+        jobs are re-polled with a per-job interval that grows by 1.5x up to `poll_max`,
+        and each finished job's rows are streamed out as it completes. Pages carry no
+        resume cursor: a job's results cannot be fetched again by a later run. Accounts
+        whose job fails are logged and raised together once the others finish.
+        Endpoint: POST /{ad_account_id}/insights, /{report_run_id}, /{report_run_id}/insights
+        """
+        if isinstance(ad_account_ids, str):
+            ad_account_ids = [ad_account_ids]
+        body = urllib.parse.urlencode(_insights_params(None, time_range, time_increment))
+        started = self.batch([{'method': 'POST', 'relative_url': f"{account_id}/insights", 'body': body}
+                              for account_id in ad_account_ids], ad_account_ids)
+
+        now = time.monotonic()
+        deadline = now + timeout
+        # account_id -> [report_run_id, next_poll_at, interval]
+        pending = {}
+        failed = {}
+        for account_id, (code, result) in zip(ad_account_ids, started):
+            if code == 200 and result.get('report_run_id'):
+                pending[account_id] = [result['report_run_id'], now + poll_initial, poll_initial]
+            else:
+                logging.error(f"Meta insights job for {account_id} could not start: {code} {result}")
+                failed[account_id] = code
+
+        while pending:
+            now = time.monotonic()
+            if now > deadline:
+                failed.update({a: "timed out" for a in pending})
+                break
+            due = [a for a, (_, next_poll, _) in pending.items() if next_poll <= now]
+            if not due:
+                time.sleep(max(0.0, min(p[1] for p in pending.values()) - now))
+                continue
+
+            statuses = self.batch([{'method': 'GET', 'relative_url': str(pending[a][0])} for a in due], due)
+            for account_id, (code, status) in zip(due, statuses):
+                state = (status or {}).get('async_status') if code == 200 else None
+                if state in ('Job Not Started', 'Job Started', 'Job Running'):
+                    entry = pending[account_id]
+                    entry[2] = min(poll_max, entry[2] * 1.5)
+                    entry[1] = time.monotonic() + entry[2]
+                    continue
+
+                report_run_id = pending.pop(account_id)[0]
+                if state != 'Job Completed':
+                    logging.error(f"Meta insights job {report_run_id} for {account_id} failed: {code} {status}")
+                    failed[account_id] = state or code
+                    continue
+                # Job results cannot be resumed by a later fetch, so their pages carry no cursor.
+                for page in self._iter_insights(f"{report_run_id}/insights", account_id, {'limit': page_size},
+                                                stream=stream):
+                    yield Page(page)
+
+        if failed:
+            raise RuntimeError(f"Meta insights jobs failed for accounts: {failed}")
+
     def get_page_insights(self, page_id, date_preset='yesterday'):
         """
         Fetches organic page insights.
@@ -37,6 +203,111 @@ class MetaConnector:
             'date_preset': date_preset
         }
 
-        response = requests.get(url, params=params)
+        response = self.http.get(url, params=params, rate_key=('Meta', page_id))
         response.raise_for_status()
         return response.json()
+
+    def get_page_insights_batch(self, page_ids, date_preset='yesterday'):
+        """
+        Organic page insights for many pages through batch requests, as {page_id: response}.
+        Pages whose call fails are left out and logged.
+        Endpoint: POST / (batch of /{page_id}/insights)
+        """
+        query = urllib.parse.urlencode({
+            'metric': 'page_impressions,page_post_engagements,page_fans',
+            'period': 'day',
+            'date_preset': date_preset
+        })
+        calls = [{'method': 'GET', 'relative_url': f"{page_id}/insights?{query}"} for page_id in page_ids]
+        insights = {}
+        for page_id, (code, body) in zip(page_ids, self.batch(calls, page_ids)):
+            if code == 200:
+                insights[page_id] = body
+            else:
+                logging.error(f"Meta page insights for {page_id} failed in batch: {code} {body}")
+        return insights
+
+    # --- Batch requests ---
+    def batch(self, calls, account_ids=None):
+        """
+        Sends Graph API calls as batch requests of up to BATCH_LIMIT calls each, one HTTP
+        round trip per request. `calls` are {'method', 'relative_url'[, 'body']} dicts with
+        `relative_url` relative to the API version. Meta still counts each call against its
+        account's rate limit, so `account_ids` (one per call) are passed to the limiter.
+
+        Returns a (status code, parsed body) pair per call, in order. Calls that fail with a
+        transient or throttling error, or that Meta timed out inside the batch (a null
+        result), are re-sent in a later batch up to BATCH_RETRIES times.
+        Endpoint: POST /
+        """
+        account_ids = account_ids or [None] * len(calls)
+        results = [None] * len(calls)
+        pending = list(range(len(calls)))
+        for attempt in range(BATCH_RETRIES + 1):
+            if attempt:
+                time.sleep(min(30, 2 ** attempt))
+            retry = []
+            for start in range(0, len(pending), BATCH_LIMIT):
+                chunk = pending[start:start + BATCH_LIMIT]
+                payload = {
+                    'access_token': self.access_token,
+                    'include_headers': False,
+                    'batch': [calls[i] for i in chunk]
+                }
+                response = self.http.post(f"{self.base_url}/", json=payload,
+                                          rate_key=[('Meta', account_ids[i]) for i in chunk])
+                response.raise_for_status()
+                for i, item in zip(chunk, response.json()):
+                    results[i] = _batch_result(item)
+                    if _batch_retryable(*results[i]):
+                        retry.append(i)
+            pending = retry
+            if not pending:
+                break
+        return results
+
+
+def _insights_params(date_preset, time_range, time_increment, page_size=None):
+    params = {
+        'level': 'campaign',
+        'fields': INSIGHTS_FIELDS,
+        'time_increment': time_increment
+    }
+    if page_size:
+        params['limit'] = page_size
+    if time_range:
+        params['time_range'] = json.dumps({'since': time_range[0], 'until': time_range[1]})
+    else:
+        params['date_preset'] = date_preset
+    return params
+
+
+def _batch_result(item):
+    """(code, parsed body) of one batch result; (None, None) when Meta timed the call out."""
+    if item is None:
+        return None, None
+    body = item.get('body')
+    try:
+        body = json.loads(body) if body else None
+    except ValueError:
+        pass
+    return item.get('code'), body
+
+
+def _batch_retryable(code, body):
+    if code is None or code >= 500:
+        return True
+    if code == 200:
+        return False
+    error = body.get('error', {}) if isinstance(body, dict) else {}
+    return error.get('code') in _RETRYABLE_ERRORS or error.get('is_transient', False)
+
+
+def _paging_after(body):
+    """The `after` cursor of the next page, or None on the last page."""
+    paging = body.get('paging', {})
+    return paging.get('cursors', {}).get('after') if paging.get('next') else None
+
+
+def _next_after(body, rows):
+    return _paging_after(body)
@@ -0,0 +1,16 @@
+class Page(list):
+    """
+    One page of report rows as returned by a connector's `iter_*` method.
+
+    `cursor` is the platform-specific position (offset, page number, `after`
+    cursor or next URL) to pass back as `cursor=` to resume iteration after
+    this page. It is None on the last page.
+
+    Streamed responses are split into several Pages; all but the last one of
+    each response are `partial`, and their `cursor` re-fetches that response.
+    """
+
+    def __init__(self, rows, cursor=None, partial=False):
+        super().__init__(rows)
+        self.cursor = cursor
+        self.partial = partial
@@ -1,14 +1,17 @@
-import requests
 import logging
 
+from connectors.json_stream import read_pages
+from connectors.transport import get_transport
+
 class RedditConnector:
-    def __init__(self, access_token):
+    def __init__(self, access_token, transport=None):
         self.base_url = "https://ads-api.reddit.com/api/v2.0"
         self.access_token = access_token
         self.headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
+        self.http = transport or get_transport()
 
     def get_campaign_reporting(self, account_id, start_date, end_date):
         """
@@ -23,6 +26,38 @@ class RedditConnector:
             "metrics": "impressions,clicks,spend,conversion"
         }
 
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.http.get(url, headers=self.headers, params=params, rate_key=("Reddit", account_id))
         response.raise_for_status()
         return response.json()
+
+    def iter_campaign_reporting(self, account_id, start_date, end_date, page_size=1000, cursor=None, stream=False):
+        """
+        Streams reporting rows, following `pagination.next_url` until it is empty.
+        `cursor` is a `next_url` from a previous page. With `stream`, each response is
+        parsed as it arrives and split into smaller Pages.
+        Endpoint: /scope/{account_id}/reporting/
+        """
+        url = cursor or f"{self.base_url}/scope/{account_id}/reporting/"
+        # The next_url already carries the query string.
+        params = None if cursor else {
+            "starts_at": start_date,
+            "ends_at": end_date,
+            "group_by": "campaign_id,date",
+            "metrics": "impressions,clicks,spend,conversion",
+            "page_size": page_size
+        }
+
+        while url:
+            response = self.http.get(url, headers=self.headers, params=params, stream=stream,
+                                     rate_key=("Reddit", account_id))
+            response.raise_for_status()
+
+            # Partial pages resume from this request's next_url cursor (None on the first request).
+            for page in read_pages(response, ("data",), _next_url, cursor, stream):
+                yield page
+            url = cursor = page.cursor
+            params = None
+
+
+def _next_url(body, rows):
+    return (body.get("pagination") or {}).get("next_url")
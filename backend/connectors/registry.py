@@ -0,0 +1,31 @@
+import importlib
+import threading
+
+# Connector class per platform, as (module, class name). A module is imported the
+# first time one of its platforms is used, so a cold start that serves a single
+# TikTok request never loads the other five connectors.
+CONNECTORS = {
+    'GoogleSearchConsole': ('connectors.google', 'GoogleConnector'),
+    'GoogleAnalytics': ('connectors.google', 'GoogleConnector'),
+    'LinkedIn': ('connectors.linkedin', 'LinkedInConnector'),
+    'Meta': ('connectors.meta', 'MetaConnector'),
+    'TikTok': ('connectors.tiktok', 'TikTokConnector'),
+    'Reddit': ('connectors.reddit', 'RedditConnector'),
+    'MicrosoftAds': ('connectors.microsoft', 'MicrosoftAdsConnector'),
+}
+
+_classes = {}
+_lock = threading.Lock()
+
+
+def get_connector_class(platform_id):
+    """Returns the connector class for `platform_id`, importing its module on first use. KeyError if unknown."""
+    cls = _classes.get(platform_id)
+    if cls is None:
+        module_name, class_name = CONNECTORS[platform_id]
+        with _lock:
+            cls = _classes.get(platform_id)
+            if cls is None:
+                cls = getattr(importlib.import_module(module_name), class_name)
+                _classes[platform_id] = cls
+    return cls
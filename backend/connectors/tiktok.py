@@ -1,14 +1,17 @@
-import requests
 import logging
 
+from connectors.json_stream import read_pages
+from connectors.transport import get_transport
+
 class TikTokConnector:
-    def __init__(self, access_token):
+    def __init__(self, access_token, transport=None):
         self.base_url = "https://business-api.tiktok.com/open_api/v1.3"
         self.access_token = access_token
         self.headers = {
             "Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
+        self.http = transport or get_transport()
 
     def get_campaign_report(self, advertiser_id, start_date, end_date):
         """
@@ -27,6 +30,43 @@ class TikTokConnector:
             "page_size": 1000
         }
 
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.http.get(url, headers=self.headers, params=params, rate_key=("TikTok", advertiser_id))
         response.raise_for_status()
         return response.json()
+
+    def iter_campaign_report(self, advertiser_id, start_date, end_date, page_size=1000, cursor=None, stream=False):
+        """
+        Streams the campaign report page by page until `page_info.total_page` is reached.
+        `cursor` is the 1-based page number to resume from. With `stream`, each response
+        is parsed as it arrives and split into smaller Pages.
+        Endpoint: /report/integrated/get/
+        """
+        url = f"{self.base_url}/report/integrated/get/"
+        params = {
+            "advertiser_id": advertiser_id,
+            "report_type": "BASIC",
+            "data_level": "AUCTION_CAMPAIGN",
+            "dimensions": '["campaign_id", "stat_time_day"]',
+            "metrics": '["campaign_name", "spend", "impressions", "clicks", "conversion", "total_purchase_value"]',
+            "start_date": start_date,
+            "end_date": end_date,
+            "page_size": page_size
+        }
+
+        page_number = cursor or 1
+        while page_number is not None:
+            params["page"] = page_number
+            response = self.http.get(url, headers=self.headers, params=params, stream=stream,
+                                     rate_key=("TikTok", advertiser_id))
+            response.raise_for_status()
+
+            pages = read_pages(response, ("data", "list"),
+                               lambda body, rows: page_number + 1 if page_number < _total_pages(body) else None,
+                               page_number, stream)
+            for page in pages:
+                yield page
+            page_number = page.cursor
+
+
+def _total_pages(body):
+    return (body.get("data") or {}).get("page_info", {}).get("total_page", 1)
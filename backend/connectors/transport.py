@@ -0,0 +1,226 @@
+import logging
+import os
+import random
+import threading
+import time
+import email.utils
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import telemetry
+from rate_limits import get_rate_limiter, meta_usage
+
+# Status codes worth retrying. Everything else is returned to the caller,
+# which decides what to do with it (usually `raise_for_status()`).
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Meta reports throttling as HTTP 400/403 with one of these Graph error codes.
+# Ref: https://developers.facebook.com/docs/graph-api/overview/rate-limiting
+META_THROTTLE_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+
+
+class HttpTransport:
+    """
+    Shared HTTP layer for all connectors.
+
+    Wraps a single `requests.Session` so TCP/TLS connections are kept alive and
+    pooled per host, negotiates gzip, and retries throttled or failed calls with
+    exponential backoff plus full jitter. Server hints (`Retry-After`, Meta's
+    usage headers) take precedence over the computed backoff. Every attempt's
+    latency, size and retry wait is recorded in `telemetry`.
+
+    With `base_url` set, every https:// URL is sent to `{base_url}/{host}{path}`
+    instead, which points all connectors at a local stand-in of the platform APIs.
+    Calls made with a `rate_key` of (platform, account) first wait for the
+    platform's token buckets in `rate_limiter`, and every response is fed back
+    to it so usage headers and throttling slow the buckets down for all callers.
+    Hooks added with `add_hook` are called after every attempt as
+    `hook(method, url, status, elapsed_seconds, attempt)` with the original URL;
+    `status` is None when the connection failed.
+    """
+
+    def __init__(self, max_retries=5, backoff_base=1.0, backoff_max=60.0,
+                 pool_connections=20, pool_maxsize=50, timeout=(10, 120), base_url=None,
+                 rate_limiter=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.hooks = []
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        # Retries are handled in `request` so we can honour platform headers.
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive"
+        })
+
+    def request(self, method, url, rate_key=None, **kwargs):
+        """
+        Sends a request, retrying on 429/5xx, Meta throttling errors and connection failures.
+        `rate_key` is (platform, account id or None) for the rate limiter, or a list of
+        them for a batched call that the platform counts once per account.
+        Returns the final `requests.Response`; the caller still calls `raise_for_status()`.
+        """
+        limiter = self.rate_limiter if rate_key else None
+        rate_keys = rate_key if isinstance(rate_key, list) else [rate_key]
+        kwargs.setdefault("timeout", self.timeout)
+        target = url
+        if self.base_url and url.startswith("https://"):
+            target = f"{self.base_url}/{url[len('https://'):]}"
+        attempt = 0
+        while True:
+            if limiter:
+                for key in rate_keys:
+                    limiter.acquire(*key)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, target, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                elapsed = time.perf_counter() - started
+                telemetry.record_http(url, None, elapsed)
+                self._run_hooks(method, url, None, elapsed, attempt)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                telemetry.record_retry(url, "connection_error", delay)
+                logging.warning(f"{method} {_path(url)} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            elapsed = time.perf_counter() - started
+            telemetry.record_http(url, response.status_code, elapsed, _response_bytes(response, kwargs.get("stream")))
+            self._run_hooks(method, url, response.status_code, elapsed, attempt)
+            retry = self._should_retry(response)
+            throttled = retry and response.status_code < 500
+            server_delay = self._server_delay(response) if retry else None
+            if limiter:
+                for key in rate_keys:
+                    limiter.observe(*key, response.headers, throttled, server_delay)
+            if not retry or attempt >= self.max_retries:
+                return response
+
+            delay = max(server_delay or 0.0, self._backoff(attempt))
+            telemetry.record_retry(url, "throttled" if throttled else "server_error", delay)
+            logging.warning(f"{method} {_path(url)} returned {response.status_code}, retrying in {delay:.1f}s "
+                            f"(attempt {attempt + 1}/{self.max_retries})")
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _run_hooks(self, method, url, status, elapsed, attempt):
+        for hook in self.hooks:
+            try:
+                hook(method, url, status, elapsed, attempt)
+            except Exception as e:
+                logging.warning(f"Transport hook failed: {str(e)}")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    # --- Retry policy ---
+
+    def _should_retry(self, response):
+        if response.status_code in RETRY_STATUSES:
+            return True
+        if response.status_code in (400, 403) and "facebook.com" in response.url:
+            return _meta_error_code(response) in META_THROTTLE_CODES
+        return False
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _server_delay(self, response):
+        """Seconds the server asked us to wait, if it told us."""
+        retry_after = response.headers.get("Retry-After")
+        delay = _parse_retry_after(retry_after) if retry_after else None
+        if delay is not None:
+            return min(self.backoff_max, delay)
+        regain = meta_usage(response.headers)[1]
+        if regain:
+            return min(self.backoff_max, regain)
+        return None
+
+
+def _path(url):
+    return url.split("?", 1)[0]
+
+
+def _response_bytes(response, stream):
+    """Content-Length when sent; otherwise the body size, unless streaming (which would consume it)."""
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length)
+    return 0 if stream else len(response.content)
+
+
+def _parse_retry_after(value):
+    """`Retry-After` is either delta-seconds or an HTTP date. Returns None when it is neither."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def _meta_error_code(response):
+    try:
+        return response.json().get("error", {}).get("code")
+    except ValueError:
+        return None
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Returns the process-wide transport, so connections are reused across connectors and invocations.
+    It schedules calls with the process-wide rate limiter. PLATFORM_API_BASE_URL redirects it to a
+    local mock of the platform APIs.
+    """
+    global _default_transport
+    if _default_transport is None:
+        with _default_lock:
+            if _default_transport is None:
+                _default_transport = HttpTransport(base_url=os.environ.get("PLATFORM_API_BASE_URL"),
+                                                   rate_limiter=get_rate_limiter())
+    return _default_transport
+
+
+def set_transport(transport):
+    """Replaces the process-wide transport (benchmarks, local runs). Returns the previous one."""
+    global _default_transport
+    with _default_lock:
+        previous, _default_transport = _default_transport, transport
+    return previous
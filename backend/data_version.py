@@ -0,0 +1,49 @@
+import threading
+
+# Per-tenant counters bumped whenever new data for the tenant is loaded.
+# Caches of derived results (insights, query responses) include the current
+# version in their keys, so a bump invalidates them without a purge.
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def get_data_version(tenant_id):
+    from loader import database_configured, pooled_connection
+
+    if not database_configured():
+        with _lock:
+            return _versions.get(tenant_id, 0)
+
+    with pooled_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT version FROM tenant_data_version WHERE tenant_id = %s", (tenant_id,))
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(tenant_id):
+    """Marks the tenant's data as changed. Returns the new version."""
+    from loader import connect, database_configured
+
+    if not database_configured():
+        with _lock:
+            _versions[tenant_id] = _versions.get(tenant_id, 0) + 1
+            return _versions[tenant_id]
+
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at) VALUES (%s, 1, now())
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = now()
+                RETURNING version
+                """,
+                (tenant_id,)
+            )
+            version = cursor.fetchone()[0]
+        conn.commit()
+        return version
+    finally:
+        conn.close()
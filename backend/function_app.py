@@ -1,47 +1,44 @@
 import logging
 import datetime
-import time
-import random
 import os
 import json
-import requests
-import pandas as pd
+import uuid
 import azure.functions as func
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from azure.core.exceptions import ResourceNotFoundError
 
-# Import Connectors
-from connectors.meta import MetaConnector
-from connectors.tiktok import TikTokConnector
-from connectors.google import GoogleConnector
-from connectors.linkedin import LinkedInConnector
-from connectors.reddit import RedditConnector
-from connectors.microsoft import MicrosoftAdsConnector
+# Import Secrets
+from secret_cache import get_secret_cache
 
-# Import Intelligence
-from intelligence import IntelligenceEngine
+# Import Ingestion
+from ingestion import sync_platform, UnknownPlatformError
+from orchestrator import IngestionJob, IngestionOrchestrator, summarize
+from work_queue import QUEUE_NAME, WORK_ITEM_DAYS, IngestionWorker, QueueMessage, enqueue_ingestion, get_checkpoint_store
+
+# Import Query
+from data_version import get_data_version
+from loader import database_configured, pooled_connection
+from metrics_query import MetricsQuery, QueryError, iter_rows, run_query
+
+# Import Telemetry
+import telemetry
+
+# Intelligence (pandas, NumPy, the OpenAI SDK) is imported inside the insight
+# functions, so ingestion-only cold starts do not pay for it.
 
 app = func.FunctionApp()
 
 # --- Helper Functions ---
 
 def get_secret(secret_name):
-    """Retrieves a secret from Azure Key Vault."""
-    key_vault_name = os.environ.get("KEY_VAULT_NAME")
-    if not key_vault_name:
-        return "mock-secret-value"
-
-    kv_uri = f"https://{key_vault_name}.vault.azure.net"
-    credential = DefaultAzureCredential()
-    client = SecretClient(vault_url=kv_uri, credential=credential)
+    """Retrieves a secret from Azure Key Vault, through the process-wide cache."""
+    return get_secret_cache().get(secret_name)
 
-    try:
-        retrieved_secret = client.get_secret(secret_name)
-        return retrieved_secret.value
-    except ResourceNotFoundError:
-        logging.error(f"Secret {secret_name} not found.")
-        return None
+def get_platform_token(tenant_id, platform_id):
+    """Resolves the API token for a tenant's platform connection."""
+    token = get_secret(f"{tenant_id}-{platform_id}-token")
+    if not token:
+        # For demo purposes, if no secret, we might use a dummy token to allow the code to run 'dry'
+        token = "dummy_token"
+    return token
 
 # --- Ingestion Functions ---
 
@@ -59,68 +56,119 @@ def ingest_platform_data(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
         )
 
-    # Retrieve Token (Mock logic for retrieval key)
-    token = get_secret(f"{tenant_id}-{platform_id}-token")
-    if not token:
-        # For demo purposes, if no secret, we might use a dummy token to allow the code to run 'dry'
-        token = "dummy_token"
+    token = get_platform_token(tenant_id, platform_id)
 
     try:
-        if platform_id == 'GoogleSearchConsole':
-            connector = GoogleConnector(token)
-
-            # 1. Discover Sites (New functionality)
-            sites = connector.get_site_list()
-            site_count = len(sites.get('siteEntry', []))
-
-            # 2. Process specific site (In real app, loop through all)
-            # We use the previous example logic but now with proper encoding handling in the connector
-            target_site = "https://example.com"
-            data = connector.get_search_console_data(target_site, "2023-10-01", "2023-10-02")
-
-            return func.HttpResponse(f"GSC Discovery: Found {site_count} sites. Ingested {len(data.get('rows', []))} rows for {target_site}.")
-
-        elif platform_id == 'GoogleAnalytics':
-            connector = GoogleConnector(token)
-            data = connector.get_ga4_report("properties/123456", "2023-10-01", "2023-10-02")
-            return func.HttpResponse(f"GA4 Data Ingested: {len(data.get('rows', []))} rows")
-
-        elif platform_id == 'LinkedIn':
-            connector = LinkedInConnector(token)
-            # Fetch Ads
-            ads_data = connector.get_ad_analytics("123456789", datetime.date(2023, 10, 1), datetime.date(2023, 10, 2))
-            # Fetch Organic
-            org_data = connector.get_company_page_stats("urn:li:organization:12345")
-            return func.HttpResponse(f"LinkedIn Data Ingested")
-
-        elif platform_id == 'Meta':
-            connector = MetaConnector(token)
-            data = connector.get_ads_insights("act_123456789")
-            return func.HttpResponse(f"Meta Data Ingested")
-
-        elif platform_id == 'TikTok':
-            connector = TikTokConnector(token)
-            data = connector.get_campaign_report("adv_12345", "2023-10-01", "2023-10-02")
-            return func.HttpResponse(f"TikTok Data Ingested")
-
-        elif platform_id == 'Reddit':
-            connector = RedditConnector(token)
-            data = connector.get_campaign_reporting("t2_12345", "2023-10-01", "2023-10-02")
-            return func.HttpResponse(f"Reddit Data Ingested")
-
-        elif platform_id == 'MicrosoftAds':
-            connector = MicrosoftAdsConnector(token, "dev_token_123", "cust_123")
-            data = connector.get_campaign_performance("12345", "Last7Days")
-            return func.HttpResponse(f"Microsoft Ads Report Requested")
-
-        else:
-             return func.HttpResponse(f"Unknown Platform: {platform_id}", status_code=400)
+        summary = sync_platform(
+            tenant_id, platform_id, token,
+            account_id=req.params.get('account_id'),
+            start_date=req.params.get('start_date'),
+            end_date=req.params.get('end_date')
+        )
+        return func.HttpResponse(summary["message"])
+
+    except UnknownPlatformError as e:
+        return func.HttpResponse(str(e), status_code=400)
 
     except Exception as e:
         logging.error(f"Ingestion failed: {str(e)}")
         # In production, we return 500, but for 'dry run' demo we might want to return 200 with error message
         return func.HttpResponse(f"Ingestion Error (likely auth): {str(e)}", status_code=500)
 
+@app.function_name(name="Fn_Ingest_Batch")
+@app.route(route="ingest/batch", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def ingest_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Runs many ingestion jobs concurrently.
+    Body: {"jobs": [{"tenant_id", "platform_id", "account_id"?, "start_date"?, "end_date"?}, ...],
+           "max_workers"?: int, "platform_limits"?: {"Meta": 8, ...}}
+    """
+    logging.info('Batch ingestion request received.')
+
+    try:
+        body = req.get_json()
+        jobs = [IngestionJob.from_dict(job) for job in body.get('jobs', [])]
+        max_workers = int(body.get('max_workers') or os.environ.get("INGEST_MAX_WORKERS", 16))
+        platform_limits = {platform: int(limit) for platform, limit in (body.get('platform_limits') or {}).items()}
+    except (ValueError, AttributeError, TypeError):
+        return func.HttpResponse("Please pass a JSON body with a list of jobs", status_code=400)
+
+    if not jobs or any(not job.tenant_id or not job.platform_id for job in jobs):
+        return func.HttpResponse("Every job needs a tenant_id and platform_id", status_code=400)
+    if max_workers < 1 or any(limit < 1 for limit in platform_limits.values()):
+        return func.HttpResponse("max_workers and platform_limits must be positive integers", status_code=400)
+
+    # Resolve every token up front in parallel rather than one per job.
+    get_secret_cache().prefetch(f"{job.tenant_id}-{job.platform_id}-token" for job in jobs)
+
+    orchestrator = IngestionOrchestrator(
+        get_platform_token,
+        max_workers=max_workers,
+        platform_limits=platform_limits
+    )
+    results = orchestrator.run(jobs)
+    return func.HttpResponse(json.dumps(summarize(results)), mimetype="application/json")
+
+@app.function_name(name="Fn_Ingest_Enqueue")
+@app.route(route="ingest/queue", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def ingest_enqueue(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Plans ingestion jobs into small work items and queues them for Fn_Ingest_Work_Item.
+    Body: {"jobs": [{"tenant_id", "platform_id", "account_id"?, "start_date"?, "end_date"?}, ...],
+           "chunk_days"?: int}
+    Responds 202 with a run_id per job; GET ingest/runs/{run_id} reports progress.
+    """
+    logging.info('Queued ingestion request received.')
+
+    try:
+        body = req.get_json()
+        jobs = [IngestionJob.from_dict(job) for job in body.get('jobs', [])]
+        chunk_days = int(body.get('chunk_days') or WORK_ITEM_DAYS)
+    except (ValueError, AttributeError, TypeError):
+        return func.HttpResponse("Please pass a JSON body with a list of jobs", status_code=400)
+
+    if not jobs or any(not job.tenant_id or not job.platform_id for job in jobs) or chunk_days < 1:
+        return func.HttpResponse("Every job needs a tenant_id and platform_id", status_code=400)
+
+    try:
+        runs = enqueue_ingestion(jobs, chunk_days=chunk_days)
+    except UnknownPlatformError as e:
+        return func.HttpResponse(str(e), status_code=400)
+    body = {"runs": runs, "items": sum(run["items"] for run in runs)}
+    return func.HttpResponse(json.dumps(body), status_code=202, mimetype="application/json")
+
+_worker = None
+
+@app.function_name(name="Fn_Ingest_Work_Item")
+@app.queue_trigger(arg_name="msg", queue_name=QUEUE_NAME, connection="AzureWebJobsStorage")
+def ingest_work_item(msg: func.QueueMessage) -> None:
+    """
+    Ingests one queued work item, resuming from its last page checkpoint.
+    Raising lets the runtime redeliver it; the worker dead-letters it on its last delivery.
+    """
+    global _worker
+    if _worker is None:
+        _worker = IngestionWorker(get_platform_token)
+    result = _worker.handle(QueueMessage(msg.id, msg.get_body().decode("utf-8"), msg.dequeue_count))
+    logging.info(f"Work item finished: {json.dumps(result)}")
+
+@app.function_name(name="Fn_Ingest_Run_Status")
+@app.route(route="ingest/runs/{run_id}", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def ingest_run_status(req: func.HttpRequest) -> func.HttpResponse:
+    """Progress of a queued ingestion run: per-item status, rows and attempts."""
+    try:
+        run_id = str(uuid.UUID(req.route_params.get('run_id')))
+    except (ValueError, TypeError):
+        return func.HttpResponse("Unknown run", status_code=404)
+    items = get_checkpoint_store().run_status(run_id)
+    if not items:
+        return func.HttpResponse("Unknown run", status_code=404)
+    counts = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    body = {"items": len(items), "statuses": counts, "rows": sum(item["rows"] for item in items), "work_items": items}
+    return func.HttpResponse(json.dumps(body), mimetype="application/json")
+
 # --- Intelligence Functions ---
 
 @app.function_name(name="Fn_Generate_Insights")
@@ -130,22 +178,121 @@ def generate_insights(req: func.HttpRequest) -> func.HttpResponse:
 
     tenant_id = req.params.get('tenant_id')
 
-    # 1. Fetch recent data from DB (Mocked here as DataFrame)
-    # In real world: engine = create_engine(...); df = pd.read_sql(...)
-    data = {
-        'campaign_name': ['Campaign A', 'Campaign B', 'Campaign C'],
-        'spend': [1200, 5000, 300],
-        'impressions': [50000, 200000, 10000],
-        'conversions': [40, 10, 15],
-        'cpa': [30.0, 500.0, 20.0] # High CPA for B
-    }
-    df = pd.DataFrame(data)
+    # 1. Fetch recent data
+    df = load_insight_frame(tenant_id)
 
     # 2. Initialize Intelligence Engine
-    engine = IntelligenceEngine()
+    from intelligence import IntelligenceEngine
+    engine = IntelligenceEngine(mode=req.params.get('mode'))
 
     # 3. Analyze
-    insights = engine.analyze_performance(df, context=f"Tenant: {tenant_id}")
+    insights = engine.analyze_performance(df, context=f"Tenant: {tenant_id}", tenant_id=tenant_id)
 
     # 4. Return or Store
     return func.HttpResponse(json.dumps(insights), mimetype="application/json")
+
+@app.function_name(name="Fn_Generate_Insights_Batch")
+@app.route(route="insights/batch", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def generate_insights_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Generates insights for many tenants concurrently, e.g. the weekly run.
+    Body: {"tenant_ids": [...], "max_workers"?: int, "mode"?: "llm" | "stats"}
+    """
+    logging.info('Batch insights request received.')
+
+    try:
+        body = req.get_json()
+        tenant_ids = list(body.get('tenant_ids') or [])
+        max_workers = int(body['max_workers']) if body.get('max_workers') else None
+    except (ValueError, AttributeError, TypeError):
+        return func.HttpResponse("Please pass a JSON body with a list of tenant_ids", status_code=400)
+
+    if not tenant_ids:
+        return func.HttpResponse("Please pass a JSON body with a list of tenant_ids", status_code=400)
+
+    from intelligence import IntelligenceEngine
+    engine = IntelligenceEngine(mode=body.get('mode'))
+    results = engine.analyze_batch(
+        ({"tenant_id": tenant_id, "data": load_insight_frame(tenant_id), "context": f"Tenant: {tenant_id}"}
+         for tenant_id in tenant_ids),
+        max_workers=max_workers
+    )
+    return func.HttpResponse(json.dumps(dict(zip(tenant_ids, results))), mimetype="application/json")
+
+def load_insight_frame(tenant_id, days=28):
+    """Daily per-campaign performance for the tenant's last `days` complete days."""
+    import pandas as pd
+
+    if not (tenant_id and database_configured()):
+        # No database (local demo): a small fixed frame.
+        data = {
+            'campaign_name': ['Campaign A', 'Campaign B', 'Campaign C'],
+            'spend': [1200, 5000, 300],
+            'impressions': [50000, 200000, 10000],
+            'conversions': [40, 10, 15],
+            'cpa': [30.0, 500.0, 20.0] # High CPA for B
+        }
+        return pd.DataFrame(data)
+
+    end = datetime.date.today() - datetime.timedelta(days=1)
+    query = MetricsQuery(tenant_id, end - datetime.timedelta(days=days - 1), end, grain="day", group_by="campaign")
+    with pooled_connection() as conn:
+        rows = iter_rows(conn, query)
+        columns = next(rows)
+        df = pd.DataFrame.from_records(list(rows), columns=columns)
+    measures = [c for c in columns if c not in ("period", "platform", "campaign")]
+    df[measures] = df[measures].astype(float)
+    return df.rename(columns={"period": "date", "campaign": "campaign_name"})
+
+# --- Query Functions ---
+
+@app.function_name(name="Fn_Query_Metrics")
+@app.route(route="metrics", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def query_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Aggregated metrics for dashboards.
+    Query: tenant_id, start_date, end_date, platform?, grain? (day | week | month),
+           group_by? (campaign; keyword or page with platform=GoogleSearchConsole)
+    Responses carry an ETag derived from the query and the tenant's data version;
+    a matching If-None-Match gets a 304 without touching the fact tables.
+    """
+    try:
+        query = MetricsQuery.from_params(req.params)
+    except QueryError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    if not database_configured():
+        return func.HttpResponse("No database configured", status_code=503)
+
+    version = get_data_version(query.tenant_id)
+    etag = f'"{query.cache_key(version)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(req.headers.get('If-None-Match'), etag):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    try:
+        _, body = run_query(query, version)
+    except Exception as e:
+        logging.error(f"Metrics query failed: {str(e)}")
+        return func.HttpResponse(f"Query Error: {str(e)}", status_code=500)
+    return func.HttpResponse(body, mimetype="application/json", headers=headers)
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+# --- Telemetry Functions ---
+
+@app.function_name(name="Fn_Telemetry_Metrics")
+@app.route(route="telemetry/metrics", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def telemetry_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    This worker's connector, ingestion, loader and LLM metrics in the Prometheus text format.
+    Counters are per process and reset on restart.
+    """
+    return func.HttpResponse(
+        telemetry.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8", "Cache-Control": "no-store"}
+    )
@@ -0,0 +1,148 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from connectors.json_stream import STREAM_RESPONSES
+from telemetry import NORMALIZE_SECONDS, record_page, span
+
+# Search Analytics returns at most ~50k rows per day, search type and query, so
+# large sites are exported one day (and optionally one device) per request stream.
+DEVICES = ("DESKTOP", "MOBILE", "TABLET")
+EXPORT_WORKERS = int(os.environ.get("GSC_EXPORT_WORKERS", 8))
+SPLIT_DEVICES = os.environ.get("GSC_SPLIT_DEVICES", "true").lower() == "true"
+
+# account_id that selects every verified site the token can see.
+ALL_SITES = "*"
+
+
+@dataclass(frozen=True)
+class Shard:
+    site_url: str
+    date: str
+    device: Optional[str] = None
+    search_type: Optional[str] = None
+
+
+def plan_shards(site_urls, start_date, end_date, devices=DEVICES, search_types=(None,)):
+    """
+    One shard per site, day, device and search type over [start_date, end_date].
+    Sites are innermost so that neighbouring shards, which run at the same time,
+    draw on different per-site quotas.
+    """
+    start, end = datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
+    days = [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    return [
+        Shard(site, day, device, search_type)
+        for day in days
+        for device in (devices or (None,))
+        for search_type in search_types
+        for site in site_urls
+    ]
+
+
+def discover_sites(connector):
+    """Site URLs from sites.list, skipping properties the token is not verified for."""
+    entries = connector.get_site_list().get("siteEntry", [])
+    return [e["siteUrl"] for e in entries if e.get("permissionLevel") != "siteUnverifiedUser"]
+
+
+class SearchConsoleExport:
+    """
+    Exports Search Analytics for many sites as parallel day/device shards.
+
+    Each shard pages with `startRow`; the transport's rate limiter keeps every
+    site under its quota however many shards run at once. Pages are
+    normalized on the worker threads and handed to the calling thread, which
+    owns the loader, through a bounded queue, so memory stays flat however
+    large the export is. Rows land in fact_search_daily, whose natural key
+    includes the device, so device shards never overwrite each other.
+    """
+
+    def __init__(self, connector, loader=None, max_workers=EXPORT_WORKERS,
+                 row_limit=25000, split_devices=SPLIT_DEVICES, queue_size=32, landing=None):
+        self.connector = connector
+        self.loader = loader
+        self.landing = landing
+        self.max_workers = max_workers
+        self.row_limit = row_limit
+        self.devices = DEVICES if split_devices else None
+        self.queue_size = queue_size
+
+    def run(self, site_urls, start_date, end_date):
+        """
+        Returns a summary dict with `rows`, `shards` and `sites`. Every shard is attempted;
+        if any failed, a RuntimeError naming them is raised afterwards.
+        """
+        shards = plan_shards(site_urls, start_date, end_date, self.devices)
+        if not shards:
+            return {"rows": 0, "shards": 0, "sites": 0}
+
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        rows, failed, pending = 0, [], len(shards)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shards))) as pool:
+            for shard in shards:
+                pool.submit(self._export_shard, shard, results, stop)
+            try:
+                while pending:
+                    shard, batch, error = results.get()
+                    if batch is not None:
+                        rows += len(batch)
+                        if self.loader:
+                            self.loader.load_batch(batch)
+                        continue
+                    pending -= 1
+                    if error is not None:
+                        logging.error(f"GSC shard {shard} failed: {str(error)}")
+                        failed.append(shard)
+            finally:
+                stop.set()
+
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(shards)} GSC shards failed, first: {failed[0]}")
+        return {"rows": rows, "shards": len(shards), "sites": len(site_urls)}
+
+    def _export_shard(self, shard, results, stop):
+        """Worker: streams one shard's pages into `results`, then a (shard, None, error) marker."""
+        error = None
+        try:
+            pages = self.connector.iter_search_console_data(
+                shard.site_url, shard.date, shard.date, row_limit=self.row_limit,
+                device=shard.device, search_type=shard.search_type, stream=STREAM_RESPONSES
+            )
+            while not stop.is_set():
+                page = next(pages, None)
+                if page is None:
+                    break
+                record_page('GoogleSearchConsole', len(page))
+                if page and self.landing:
+                    self.landing.write(page)
+                if page:
+                    self._put(results, (shard, self._batch(page), None), stop)
+                if page.cursor is None and not page.partial:
+                    break
+        except Exception as e:
+            error = e
+        self._put(results, (shard, None, error), stop)
+
+    def _batch(self, page):
+        if self.loader is None:
+            return page
+        from normalization import normalize
+        with span("normalize", NORMALIZE_SECONDS, platform='GoogleSearchConsole'):
+            return normalize('GoogleSearchConsole', page)
+
+    def _put(self, results, item, stop):
+        # Bounded put that gives up once the consumer has stopped, so workers never hang.
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
@@ -0,0 +1,245 @@
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.json_stream import STREAM_RESPONSES
+from connectors.registry import get_connector_class
+from data_version import bump_data_version
+from gsc_export import ALL_SITES, SearchConsoleExport, discover_sites
+from landing_zone import open_landing
+from loader import FactLoader, connect, database_configured
+from sync_state import IncrementalSync, get_sync_state_store
+from telemetry import INGEST_SECONDS, NORMALIZE_SECONDS, record_page, span
+
+# Demo account identifiers, used when the caller does not name an account.
+DEFAULT_ACCOUNTS = {
+    'GoogleSearchConsole': ALL_SITES,  # every verified site the token can see
+    'GoogleAnalytics': "123456",
+    'LinkedIn': "123456789",
+    'Meta': "act_123456789",
+    'TikTok': "adv_12345",
+    'Reddit': "t2_12345",
+    'MicrosoftAds': "12345",
+}
+
+# First MS Ads report poll; reports rarely finish sooner in production.
+MSADS_POLL_INITIAL_SECONDS = float(os.environ.get("MSADS_POLL_INITIAL_SECONDS", 2.0))
+# Meta ranges of at least this many days run as async insights jobs rather than synchronous paging.
+META_ASYNC_DAYS = int(os.environ.get("META_ASYNC_DAYS", 90))
+META_POLL_INITIAL_SECONDS = float(os.environ.get("META_POLL_INITIAL_SECONDS", 5.0))
+
+
+class UnknownPlatformError(ValueError):
+    pass
+
+
+def sync_platform(tenant_id, platform_id, token, account_id=None, start_date=None, end_date=None, sync=None):
+    """
+    Ingests one tenant's platform account.
+    With explicit dates the range is fetched as given; otherwise an IncrementalSync
+    fetches the days missing since the stored high-water mark plus the platform's
+    restatement lookback.
+    """
+    if platform_id not in DEFAULT_ACCOUNTS:
+        raise UnknownPlatformError(f"Unknown Platform: {platform_id}")
+    account_id = account_id or DEFAULT_ACCOUNTS[platform_id]
+
+    if start_date and end_date:
+        return ingest_platform(platform_id, token, account_id, start_date, end_date, tenant_id)
+
+    sync = sync or IncrementalSync(get_sync_state_store())
+    return sync.run(
+        tenant_id, platform_id, account_id,
+        lambda start, end: ingest_platform(platform_id, token, account_id, start, end, tenant_id)
+    )
+
+
+def ingest_platform(platform_id, token, account_id, start_date, end_date, tenant_id=None,
+                    cursor=None, checkpoint=None):
+    """
+    Pulls one account's data for one platform over [start_date, end_date] (YYYY-MM-DD).
+    Each page is normalized and, when a database is configured and a tenant given,
+    loaded into the matching fact table.
+    `cursor` resumes a paged source from a page cursor; `checkpoint(cursor, rows)` is
+    called once everything before that cursor has been written. Search Console,
+    Microsoft Ads and batched or async Meta fetches have no resumable cursor and
+    always start over; the summary's `resumed` says whether `cursor` was used.
+    With a landing zone configured, the raw rows are also kept there for replay.
+    Returns a summary dict with the number of `rows` fetched and a human readable `message`;
+    when rows were loaded it also holds how many were `written` (new or changed), how many
+    `unchanged`, and the `change_ratio`.
+    Raises UnknownPlatformError for unsupported platforms; API errors propagate.
+    """
+    loader = FactLoader(connect(), tenant_id) if tenant_id and database_configured() else None
+    if loader and cursor is not None:
+        from normalization import NORMALIZERS
+
+        # The attempt that saved the cursor may have stopped before refreshing rollups
+        # for the rows it wrote, so the final flush covers the whole window.
+        loader.touch(NORMALIZERS[platform_id].table, start_date, end_date)
+    landing = open_landing(tenant_id, platform_id, start_date, end_date)
+    try:
+        with span("ingest_platform", INGEST_SECONDS, platform=platform_id):
+            summary = _ingest(platform_id, token, account_id, start_date, end_date, loader, cursor, checkpoint,
+                              landing)
+            if loader:
+                loader.flush()
+        if loader and loader.change_ratio is not None:
+            summary.update(written=loader.written, unchanged=loader.unchanged, change_ratio=round(loader.change_ratio, 4))
+            summary["message"] += f" ({loader.written} new or changed, {loader.unchanged} unchanged)"
+        changed = (loader.written or cursor is not None) if loader else bool(summary.get("rows"))
+        if tenant_id and changed:
+            # Cached insights and query results for this tenant are now stale.
+            bump_data_version(tenant_id)
+        return summary
+    finally:
+        if landing:
+            landing.close()
+        if loader:
+            loader.conn.close()
+
+
+def _drain(platform_id, pages, loader, checkpoint=None, landing=None):
+    """
+    Normalizes and loads pages as they arrive. Returns the number of raw rows seen.
+    With `checkpoint`, the rows buffered so far are written at the end of each
+    response and its next-page cursor is reported, so a retry resumes from the
+    last page fetched. Rollups are left to the final flush.
+    """
+    if loader:
+        from normalization import normalize
+
+    rows = 0
+    for page in pages:
+        rows += len(page)
+        record_page(platform_id, len(page))
+        if landing:
+            landing.write(page)
+        if loader and page:
+            with span("normalize", NORMALIZE_SECONDS, platform=platform_id):
+                batch = normalize(platform_id, page)
+            loader.load_batch(batch)
+        # Partial pages' cursors re-fetch the response they came from, so only whole responses checkpoint.
+        if checkpoint and page.cursor is not None and not page.partial:
+            if loader:
+                loader.write_pending()
+            checkpoint(page.cursor, rows)
+    return rows
+
+
+def _ingest(platform_id, token, account_id, start_date, end_date, loader, cursor=None, checkpoint=None,
+            landing=None):
+    ingester = PLATFORM_INGESTERS.get(platform_id)
+    if ingester is None:
+        raise UnknownPlatformError(f"Unknown Platform: {platform_id}")
+    connector = get_connector_class(platform_id)
+    return ingester(connector, token, account_id, start_date, end_date, loader, cursor, checkpoint, landing)
+
+
+def _ingest_search_console(connector_class, token, account_id, start_date, end_date, loader,
+                           cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+
+    # 1. Discover Sites, unless one site was named
+    sites = discover_sites(connector) if account_id == ALL_SITES else [account_id]
+
+    # 2. Export every site as parallel day/device shards
+    summary = SearchConsoleExport(connector, loader, landing=landing).run(sites, start_date, end_date)
+    rows = summary["rows"]
+    return {"rows": rows, "message": f"GSC Export: {rows} rows from {summary['sites']} sites in {summary['shards']} shards."}
+
+
+def _ingest_analytics(connector_class, token, account_id, start_date, end_date, loader,
+                      cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+    pages = connector.iter_ga4_report(account_id, start_date, end_date, cursor=cursor, stream=STREAM_RESPONSES)
+    rows = _drain('GoogleAnalytics', pages, loader, checkpoint, landing)
+    return {"rows": rows, "resumed": cursor is not None, "message": f"GA4 Data Ingested: {rows} rows"}
+
+
+def _ingest_linkedin(connector_class, token, account_id, start_date, end_date, loader,
+                     cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+    start, end = datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
+    accounts = account_id.split(",")
+    # Ads, campaign names and organic are independent calls, so fetch them side by side.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        names = pool.submit(connector.get_campaign_names, accounts)
+        # Several comma separated accounts are reported together, a group per request.
+        pages = connector.iter_ad_analytics(accounts, start, end, cursor=cursor, stream=STREAM_RESPONSES)
+        ads = pool.submit(_drain, 'LinkedIn', _with_campaign_names(pages, names), loader, checkpoint, landing)
+        org = pool.submit(connector.get_company_page_stats, "urn:li:organization:12345")
+        rows = ads.result()
+        org.result()
+    return {"rows": rows, "resumed": cursor is not None, "message": f"LinkedIn Data Ingested: {rows} ad rows"}
+
+
+def _with_campaign_names(pages, names):
+    """Adds `campaignName` to LinkedIn analytics rows, which only carry the campaign URN."""
+    for page in pages:
+        lookup = names.result()
+        for row in page:
+            urn = row.get("pivotValue") or (row.get("pivotValues") or [None])[0]
+            if urn:
+                row["campaignName"] = lookup.get(urn.rsplit(":", 1)[-1])
+        yield page
+
+
+def _ingest_meta(connector_class, token, account_id, start_date, end_date, loader,
+                 cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+    accounts = account_id.split(",")
+    days = (datetime.date.fromisoformat(end_date) - datetime.date.fromisoformat(start_date)).days + 1
+    resumed = False
+    # Batched and async pages carry no cursor, so only the single-account sync path checkpoints.
+    if days >= META_ASYNC_DAYS:
+        pages = connector.iter_ads_insights_async(accounts, (start_date, end_date),
+                                                  poll_initial=META_POLL_INITIAL_SECONDS, stream=STREAM_RESPONSES)
+    elif len(accounts) > 1:
+        # Several comma separated accounts share batch requests.
+        pages = connector.iter_ads_insights_batch(accounts, time_range=(start_date, end_date))
+    else:
+        pages = connector.iter_ads_insights(account_id, time_range=(start_date, end_date), cursor=cursor,
+                                            stream=STREAM_RESPONSES)
+        resumed = cursor is not None
+    rows = _drain('Meta', pages, loader, checkpoint, landing)
+    return {"rows": rows, "resumed": resumed, "message": f"Meta Data Ingested: {rows} rows"}
+
+
+def _ingest_tiktok(connector_class, token, account_id, start_date, end_date, loader,
+                   cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+    pages = connector.iter_campaign_report(account_id, start_date, end_date, cursor=cursor, stream=STREAM_RESPONSES)
+    rows = _drain('TikTok', pages, loader, checkpoint, landing)
+    return {"rows": rows, "resumed": cursor is not None, "message": f"TikTok Data Ingested: {rows} rows"}
+
+
+def _ingest_reddit(connector_class, token, account_id, start_date, end_date, loader,
+                   cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token)
+    pages = connector.iter_campaign_reporting(account_id, start_date, end_date, cursor=cursor, stream=STREAM_RESPONSES)
+    rows = _drain('Reddit', pages, loader, checkpoint, landing)
+    return {"rows": rows, "resumed": cursor is not None, "message": f"Reddit Data Ingested: {rows} rows"}
+
+
+def _ingest_microsoft(connector_class, token, account_id, start_date, end_date, loader,
+                      cursor=None, checkpoint=None, landing=None):
+    connector = connector_class(token, os.environ.get("MSADS_DEVELOPER_TOKEN", "dev_token_123"), "cust_123")
+    # Several comma separated accounts share one submit-then-poll round.
+    batches = connector.iter_campaign_performance(account_id.split(","), start_date, end_date,
+                                                  poll_initial=MSADS_POLL_INITIAL_SECONDS)
+    rows = _drain('MicrosoftAds', batches, loader, landing=landing)
+    return {"rows": rows, "message": f"Microsoft Ads Data Ingested: {rows} rows"}
+
+
+# How each platform is fetched. The connector class comes from connectors.registry,
+# which imports the connector module on first use.
+PLATFORM_INGESTERS = {
+    'GoogleSearchConsole': _ingest_search_console,
+    'GoogleAnalytics': _ingest_analytics,
+    'LinkedIn': _ingest_linkedin,
+    'Meta': _ingest_meta,
+    'TikTok': _ingest_tiktok,
+    'Reddit': _ingest_reddit,
+    'MicrosoftAds': _ingest_microsoft,
+}
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def frame_fingerprint(df):
+    """Stable hash of a DataFrame's columns, dtypes and values (row order included)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def insight_cache_key(df, prompt, deployment_name, temperature, **extra):
+    """
+    Content-addressed key for an analysis: same data, prompt, model and settings give the same key.
+    `extra` carries anything else that changes the answer (mode, context, tenant data version).
+    """
+    parts = {
+        "data": frame_fingerprint(df),
+        "prompt": hashlib.sha256(prompt.encode()).hexdigest(),
+        "deployment": deployment_name,
+        "temperature": temperature,
+        **extra,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FileInsightStore:
+    """Persistent tier: one JSON file per key under `directory`, expired by TTL on read."""
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        path = os.path.join(self.directory, f"{key}.json")
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["value"]
+
+    def set(self, key, value):
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"expires_at": time.time() + self.ttl, "value": value}, f)
+        os.replace(tmp, path)
+
+
+class InsightCache:
+    """
+    Two-tier cache of analysis results: an in-memory LRU in front of an optional
+    persistent store. Both tiers honour `ttl`. Entries are never invalidated in
+    place; keys include the tenant's data version, so new data simply misses.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+            self._entries.pop(key, None)
+
+        if self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                self._remember(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.store is not None:
+            try:
+                self.store.set(key, value)
+            except OSError as e:
+                logging.warning(f"Could not persist insight cache entry: {str(e)}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_insight_cache():
+    """Process-wide cache; INSIGHT_CACHE_DIR enables the persistent tier."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = int(os.environ.get("INSIGHT_CACHE_TTL_SECONDS", 3600))
+                directory = os.environ.get("INSIGHT_CACHE_DIR")
+                store = FileInsightStore(directory, ttl) if directory else None
+                _cache = InsightCache(ttl=ttl, store=store)
+    return _cache
@@ -1,16 +1,69 @@
 import os
 import json
 import logging
+import re
+import threading
+import time
 import pandas as pd
-from openai import AzureOpenAI
+from concurrent.futures import ThreadPoolExecutor
+
+from anomalies import screen_performance, BASELINE_WINDOW
+from data_version import get_data_version
+from insight_cache import get_insight_cache, insight_cache_key
+from normalization import ColumnBatch
+from telemetry import LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_WAIT_SECONDS, span
+from token_budget import TokensPerMinuteLimiter, chunk_markdown_table, estimate_tokens
+
+# Flags turned into insights in stats mode; the pre-screen already ranks them by severity.
+MAX_PROMPT_FLAGS = 100
+# The model sees every flagged row, split into tables of at most this many tokens...
+CHUNK_TOKENS = int(os.environ.get("INTELLIGENCE_CHUNK_TOKENS", 6000))
+# ...and at most this many chunks per analysis, which drops only the least severe flags.
+MAX_PROMPT_CHUNKS = 20
+# Completion tokens reserved per call when checking the tokens-per-minute budget.
+RESPONSE_TOKEN_RESERVE = 1000
+SEVERITY_RANK = {"high": 0, "medium": 1, "low": 2}
+# Fallback when nothing is flagged: the biggest spenders give the model something to compare.
+MAX_PROMPT_CAMPAIGNS = 20
+TEMPERATURE = 0.2
+
+SYSTEM_PROMPT = """You are a Senior Marketing Analyst. Your goal is to identify critical anomalies
+        and opportunities in the provided campaign performance data.
+        Focus on:
+        1) High Spend but Low ROAS/Conversions.
+        2) Sudden Spikes in CPA (>20%).
+        3) High performing organic content.
+
+        Return the output as a valid JSON object with a list of 'insights'.
+        Each insight should have: 'title', 'severity' (high/medium/low), and 'description'."""
+
+USER_PROMPT_TEMPLATE = """Context: {context}
+
+        Account totals: {aggregates}
+
+        Rows flagged by a statistical pre-screen of all {rows} rows
+        (baselines are trailing {baseline_window}-day means per campaign):
+        {table}
+
+        Analyze this data."""
 
 class IntelligenceEngine:
-    def __init__(self):
+    def __init__(self, mode=None, cache=None, max_in_flight=None, tokens_per_minute=None):
+        # "llm" (default) sends the pre-screened rows to the model, "stats" answers locally.
+        self.mode = mode or os.environ.get("INTELLIGENCE_MODE", "llm")
         self.api_key = os.environ.get("AZURE_OPENAI_API_KEY")
         self.endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
         self.deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+        self.cache = cache or get_insight_cache()
+        # Shared by every chunk and tenant analyzed through this engine.
+        self.max_in_flight = max_in_flight or int(os.environ.get("INTELLIGENCE_MAX_IN_FLIGHT", 8))
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.limiter = TokensPerMinuteLimiter(tokens_per_minute or int(os.environ.get("AZURE_OPENAI_TPM", 150000)))
 
         if self.api_key and self.endpoint:
+            # Deferred: the OpenAI SDK is slow to import and only this path needs it.
+            from openai import AzureOpenAI
+
             self.client = AzureOpenAI(
                 api_key=self.api_key,
                 api_version="2024-02-15-preview",
@@ -20,52 +73,149 @@ class IntelligenceEngine:
             self.client = None
             logging.warning("Azure OpenAI credentials not found. Intelligence Engine running in mock mode.")
 
-    def analyze_performance(self, data_df: pd.DataFrame, context: str = "") -> dict:
+    def analyze_performance(self, data_df: pd.DataFrame, context: str = "", tenant_id=None) -> dict:
         """
         Analyzes a pandas DataFrame of marketing performance data using GPT-4o.
+        A statistical pre-screen runs over every row first, and only the flagged rows and
+        account aggregates reach the model. Normalized ColumnBatches are accepted as well.
+        Results are cached by content; with a `tenant_id` the key also carries the
+        tenant's data version, so ingesting new data invalidates them.
         """
+        if isinstance(data_df, ColumnBatch):
+            data_df = data_df.to_frame()
+
+        cache_key = insight_cache_key(
+            data_df, SYSTEM_PROMPT + USER_PROMPT_TEMPLATE, self.deployment_name, TEMPERATURE,
+            mode=self.mode, context=context, chunk_tokens=CHUNK_TOKENS,
+            data_version=get_data_version(tenant_id) if tenant_id else None
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logging.info("Serving insights from cache.")
+            return cached
+
+        # 1. Statistical pre-screen over every row
+        screen = screen_performance(data_df)
+        if self.mode == "stats":
+            result = self._stats_analysis(screen)
+            self.cache.set(cache_key, result)
+            return result
+
         if self.client is None:
             return self._mock_analysis(data_df)
 
-        # 1. Serialize Data to Markdown Table (efficient for LLMs)
-        # Limit rows to prevent context window overflow
-        summary_df = data_df.head(50).to_markdown(index=False)
+        # 2. Serialize the flagged rows (Markdown is efficient for LLMs) into token-budgeted chunks
+        table = self._prompt_table(screen, data_df).to_markdown(index=False)
+        chunks = chunk_markdown_table(table, CHUNK_TOKENS, self.deployment_name)
+        if len(chunks) > MAX_PROMPT_CHUNKS:
+            logging.warning(f"Analyzing the first {MAX_PROMPT_CHUNKS} of {len(chunks)} chunks of flagged rows")
+            chunks = chunks[:MAX_PROMPT_CHUNKS]
 
-        # 2. Construct Prompt
-        system_prompt = """You are a Senior Marketing Analyst. Your goal is to identify critical anomalies
-        and opportunities in the provided campaign performance data.
-        Focus on:
-        1) High Spend but Low ROAS/Conversions.
-        2) Sudden Spikes in CPA (>20%).
-        3) High performing organic content.
+        # 3. Construct one prompt per chunk, all carrying the account totals
+        prompts = [
+            USER_PROMPT_TEMPLATE.format(
+                context=context,
+                aggregates=json.dumps(screen.aggregates),
+                rows=screen.aggregates['rows'],
+                baseline_window=BASELINE_WINDOW,
+                table=chunk
+            )
+            for chunk in chunks
+        ]
 
-        Return the output as a valid JSON object with a list of 'insights'.
-        Each insight should have: 'title', 'severity' (high/medium/low), and 'description'."""
+        # 4. Analyze chunks concurrently and merge
+        if len(prompts) == 1:
+            result = self._complete(prompts[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(prompts), self.max_in_flight)) as pool:
+                result = merge_insights(list(pool.map(self._complete, prompts)))
+
+        if "error" not in result and "errors" not in result:
+            self.cache.set(cache_key, result)
+        return result
 
-        user_prompt = f"""Context: {context}
+    def analyze_batch(self, requests, max_workers=None):
+        """
+        Analyzes many tenants concurrently. `requests` are dicts with `tenant_id`,
+        `data` (DataFrame or ColumnBatch) and an optional `context`.
+        Model calls from all tenants share this engine's in-flight cap and
+        tokens-per-minute budget. Returns one result per request, in order.
+        """
+        requests = list(requests)
+        if not requests:
+            return []
 
-        Data:
-        {summary_df}
+        def analyze(request):
+            try:
+                return self.analyze_performance(
+                    request["data"], context=request.get("context", ""), tenant_id=request.get("tenant_id")
+                )
+            except Exception as e:
+                logging.error(f"Analysis failed for tenant {request.get('tenant_id')}: {str(e)}")
+                return {"error": str(e), "insights": []}
 
-        Analyze this data."""
+        with ThreadPoolExecutor(max_workers=min(len(requests), max_workers or self.max_in_flight)) as pool:
+            return list(pool.map(analyze, requests))
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.2
-            )
+    def _complete(self, user_prompt):
+        """One chat completion, throttled by the in-flight cap and the tokens-per-minute budget."""
+        tokens = estimate_tokens(SYSTEM_PROMPT + user_prompt, self.deployment_name) + RESPONSE_TOKEN_RESERVE
+        waiting = time.perf_counter()
+        with self._in_flight:
+            self.limiter.acquire(tokens)
+            LLM_WAIT_SECONDS.inc(time.perf_counter() - waiting, deployment=self.deployment_name)
+            try:
+                with span("chat_completion", LLM_REQUEST_SECONDS, deployment=self.deployment_name):
+                    response = self.client.chat.completions.create(
+                        model=self.deployment_name,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        response_format={"type": "json_object"},
+                        temperature=TEMPERATURE
+                    )
+                usage = getattr(response, "usage", None)
+                if usage:
+                    LLM_TOKENS.inc(usage.prompt_tokens, deployment=self.deployment_name, kind="prompt")
+                    LLM_TOKENS.inc(usage.completion_tokens, deployment=self.deployment_name, kind="completion")
+                return json.loads(response.choices[0].message.content)
 
-            result = json.loads(response.choices[0].message.content)
-            return result
+            except Exception as e:
+                logging.error(f"Error during AI analysis: {str(e)}")
+                return {"error": str(e), "insights": []}
 
-        except Exception as e:
-            logging.error(f"Error during AI analysis: {str(e)}")
-            return {"error": str(e), "insights": []}
+    def _prompt_table(self, screen, data_df):
+        if len(screen.flags):
+            table = screen.flags.round({"value": 2, "baseline": 2, "delta_pct": 1, "zscore": 1})
+            return table.assign(date=pd.to_datetime(table["date"]).dt.strftime("%Y-%m-%d").fillna(""))
+        if "spend" in data_df:
+            return data_df.nlargest(MAX_PROMPT_CAMPAIGNS, "spend")
+        return data_df.head(MAX_PROMPT_CAMPAIGNS)
+
+    def _stats_analysis(self, screen, limit=MAX_PROMPT_FLAGS):
+        """Turns pre-screen flags into insights without calling the model."""
+        insights = []
+        for flag in screen.flags.head(limit).itertuples(index=False):
+            when = f" on {flag.date:%Y-%m-%d}" if pd.notna(flag.date) else ""
+            if flag.rule == "cpa_spike":
+                title = f"CPA spike: {flag.campaign}"
+                description = (f"CPA{when} was {flag.value:.2f}, {flag.delta_pct:.0f}% above its "
+                               f"{BASELINE_WINDOW}-day baseline of {flag.baseline:.2f}.")
+            elif flag.rule == "spend_spike":
+                title = f"Spend spike: {flag.campaign}"
+                description = (f"Spend{when} was {flag.value:.2f} against a baseline of {flag.baseline:.2f} "
+                               f"({flag.zscore:.1f} standard deviations above normal).")
+            elif flag.rule == "high_spend_low_conversions":
+                title = f"High spend, low conversions: {flag.campaign}"
+                description = (f"One of the top spenders with a CPA of {flag.value:.2f} versus an account "
+                               f"median of {flag.baseline:.2f}." if pd.notna(flag.value) else
+                               "One of the top spenders with no conversions.")
+            else:
+                title = f"Low ROAS outlier: {flag.campaign}"
+                description = f"ROAS of {flag.value:.2f} versus an account median of {flag.baseline:.2f}."
+            insights.append({"title": title, "severity": flag.severity, "description": description})
+        return {"insights": insights, "aggregates": screen.aggregates, "source": "stats"}
 
     def _mock_analysis(self, df):
         """Returns dummy insights if no API key is present."""
@@ -84,3 +234,34 @@ class IntelligenceEngine:
                 }
             ]
         }
+
+
+def merge_insights(results):
+    """
+    Merges per-chunk results into one: insights with the same title are kept once at
+    their highest severity, then ranked by severity and by how many chunks raised them.
+    Fails only if every chunk failed; partial failures are listed under `errors`.
+    """
+    errors = [r["error"] for r in results if "error" in r]
+    if len(errors) == len(results):
+        return {"error": errors[0], "insights": []}
+
+    merged = {}
+    for result in results:
+        for insight in result.get("insights", []):
+            key = re.sub(r"\W+", " ", str(insight.get("title", ""))).strip().lower()
+            seen = merged.get(key)
+            if seen is None:
+                merged[key] = {"insight": insight, "mentions": 1, "order": len(merged)}
+                continue
+            seen["mentions"] += 1
+            if SEVERITY_RANK.get(insight.get("severity"), 3) < SEVERITY_RANK.get(seen["insight"].get("severity"), 3):
+                seen["insight"] = insight
+
+    ranked = sorted(merged.values(), key=lambda m: (
+        SEVERITY_RANK.get(m["insight"].get("severity"), 3), -m["mentions"], m["order"]
+    ))
+    merged_result = {"insights": [m["insight"] for m in ranked], "chunks": len(results)}
+    if errors:
+        merged_result["errors"] = errors
+    return merged_result
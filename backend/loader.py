@@ -0,0 +1,465 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from rollups import month_start, next_month, refresh_rollups
+from telemetry import LOAD_ROWS, LOAD_SECONDS, LOAD_UNCHANGED_ROWS, span
+
+# pandas, psycopg2 and normalization are imported where they are used, so that
+# importing this module (e.g. for database_configured) stays cheap at cold start.
+
+
+def connect(dsn=None):
+    """
+    Opens a Postgres connection.
+    Uses DATABASE_URL, or libpq's PGHOST/PGUSER/PGPASSWORD/PGDATABASE variables when it is unset,
+    so the same code runs against Azure and a local Postgres.
+    """
+    import psycopg2
+
+    return psycopg2.connect(dsn or os.environ.get("DATABASE_URL", ""))
+
+
+def database_configured():
+    return bool(os.environ.get("DATABASE_URL") or os.environ.get("PGHOST"))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide connection pool for short read queries, sized by DB_POOL_MIN/DB_POOL_MAX."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                _pool = ThreadedConnectionPool(
+                    int(os.environ.get("DB_POOL_MIN", 1)),
+                    int(os.environ.get("DB_POOL_MAX", 10)),
+                    os.environ.get("DATABASE_URL", "")
+                )
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Borrows a pooled connection; it is rolled back (or discarded if broken) when returned."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        pool.putconn(conn, close=broken)
+
+
+# --- Dimensions ---
+
+class Dimension:
+    """Describes how a dimension table is keyed and which attributes ride along with the natural key."""
+
+    def __init__(self, table, key_column, natural_columns, attribute_columns=()):
+        self.table = table
+        self.key_column = key_column
+        self.natural_columns = tuple(natural_columns)
+        self.attribute_columns = tuple(attribute_columns)
+
+
+DIM_CAMPAIGN = Dimension("dim_campaign", "campaign_key", ("platform_source", "platform_campaign_id"), ("campaign_name",))
+DIM_KEYWORD = Dimension("dim_keyword", "keyword_key", ("keyword_text",))
+DIM_PAGE = Dimension("dim_page", "page_key", ("platform_source", "platform_page_id"), ("page_name",))
+
+
+class DimensionKeyCache:
+    """
+    In-process LRU of natural key -> surrogate key for one dimension.
+
+    Misses are resolved in bulk with one INSERT ... ON CONFLICT ... RETURNING per
+    batch, which both creates unseen members and returns keys of existing ones.
+    """
+
+    def __init__(self, dimension, max_entries=500000):
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, cursor, members):
+        """
+        `members` maps natural key tuples to attribute tuples (e.g. campaign name).
+        Returns {natural key tuple: surrogate key}.
+        """
+        resolved, missing = {}, {}
+        with self._lock:
+            for natural_key, attributes in members.items():
+                key = self._keys.get(natural_key)
+                if key is None:
+                    missing[natural_key] = attributes
+                else:
+                    self._keys.move_to_end(natural_key)
+                    resolved[natural_key] = key
+
+        if missing:
+            fetched = self._upsert(cursor, missing)
+            resolved.update(fetched)
+            with self._lock:
+                self._keys.update(fetched)
+                while len(self._keys) > self.max_entries:
+                    self._keys.popitem(last=False)
+        return resolved
+
+    def _upsert(self, cursor, missing):
+        from psycopg2.extras import execute_values
+
+        dim = self.dimension
+        columns = dim.natural_columns + dim.attribute_columns
+        # DO UPDATE (rather than DO NOTHING) so RETURNING also yields rows that already existed.
+        update_columns = dim.attribute_columns or dim.natural_columns[-1:]
+        updates = ", ".join(f"{c} = COALESCE(EXCLUDED.{c}, {dim.table}.{c})" for c in update_columns)
+        sql = (
+            f"INSERT INTO {dim.table} ({', '.join(columns)}) VALUES %s "
+            f"ON CONFLICT ({', '.join(dim.natural_columns)}) DO UPDATE SET {updates} "
+            f"RETURNING {dim.key_column}, {', '.join(dim.natural_columns)}"
+        )
+        values = [natural_key + tuple(attributes) for natural_key, attributes in missing.items()]
+        returned = execute_values(cursor, sql, values, page_size=1000, fetch=True)
+        return {tuple(row[1:]): row[0] for row in returned}
+
+
+_key_caches = {}
+_key_caches_lock = threading.Lock()
+
+
+def get_key_cache(dimension):
+    """Process-wide key cache per dimension, shared by every loader in the instance."""
+    with _key_caches_lock:
+        if dimension.table not in _key_caches:
+            _key_caches[dimension.table] = DimensionKeyCache(dimension)
+        return _key_caches[dimension.table]
+
+
+# --- Facts ---
+
+class FactTable:
+    """
+    Describes a fact table for the loader.
+    `dimensions` maps the fact's key column to the Dimension it is resolved from.
+    `natural_key` identifies a row for replacement when data is reloaded; the
+    remaining `content_columns` are hashed into `row_hash` to detect changes.
+    `nullable_key` maps the natural-key columns that can be NULL to the value NULL
+    is compared as, so the key can be matched with `=` (hash joins and the
+    table's natural-key index) instead of IS NOT DISTINCT FROM.
+    """
+
+    def __init__(self, table, columns, natural_key, dimensions=None, nullable_key=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.natural_key = tuple(natural_key)
+        self.dimensions = dimensions or {}
+        self.nullable_key = nullable_key or {}
+        self.content_columns = tuple(c for c in self.columns if c not in self.natural_key)
+
+    def key_match(self, left, right):
+        """SQL matching rows of aliases `left` and `right` on the natural key, as schema.sql indexes it."""
+        def key(alias, column):
+            if column in self.nullable_key:
+                return f"coalesce({alias}.{column}, {self.nullable_key[column]})"
+            return f"{alias}.{column}"
+
+        return " AND ".join(f"{key(left, c)} = {key(right, c)}" for c in self.natural_key)
+
+    def row_hash(self, alias):
+        """SQL for the 64-bit hash of a row's content columns, from their typed text form."""
+        content = ", ".join(f"{alias}.{c}" for c in self.content_columns)
+        return f"hashtextextended(ROW({content})::text, 0)"
+
+
+FACT_PERFORMANCE = FactTable(
+    "fact_performance_daily",
+    ("tenant_id", "date", "campaign_key", "adgroup_key", "ad_key", "impressions", "clicks", "spend",
+     "conversions", "conversion_value", "custom_metrics"),
+    ("tenant_id", "date", "campaign_key", "adgroup_key", "ad_key"),
+    {"campaign_key": DIM_CAMPAIGN},
+    {"campaign_key": "-1", "adgroup_key": "-1", "ad_key": "-1"},
+)
+FACT_SEARCH = FactTable(
+    "fact_search_daily",
+    ("tenant_id", "date", "keyword_key", "page_url", "device", "impressions", "clicks", "position", "ctr",
+     "custom_metrics"),
+    ("tenant_id", "date", "keyword_key", "page_url", "device"),
+    {"keyword_key": DIM_KEYWORD},
+    {"keyword_key": "-1", "page_url": "''", "device": "''"},
+)
+FACT_ORGANIC = FactTable(
+    "fact_organic_daily",
+    ("tenant_id", "date", "page_key", "followers_total", "followers_gained", "page_views", "engagement_rate",
+     "custom_metrics"),
+    ("tenant_id", "date", "page_key"),
+    {"page_key": DIM_PAGE},
+    {"page_key": "-1"},
+)
+
+FACT_TABLES = {fact.table: fact for fact in (FACT_PERFORMANCE, FACT_SEARCH, FACT_ORGANIC)}
+
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+
+def ensure_partitions(cursor, table, months):
+    """Creates any missing monthly partitions of `table` for `months` (first days of months)."""
+    for month in sorted(months):
+        name = partition_name(table, month)
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is not None:
+            continue
+        # Serializes concurrent loaders creating the same partition.
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (name,))
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (month, next_month(month))
+        )
+        logging.info(f"Created partition {name}")
+
+
+class FactLoader:
+    """
+    Streams normalized rows into a fact table with COPY.
+
+    Rows are dicts holding the fact's measure columns plus the natural columns of
+    its dimensions (e.g. `platform_source`, `platform_campaign_id`, `campaign_name`
+    for fact_performance_daily). They are buffered into batches of `batch_size`;
+    each batch resolves its dimension keys, is COPY'd into a temp staging table and
+    then replaces any existing rows with the same natural key, so reloading a date
+    range is idempotent. Rows whose `row_hash` matches the stored row are dropped
+    from the batch first, so restated days that did not change cost no writes;
+    `written` and `unchanged` count both kinds per loader.
+
+    Normalized ColumnBatches can be fed with `load_batch` instead; they are
+    accumulated per table up to `batch_size` rows and written column-wise
+    without going through per-row dicts. Call `flush` once the source is drained.
+
+    Fact tables are partitioned by month; missing partitions are created on the
+    way in. The loader remembers which months it wrote per table, and `load` and
+    `flush` rebuild the tenant's weekly/monthly rollups for just those months.
+    """
+
+    def __init__(self, conn, tenant_id, batch_size=50000):
+        self.conn = conn
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self._staged = set()
+        self._pending = {}  # table -> [ColumnBatch]
+        self.touched = {}  # table -> {first day of each month written}
+        self.written = 0
+        self.unchanged = 0
+
+    def load(self, table, rows):
+        """Loads an iterable of row dicts into `table`. Returns the number of rows written."""
+        fact = FACT_TABLES[table]
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self._flush(fact, batch)
+                batch = []
+        if batch:
+            total += self._flush(fact, batch)
+        self.refresh_rollups()
+        return total
+
+    def load_batch(self, batch):
+        """
+        Queues a ColumnBatch for its fact table, writing once `batch_size` rows are pending.
+        Returns the number of rows written by this call (0 while buffering).
+        """
+        if batch.table is None or not len(batch):
+            return 0
+        pending = self._pending.setdefault(batch.table, [])
+        pending.append(batch)
+        if sum(len(b) for b in pending) >= self.batch_size:
+            return self._flush_pending(batch.table)
+        return 0
+
+    @property
+    def change_ratio(self):
+        """Share of the rows loaded so far that were new or changed, or None before any."""
+        total = self.written + self.unchanged
+        return self.written / total if total else None
+
+    @property
+    def pending_rows(self):
+        """Rows queued by `load_batch` that are not written yet."""
+        return sum(len(b) for batches in self._pending.values() for b in batches)
+
+    def write_pending(self):
+        """Writes all queued batches without refreshing rollups. Returns the number of rows written."""
+        return sum(self._flush_pending(table) for table in list(self._pending))
+
+    def flush(self):
+        """Writes all queued batches and refreshes rollups. Returns the number of rows written."""
+        written = self.write_pending()
+        self.refresh_rollups()
+        return written
+
+    def touch(self, table, start_date, end_date):
+        """Marks the months of [start_date, end_date] (YYYY-MM-DD) of `table` for the next rollup refresh."""
+        month = month_start(datetime.date.fromisoformat(start_date))
+        end = datetime.date.fromisoformat(end_date)
+        months = self.touched.setdefault(table, set())
+        while month <= end:
+            months.add(month)
+            month = next_month(month)
+
+    def refresh_rollups(self):
+        """Rebuilds the tenant's rollups for the months written since the last refresh."""
+        if not self.touched:
+            return
+        with self.conn.cursor() as cursor:
+            for table, months in self.touched.items():
+                with span("refresh_rollups", LOAD_SECONDS, table=table, stage="rollup"):
+                    refresh_rollups(cursor, table, self.tenant_id, months)
+        self.conn.commit()
+        logging.info(f"Refreshed rollups for tenant {self.tenant_id}: "
+                     + ", ".join(f"{table} x{len(months)} months" for table, months in self.touched.items()))
+        self.touched = {}
+
+    def _flush_pending(self, table):
+        from normalization import ColumnBatch
+
+        batch = ColumnBatch.concat(self._pending.pop(table, []))
+        if batch is None:
+            return 0
+        return self._flush_frame(FACT_TABLES[table], batch.to_frame())
+
+    def _flush(self, fact, rows):
+        with self.conn.cursor() as cursor:
+            keys = self._resolve_dimensions(cursor, fact, rows)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(self._csv_values(fact, row, keys))
+            buffer.seek(0)
+
+            written = self._copy_and_replace(cursor, fact, buffer)
+        self.conn.commit()
+        logging.info(f"Loaded {len(rows)} rows into {fact.table} for tenant {self.tenant_id}: "
+                     f"{written} new or changed")
+        return written
+
+    def _flush_frame(self, fact, frame):
+        import pandas as pd
+
+        with self.conn.cursor() as cursor:
+            out = pd.DataFrame(index=frame.index)
+            for column in fact.columns:
+                if column == "tenant_id":
+                    out[column] = self.tenant_id
+                elif column in fact.dimensions:
+                    out[column] = self._resolve_frame_keys(cursor, fact.dimensions[column], frame)
+                elif column in frame:
+                    out[column] = frame[column]
+                else:
+                    out[column] = None
+
+            buffer = io.StringIO()
+            out.to_csv(buffer, header=False, index=False, date_format="%Y-%m-%d")
+            buffer.seek(0)
+
+            written = self._copy_and_replace(cursor, fact, buffer)
+        self.conn.commit()
+        logging.info(f"Loaded {len(frame)} rows into {fact.table} for tenant {self.tenant_id}: "
+                     f"{written} new or changed")
+        return written
+
+    def _copy_and_replace(self, cursor, fact, buffer):
+        """Replaces the stored rows matching the buffer's new or changed rows. Returns how many were written."""
+        with span("copy_and_replace", LOAD_SECONDS, table=fact.table, stage="copy"):
+            staging = self._ensure_staging(cursor, fact)
+            columns = ", ".join(fact.columns)
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+            match = fact.key_match("f", "s")
+            cursor.execute(f"DELETE FROM {staging} s USING {fact.table} f WHERE {match} "
+                           f"AND f.row_hash = {fact.row_hash('s')}")
+            unchanged = cursor.rowcount
+
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', date)::date FROM {staging}")
+            months = {row[0] for row in cursor.fetchall()}
+            ensure_partitions(cursor, fact.table, months)
+            if months:
+                self.touched.setdefault(fact.table, set()).update(months)
+
+            cursor.execute(f"DELETE FROM {fact.table} f USING {staging} s WHERE {match}")
+            cursor.execute(f"INSERT INTO {fact.table} ({columns}, row_hash) "
+                           f"SELECT {columns}, {fact.row_hash('s')} FROM {staging} s")
+            written = cursor.rowcount
+        LOAD_ROWS.inc(written, table=fact.table)
+        LOAD_UNCHANGED_ROWS.inc(unchanged, table=fact.table)
+        self.written += written
+        self.unchanged += unchanged
+        return written
+
+    def _resolve_frame_keys(self, cursor, dim, frame):
+        import pandas as pd
+
+        natural = list(dim.natural_columns)
+        members_frame = frame[natural + list(dim.attribute_columns)].drop_duplicates(subset=natural)
+        members_frame = members_frame[members_frame[natural[-1]].notna()]
+        members = {
+            row[:len(natural)]: row[len(natural):]
+            for row in members_frame.itertuples(index=False, name=None)
+        }
+        resolved = get_key_cache(dim).resolve(cursor, members)
+        keys = [resolved.get(natural_key) for natural_key in zip(*(frame[c] for c in natural))]
+        return pd.array(keys, dtype="Int64")
+
+    def _resolve_dimensions(self, cursor, fact, rows):
+        keys = {}
+        for key_column, dim in fact.dimensions.items():
+            members = {}
+            for row in rows:
+                natural_key = tuple(row.get(c) for c in dim.natural_columns)
+                if natural_key[-1] is not None and natural_key not in members:
+                    members[natural_key] = tuple(row.get(c) for c in dim.attribute_columns)
+            keys[key_column] = get_key_cache(dim).resolve(cursor, members)
+        return keys
+
+    def _ensure_staging(self, cursor, fact):
+        staging = f"stg_{fact.table}"
+        if staging not in self._staged:
+            cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {fact.table} INCLUDING DEFAULTS)")
+            self._staged.add(staging)
+        return staging
+
+    def _csv_values(self, fact, row, keys):
+        values = []
+        for column in fact.columns:
+            if column == "tenant_id":
+                value = self.tenant_id
+            elif column in fact.dimensions:
+                dim = fact.dimensions[column]
+                value = keys[column].get(tuple(row.get(c) for c in dim.natural_columns))
+            else:
+                value = row.get(column)
+            if isinstance(value, dict):
+                value = json.dumps(value)
+            values.append(value)
+        return values
@@ -0,0 +1,234 @@
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from rollups import next_month
+
+GRAINS = ("day", "week", "month")
+
+# Server-side cursor batch size: large results are read and encoded this many rows at a time.
+FETCH_SIZE = 5000
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Source:
+    """A queryable subject area: its fact table, rollups per group_by, measures and dimension joins."""
+
+    def __init__(self, fact_table, rollups, measures, groups, joins="", group_joins=None):
+        self.fact_table = fact_table
+        self.rollups = rollups  # group_by -> rollup table
+        self.measures = measures  # output column -> aggregate over fact or rollup columns
+        self.groups = groups  # group_by -> SQL expression
+        self.joins = joins  # always joined
+        self.group_joins = group_joins or {}  # group_by -> join it needs
+
+
+_SEARCH_MEASURES = {
+    "impressions": "SUM(impressions)::BIGINT",
+    "clicks": "SUM(clicks)::BIGINT",
+    "position": "ROUND(SUM(position * impressions) / NULLIF(SUM(impressions), 0), 2)",
+    "ctr": "ROUND(SUM(clicks)::DECIMAL / NULLIF(SUM(impressions), 0), 4)",
+}
+
+SOURCES = {
+    "performance": Source(
+        "fact_performance_daily",
+        {None: "rollup_campaign", "campaign": "rollup_campaign"},
+        {
+            "impressions": "SUM(impressions)::BIGINT",
+            "clicks": "SUM(clicks)::BIGINT",
+            "spend": "SUM(spend)",
+            "conversions": "SUM(conversions)::BIGINT",
+            "conversion_value": "SUM(conversion_value)",
+        },
+        {"campaign": "c.campaign_name"},
+        "LEFT JOIN dim_campaign c USING (campaign_key)",
+    ),
+    "search": Source(
+        "fact_search_daily",
+        {None: "rollup_search_page", "page": "rollup_search_page", "keyword": "rollup_keyword"},
+        _SEARCH_MEASURES,
+        {"page": "page_url", "keyword": "k.keyword_text"},
+        group_joins={"keyword": "LEFT JOIN dim_keyword k USING (keyword_key)"},
+    ),
+}
+
+
+@dataclass(frozen=True)
+class MetricsQuery:
+    tenant_id: str
+    start_date: datetime.date
+    end_date: datetime.date
+    platform: Optional[str] = None
+    grain: str = "day"
+    group_by: Optional[str] = None
+
+    @classmethod
+    def from_params(cls, params):
+        """Builds a query from request parameters. Raises QueryError for missing or invalid ones."""
+        try:
+            query = cls(
+                tenant_id=params["tenant_id"],
+                start_date=datetime.date.fromisoformat(params["start_date"]),
+                end_date=datetime.date.fromisoformat(params["end_date"]),
+                platform=params.get("platform") or None,
+                grain=params.get("grain") or "day",
+                group_by=params.get("group_by") or None,
+            )
+        except (KeyError, TypeError, ValueError):
+            raise QueryError("tenant_id, start_date and end_date (YYYY-MM-DD) are required")
+        if query.grain not in GRAINS:
+            raise QueryError(f"grain must be one of {', '.join(GRAINS)}")
+        if query.start_date > query.end_date:
+            raise QueryError("start_date is after end_date")
+        if query.group_by is not None and query.group_by not in query.source.groups:
+            raise QueryError(f"group_by must be one of {', '.join(query.source.groups)}")
+        return query
+
+    @property
+    def source(self):
+        return SOURCES["search" if self.platform == "GoogleSearchConsole" else "performance"]
+
+    def cache_key(self, data_version):
+        """Identifies this query's result for one version of the tenant's data; also used as the ETag."""
+        params = {k: str(v) if v is not None else None for k, v in asdict(self).items()}
+        raw = json.dumps({**params, "data_version": data_version}, sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def to_sql(self):
+        """Returns (sql, params, columns). Whole weeks/months are read from the rollups, anything else from the facts."""
+        source = self.source
+        rollup = source.rollups.get(self.group_by)
+        use_rollup = rollup and self.grain != "day" and _period_aligned(self.grain, self.start_date, self.end_date)
+
+        columns = ["period"]
+        if use_rollup:
+            select = ["r.period_start AS period"]
+            table, alias = rollup, "r"
+            where = ["r.tenant_id = %s", "r.grain = %s", "r.period_start BETWEEN %s AND %s"]
+            params = [self.tenant_id, self.grain, self.start_date, self.end_date]
+        else:
+            select = ["date_trunc(%s, f.date)::date AS period"]
+            table, alias = source.fact_table, "f"
+            where = ["f.tenant_id = %s", "f.date BETWEEN %s AND %s"]
+            params = [self.grain, self.tenant_id, self.start_date, self.end_date]
+
+        if source is SOURCES["performance"]:
+            select.append("c.platform_source AS platform")
+            columns.append("platform")
+            if self.platform:
+                where.append("c.platform_source = %s")
+                params.append(self.platform)
+        if self.group_by:
+            select.append(f"{source.groups[self.group_by]} AS {self.group_by}")
+            columns.append(self.group_by)
+
+        group_count = len(columns)
+        measures = [f"{expression} AS {name}" for name, expression in source.measures.items()]
+        columns += list(source.measures)
+        ordinals = ", ".join(str(i) for i in range(1, group_count + 1))
+        joins = " ".join(j for j in (source.joins, source.group_joins.get(self.group_by, "")) if j)
+        sql = (
+            f"SELECT {', '.join(select + measures)} FROM {table} {alias} {joins} "
+            f"WHERE {' AND '.join(where)} GROUP BY {ordinals} ORDER BY {ordinals}"
+        )
+        return sql, params, columns
+
+
+def _period_aligned(grain, start, end):
+    """True when [start, end] covers whole periods of `grain`, so rollups answer it exactly."""
+    last_day = end + datetime.timedelta(days=1)
+    if grain == "week":
+        return start.weekday() == 0 and last_day.weekday() == 0
+    return start.day == 1 and last_day == next_month(end.replace(day=1))
+
+
+def iter_rows(conn, query):
+    """Yields the column names, then result tuples read through a server-side cursor FETCH_SIZE at a time."""
+    sql, params, columns = query.to_sql()
+    yield columns
+    with conn.cursor(name="metrics_query") as cursor:
+        cursor.itersize = FETCH_SIZE
+        cursor.execute(sql, params)
+        for row in cursor:
+            yield row
+
+
+def iter_json(rows):
+    """
+    Encodes a columns-then-tuples stream as a JSON object with a `rows` array,
+    one chunk of text per row, so no list of dicts is ever built.
+    """
+    rows = iter(rows)
+    columns = next(rows)
+    yield '{"columns": ' + json.dumps(columns) + ', "rows": ['
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(dict(zip(columns, row)), default=_json_default)
+    yield "]}"
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ResponseCache:
+    """In-process LRU of encoded responses, bounded by total bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+_cache = ResponseCache(int(os.environ.get("METRICS_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
+
+
+def run_query(query, data_version, cache=None):
+    """
+    Returns (etag, body bytes) for `query`, from the cache when this version of
+    the tenant's data has been served before.
+    """
+    from loader import pooled_connection
+
+    cache = cache or _cache
+    etag = query.cache_key(data_version)
+    body = cache.get(etag)
+    if body is None:
+        with pooled_connection() as conn:
+            body = "".join(iter_json(iter_rows(conn, query))).encode()
+        cache.set(etag, body)
+    return etag, body
@@ -0,0 +1,300 @@
+import logging
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+# Columns produced for each fact table. Dimension natural keys (platform_campaign_id,
+# keyword_text, ...) stand in for surrogate keys; the loader resolves them.
+PERFORMANCE_COLUMNS = ("date", "platform_source", "platform_campaign_id", "campaign_name",
+                       "impressions", "clicks", "spend", "conversions", "conversion_value")
+SEARCH_COLUMNS = ("date", "keyword_text", "page_url", "device", "impressions", "clicks", "position", "ctr")
+
+# Meta reports purchases under several overlapping action types; the first one present wins
+# so the same purchase is not counted twice.
+META_PURCHASE_ACTIONS = ("omni_purchase", "purchase", "offsite_conversion.fb_pixel_purchase")
+
+
+class ColumnBatch:
+    """
+    A page of normalized rows stored column-wise as NumPy arrays.
+
+    `table` names the fact table the columns match, or is None for sources that
+    have no fact table yet (GA4). Both the loader and IntelligenceEngine consume
+    these directly; `to_frame` wraps the arrays without copying them.
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns, copy=False)
+
+    @staticmethod
+    def concat(batches):
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return None
+        names = batches[0].columns.keys()
+        return ColumnBatch(batches[0].table, {n: np.concatenate([b.columns[n] for b in batches]) for n in names})
+
+    def take(self, mask):
+        """The rows where boolean array `mask` is true."""
+        return ColumnBatch(self.table, {n: values[mask] for n, values in self.columns.items()})
+
+
+# --- Vectorized coercion ---
+
+def _numbers(values, scale=1.0):
+    """Coerces strings/None/numbers to float64 in one pass; unparseable values become 0."""
+    array = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64, na_value=0.0)
+    return array * scale if scale != 1.0 else array
+
+
+def _counts(values):
+    return np.rint(_numbers(values)).astype(np.int64)
+
+
+def _dates(values):
+    """
+    Parses date strings (YYYY-MM-DD, with or without a time part) to datetime64[D].
+    Missing or unparseable dates become NaT; `normalize` drops those rows.
+    """
+    return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce").to_numpy().astype("datetime64[D]")
+
+
+def _strings(values):
+    return np.array(values, dtype=object)
+
+
+def _action_value(actions, preferred=META_PURCHASE_ACTIONS):
+    if not actions:
+        return None
+    by_type = {a.get("action_type"): a.get("value") for a in actions}
+    for action_type in preferred:
+        if action_type in by_type:
+            return by_type[action_type]
+    return None
+
+
+def _action_total(value):
+    """
+    Meta returns `conversions` either as a number or as a list of actions. The list
+    overlaps (a purchase is also counted under its pixel and app types), so only the
+    preferred purchase type is taken, as for `action_values`.
+    """
+    if isinstance(value, list):
+        return _action_value(value)
+    return value
+
+
+# --- Normalizers ---
+
+class Normalizer(ABC):
+    """Turns one page of a platform's raw rows into a ColumnBatch."""
+    table = None
+    platform_source = None
+
+    @abstractmethod
+    def normalize(self, rows, fx_rate=1.0):
+        ...
+
+    def _performance(self, dates, campaign_ids, names, impressions, clicks, spend, conversions, value, fx_rate):
+        return ColumnBatch("fact_performance_daily", {
+            "date": _dates(dates),
+            "platform_source": np.full(len(dates), self.platform_source, dtype=object),
+            "platform_campaign_id": _strings(campaign_ids),
+            "campaign_name": _strings(names),
+            "impressions": _counts(impressions),
+            "clicks": _counts(clicks),
+            "spend": spend * fx_rate,
+            "conversions": _counts(conversions),
+            "conversion_value": value * fx_rate,
+        })
+
+
+class MetaNormalizer(Normalizer):
+    """`data[]` rows from /insights: numerics arrive as strings, purchases inside `action_values`."""
+    table = "fact_performance_daily"
+    platform_source = "Meta"
+
+    def normalize(self, rows, fx_rate=1.0):
+        return self._performance(
+            [r.get("date_start") for r in rows],
+            [r.get("campaign_id") for r in rows],
+            [r.get("campaign_name") for r in rows],
+            [r.get("impressions") for r in rows],
+            [r.get("clicks") for r in rows],
+            _numbers([r.get("spend") for r in rows]),
+            [_action_total(r.get("conversions")) for r in rows],
+            _numbers([_action_value(r.get("action_values")) for r in rows]),
+            fx_rate,
+        )
+
+
+class TikTokNormalizer(Normalizer):
+    """`data.list[]` rows with separate `dimensions` and `metrics` objects of strings."""
+    table = "fact_performance_daily"
+    platform_source = "TikTok"
+
+    def normalize(self, rows, fx_rate=1.0):
+        dims = [r.get("dimensions", {}) for r in rows]
+        metrics = [r.get("metrics", {}) for r in rows]
+        return self._performance(
+            [d.get("stat_time_day") for d in dims],
+            [d.get("campaign_id") for d in dims],
+            [m.get("campaign_name") for m in metrics],
+            [m.get("impressions") for m in metrics],
+            [m.get("clicks") for m in metrics],
+            _numbers([m.get("spend") for m in metrics]),
+            [m.get("conversion") for m in metrics],
+            _numbers([m.get("total_purchase_value") for m in metrics]),
+            fx_rate,
+        )
+
+
+class RedditNormalizer(Normalizer):
+    """Reporting rows; money fields are in micros of the account currency."""
+    table = "fact_performance_daily"
+    platform_source = "Reddit"
+
+    def normalize(self, rows, fx_rate=1.0):
+        return self._performance(
+            [r.get("date") for r in rows],
+            [r.get("campaign_id") for r in rows],
+            [r.get("campaign_name") for r in rows],
+            [r.get("impressions") for r in rows],
+            [r.get("clicks") for r in rows],
+            _numbers([r.get("spend") for r in rows], scale=1e-6),
+            [r.get("conversion") for r in rows],
+            _numbers([r.get("conversion_value") for r in rows], scale=1e-6),
+            fx_rate,
+        )
+
+
+class LinkedInNormalizer(Normalizer):
+    """
+    adAnalytics `elements[]` pivoted by CAMPAIGN; the campaign is the URN in `pivotValue(s)`.
+    `campaignName` is not part of the API response; ingestion adds it from adCampaigns.
+    """
+    table = "fact_performance_daily"
+    platform_source = "LinkedIn"
+
+    def normalize(self, rows, fx_rate=1.0):
+        starts = [r.get("dateRange", {}).get("start", {}) for r in rows]
+        urns = [r.get("pivotValue") or (r.get("pivotValues") or [None])[0] for r in rows]
+        return self._performance(
+            [f"{s.get('year')}-{s.get('month', 1):02d}-{s.get('day', 1):02d}" if s else None for s in starts],
+            [urn.rsplit(":", 1)[-1] if urn else None for urn in urns],
+            [r.get("campaignName") for r in rows],
+            [r.get("impressions") for r in rows],
+            [r.get("clicks") for r in rows],
+            _numbers([r.get("costInLocalCurrency") for r in rows]),
+            [r.get("externalWebsiteConversions") for r in rows],
+            _numbers([r.get("conversionValueInLocalCurrency") for r in rows]),
+            fx_rate,
+        )
+
+
+class MicrosoftAdsNormalizer(Normalizer):
+    """CSV rows from the CampaignPerformanceReport, keyed by report column name."""
+    table = "fact_performance_daily"
+    platform_source = "MicrosoftAds"
+
+    def normalize(self, rows, fx_rate=1.0):
+        return self._performance(
+            [r.get("TimePeriod") for r in rows],
+            [r.get("CampaignId") for r in rows],
+            [r.get("CampaignName") for r in rows],
+            [r.get("Impressions") for r in rows],
+            [r.get("Clicks") for r in rows],
+            _numbers([r.get("Spend") for r in rows]),
+            [r.get("Conversions") for r in rows],
+            _numbers([r.get("Revenue") for r in rows]),
+            fx_rate,
+        )
+
+
+class SearchConsoleNormalizer(Normalizer):
+    """`rows[]` from searchAnalytics.query; `keys` follow the order of the requested dimensions."""
+    table = "fact_search_daily"
+
+    def __init__(self, dimensions=("date", "query", "page", "device")):
+        self.dimensions = tuple(dimensions)
+
+    def normalize(self, rows, fx_rate=1.0):
+        keys = [r.get("keys", []) for r in rows]
+
+        def dimension(name):
+            if name not in self.dimensions:
+                return np.full(len(rows), None, dtype=object)
+            i = self.dimensions.index(name)
+            return _strings([k[i] if len(k) > i else None for k in keys])
+
+        return ColumnBatch(self.table, {
+            "date": _dates(dimension("date")),
+            "keyword_text": dimension("query"),
+            "page_url": dimension("page"),
+            "device": dimension("device"),
+            "impressions": _counts([r.get("impressions") for r in rows]),
+            "clicks": _counts([r.get("clicks") for r in rows]),
+            "position": _numbers([r.get("position") for r in rows]),
+            "ctr": _numbers([r.get("ctr") for r in rows]),
+        })
+
+
+class GA4Normalizer(Normalizer):
+    """
+    runReport `rows[]` of positional `dimensionValues`/`metricValues`.
+    GA4 has no fact table yet, so the batch keeps GA4's own dimension/metric names.
+    """
+    table = None
+
+    def __init__(self, dimensions=("date", "eventName"), metrics=("sessions", "totalUsers", "conversions")):
+        self.dimensions = tuple(dimensions)
+        self.metrics = tuple(metrics)
+
+    def normalize(self, rows, fx_rate=1.0):
+        dim_values = [r.get("dimensionValues", []) for r in rows]
+        metric_values = [r.get("metricValues", []) for r in rows]
+        columns = {}
+        for i, name in enumerate(self.dimensions):
+            values = [v[i].get("value") if len(v) > i else None for v in dim_values]
+            # GA4 dates are YYYYMMDD
+            columns[name] = _dates([f"{d[:4]}-{d[4:6]}-{d[6:]}" if d else None for d in values]) if name == "date" else _strings(values)
+        for i, name in enumerate(self.metrics):
+            columns[name] = _numbers([v[i].get("value") if len(v) > i else None for v in metric_values])
+        return ColumnBatch(self.table, columns)
+
+
+NORMALIZERS = {
+    'Meta': MetaNormalizer(),
+    'TikTok': TikTokNormalizer(),
+    'Reddit': RedditNormalizer(),
+    'LinkedIn': LinkedInNormalizer(),
+    'MicrosoftAds': MicrosoftAdsNormalizer(),
+    'GoogleSearchConsole': SearchConsoleNormalizer(),
+    'GoogleAnalytics': GA4Normalizer(),
+}
+
+
+def normalize(platform_id, rows, fx_rate=1.0):
+    """
+    Normalizes one page of `platform_id` rows. `fx_rate` converts money columns to the reporting currency.
+    Rows without a parseable date are dropped and logged: `date` is the fact tables' NOT NULL
+    partition key, and one NULL would fail the whole COPY far from the row that caused it.
+    """
+    batch = NORMALIZERS[platform_id].normalize(rows, fx_rate)
+    dates = batch.columns.get("date")
+    if dates is not None:
+        undated = np.isnat(dates)
+        if undated.any():
+            positions = np.flatnonzero(undated)
+            logging.warning(f"{platform_id}: dropped {len(positions)} of {len(batch)} rows without a valid date "
+                            f"(page rows {positions[:10].tolist()}; first: {rows[positions[0]]!r:.300})")
+            batch = batch.take(~undated)
+    return batch
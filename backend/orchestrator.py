@@ -0,0 +1,121 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Optional
+
+from ingestion import sync_platform
+
+# Concurrent jobs allowed per platform. Kept below each platform's documented
+# per-app limits so parallelism does not just turn into throttling.
+DEFAULT_PLATFORM_LIMITS = {
+    'Meta': 8,
+    'TikTok': 5,
+    'GoogleSearchConsole': 4,
+    'GoogleAnalytics': 4,
+    'LinkedIn': 4,
+    'Reddit': 2,
+    'MicrosoftAds': 4,
+}
+
+
+@dataclass
+class IngestionJob:
+    tenant_id: str
+    platform_id: str
+    account_id: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data.get(k) for k in cls.__dataclass_fields__})
+
+
+class IngestionOrchestrator:
+    """
+    Runs many (tenant, platform, account) ingestion jobs on a bounded thread pool.
+
+    Jobs are only handed to the pool when both the overall cap (`max_workers`)
+    and their platform's cap allow it, so a backlog of Meta jobs never starves
+    the other platforms and no worker thread sits blocked on a semaphore.
+    """
+
+    def __init__(self, token_provider, max_workers=16, platform_limits=None, default_platform_limit=2):
+        self.token_provider = token_provider
+        self.max_workers = max_workers
+        self.platform_limits = {**DEFAULT_PLATFORM_LIMITS, **(platform_limits or {})}
+        self.default_platform_limit = default_platform_limit
+
+    def run(self, jobs):
+        """Runs all jobs and returns one result dict per job, in input order."""
+        pending = {}
+        for index, job in enumerate(jobs):
+            pending.setdefault(job.platform_id, deque()).append((index, job))
+
+        results = [None] * len(jobs)
+        in_flight = {}
+        running = {platform_id: 0 for platform_id in pending}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or in_flight:
+                # Fill free slots, round-robin across platforms.
+                for platform_id in list(pending):
+                    queue = pending[platform_id]
+                    while (queue and len(in_flight) < self.max_workers
+                           and running[platform_id] < self._limit(platform_id)):
+                        index, job = queue.popleft()
+                        in_flight[pool.submit(self._run_job, job)] = (index, job)
+                        running[platform_id] += 1
+                    if not queue:
+                        del pending[platform_id]
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, job = in_flight.pop(future)
+                    running[job.platform_id] -= 1
+                    results[index] = future.result()
+
+        return results
+
+    def _limit(self, platform_id):
+        return max(1, self.platform_limits.get(platform_id, self.default_platform_limit))
+
+    def _run_job(self, job):
+        started = time.monotonic()
+        result = {
+            "tenant_id": job.tenant_id,
+            "platform_id": job.platform_id,
+            "account_id": job.account_id,
+        }
+        try:
+            token = self.token_provider(job.tenant_id, job.platform_id)
+            summary = sync_platform(job.tenant_id, job.platform_id, token, job.account_id,
+                                    job.start_date, job.end_date)
+            result.update(status="ok", rows=summary["rows"], message=summary["message"])
+            if "change_ratio" in summary:
+                result.update(written=summary["written"], unchanged=summary["unchanged"],
+                              change_ratio=summary["change_ratio"])
+        except Exception as e:
+            logging.error(f"Ingestion failed for {job.tenant_id}/{job.platform_id}/{job.account_id}: {str(e)}")
+            result.update(status="error", rows=0, error=str(e))
+        result["duration_s"] = round(time.monotonic() - started, 3)
+        return result
+
+
+def summarize(results):
+    """Aggregates per-job results into the response body of the batch endpoint."""
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    written = sum(r.get("written", 0) for r in results)
+    unchanged = sum(r.get("unchanged", 0) for r in results)
+    return {
+        "jobs": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "rows": sum(r["rows"] for r in results),
+        "written": written,
+        "unchanged": unchanged,
+        "change_ratio": round(written / (written + unchanged), 4) if written + unchanged else None,
+        "results": results,
+    }
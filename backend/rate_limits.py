@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from telemetry import RATE_LIMIT_WAIT_SECONDS
+
+# Meta reports quota usage (and the wait once it is used up) in these response headers.
+META_USAGE_HEADERS = ("x-business-use-case-usage", "x-ad-account-usage", "x-app-usage")
+# How far a usage header may report a quota used before we slow down (percent).
+USAGE_TARGET = 75.0
+# Slowdowns from usage headers expire after this long unless a later response renews them.
+ADAPT_TTL = 60.0
+# Rate multiplier after a throttling response.
+THROTTLED_FACTOR = 0.5
+
+
+@dataclass(frozen=True)
+class Quota:
+    """A token bucket: `rate` requests per second sustained, bursts of up to `burst`."""
+    scope: str  # "app" (one bucket per platform) or "account" (one per ad account, site or property)
+    rate: float
+    burst: float
+
+
+GSC_SITE_QPS = float(os.environ.get("GSC_SITE_QPS", 20))
+
+# Defaults from each platform's documented limits; usage headers and 429s tune them down at run time.
+DEFAULT_POLICIES = {
+    # Business Use Case limits are per ad account; x-business-use-case-usage reports how much is used.
+    'Meta': (Quota("account", 5.0, 10),),
+    # Reporting QPS is enforced per developer app.
+    'TikTok': (Quota("app", 10.0, 10),),
+    # 1,200 queries per minute per site and 40,000 per project.
+    'GoogleSearchConsole': (Quota("account", GSC_SITE_QPS, 5), Quota("app", 600.0, 50)),
+    'GoogleAnalytics': (Quota("account", 10.0, 10),),
+    'LinkedIn': (Quota("app", 5.0, 5),),
+    # x-ratelimit-remaining/-reset say how many calls are left in the current window.
+    'Reddit': (Quota("app", 1.0, 5),),
+    # Calls are limited per user token, across the customer's accounts.
+    'MicrosoftAds': (Quota("app", 5.0, 10),),
+}
+
+
+class InMemoryBucketStore:
+    """Buckets shared by the threads (and event loops) of one process."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}  # key -> [tokens (None: full), updated, factor, factor_until, blocked_until]
+        self._lock = threading.Lock()
+
+    def reserve(self, key, rate, burst, cost=1.0):
+        """
+        Takes `cost` tokens, going into debt if the bucket is short.
+        Returns the seconds the caller must wait before sending.
+        """
+        with self._lock:
+            now = self.clock()
+            state = self._buckets.setdefault(key, [None, now, 1.0, 0.0, 0.0])
+            tokens, updated, factor, factor_until, blocked_until = state
+            if tokens is None:
+                tokens = float(burst)
+            if factor_until <= now:
+                factor = 1.0
+            effective = rate * factor
+            tokens = min(float(burst), tokens + (now - updated) * effective) - cost
+            state[:3] = [tokens, now, factor]
+            wait = -tokens / effective if tokens < 0 else 0.0
+            return max(wait, blocked_until - now)
+
+    def adjust(self, key, factor=None, block_seconds=None, ttl=ADAPT_TTL):
+        """Scales the bucket's rate by `factor` for `ttl` seconds and/or pauses it for `block_seconds`."""
+        with self._lock:
+            now = self.clock()
+            state = self._buckets.setdefault(key, [None, now, 1.0, 0.0, 0.0])
+            if factor is not None:
+                state[2], state[3] = factor, now + ttl
+            if block_seconds:
+                state[4] = max(state[4], now + block_seconds)
+
+
+# KEYS[1] bucket hash; ARGV rate, burst, cost. Same algorithm as InMemoryBucketStore.reserve,
+# on the server's clock so instances with skewed clocks agree.
+_RESERVE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'factor', 'factor_until', 'blocked_until')
+local tokens = tonumber(s[1]) or burst
+local updated = tonumber(s[2]) or now
+local factor = tonumber(s[3]) or 1
+if (tonumber(s[4]) or 0) <= now then factor = 1 end
+local effective = rate * factor
+tokens = math.min(burst, tokens + (now - updated) * effective) - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now), 'factor', tostring(factor))
+redis.call('EXPIRE', KEYS[1], 3600)
+local wait = 0
+if tokens < 0 then wait = -tokens / effective end
+return tostring(math.max(wait, (tonumber(s[5]) or 0) - now))
+"""
+
+# KEYS[1] bucket hash; ARGV factor ('' to keep), block seconds, ttl.
+_ADJUST_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+if ARGV[1] ~= '' then
+    redis.call('HSET', KEYS[1], 'factor', ARGV[1], 'factor_until', tostring(now + tonumber(ARGV[3])))
+end
+local block = tonumber(ARGV[2])
+if block > 0 then
+    local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(math.max(blocked, now + block)))
+end
+redis.call('EXPIRE', KEYS[1], 3600)
+return 1
+"""
+
+
+class RedisBucketStore:
+    """
+    Buckets in Redis (or any server speaking its protocol with Lua scripting),
+    so every function instance draws on the same quota. Each reservation is one
+    atomic script call.
+    """
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._reserve = client.register_script(_RESERVE_SCRIPT)
+        self._adjust = client.register_script(_ADJUST_SCRIPT)
+
+    def reserve(self, key, rate, burst, cost=1.0):
+        return float(self._reserve(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+    def adjust(self, key, factor=None, block_seconds=None, ttl=ADAPT_TTL):
+        self._adjust(keys=[self.prefix + key], args=["" if factor is None else factor, block_seconds or 0, ttl])
+
+
+class RateLimiter:
+    """
+    Schedules platform calls under token buckets keyed by platform, app and account.
+
+    `acquire(platform, account)` blocks until every bucket the platform's policy
+    applies to that call has a token; `acquire_async` does the same without
+    blocking the event loop. Waits are reserved up front, so concurrent callers
+    queue behind each other instead of all retrying at once. `observe` feeds
+    response headers back: usage headers slow a bucket down as its quota fills,
+    and 429s or Meta's `estimated_time_to_regain_access` pause it for everyone.
+    """
+
+    def __init__(self, store=None, policies=None, sleep=time.sleep):
+        self.store = store or InMemoryBucketStore()
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.sleep = sleep
+
+    def buckets(self, platform, account=None):
+        """(key, quota) for each bucket a call to `platform` for `account` draws on."""
+        buckets = []
+        for quota in self.policies.get(platform, ()):
+            if quota.scope == "app":
+                buckets.append((f"{platform}:app", quota))
+            elif account is not None:
+                buckets.append((f"{platform}:account:{account}", quota))
+        return buckets
+
+    def reserve(self, platform, account=None, cost=1.0):
+        """Reserves the call's tokens and returns how long to wait before making it."""
+        return max((self.store.reserve(key, q.rate, q.burst, cost) for key, q in self.buckets(platform, account)),
+                   default=0.0)
+
+    def acquire(self, platform, account=None, cost=1.0):
+        wait = self.reserve(platform, account, cost)
+        if wait > 0:
+            RATE_LIMIT_WAIT_SECONDS.inc(wait, platform=platform)
+            self.sleep(wait)
+        return wait
+
+    async def acquire_async(self, platform, account=None, cost=1.0):
+        wait = await asyncio.to_thread(self.reserve, platform, account, cost)
+        if wait > 0:
+            RATE_LIMIT_WAIT_SECONDS.inc(wait, platform=platform)
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, platform, account, headers, throttled=False, retry_after=None):
+        """
+        Adapts the call's buckets to what the platform said about its quota: usage
+        headers scale their rate, a throttled response halves it and pauses them
+        for `retry_after` seconds (or Meta's regain-access estimate).
+        """
+        block = _regain_seconds(headers)
+        if throttled:
+            block = max(block, retry_after or 1.0)
+        for key, quota in self.buckets(platform, account):
+            factor = THROTTLED_FACTOR if throttled else _usage_factor(headers, quota.rate)
+            if factor is not None or block:
+                self.store.adjust(key, factor=factor, block_seconds=block)
+        if block:
+            logging.warning(f"{platform} quota exhausted, pausing {account or 'app'} calls for {block:.1f}s")
+
+
+def _usage_factor(headers, rate):
+    """
+    Rate multiplier from usage headers: 1.0 below USAGE_TARGET percent used, falling
+    to 0.05 as usage approaches 100%. With x-ratelimit-remaining/-reset the calls left
+    are spread evenly over the rest of the window (an empty window is a pause, see
+    `_regain_seconds`). None when nothing was reported.
+    """
+    used = meta_usage(headers)[0]
+    if used is not None:
+        return 1.0 if used < USAGE_TARGET else max(0.05, (100.0 - used) / (100.0 - USAGE_TARGET))
+    remaining, reset = headers.get("x-ratelimit-remaining"), headers.get("x-ratelimit-reset")
+    if remaining is None or reset is None:
+        return None
+    try:
+        remaining, reset = float(remaining), float(reset)
+    except ValueError:
+        return None
+    if reset <= 0 or remaining < 1:
+        return None
+    return max(0.05, min(1.0, remaining / reset / rate))
+
+
+def meta_usage(headers):
+    """
+    (highest percentage used, seconds until access is regained) from Meta's
+    x-business-use-case-usage, x-ad-account-usage and x-app-usage headers. The
+    first is {"<id>": [{...}]}, the others are flat objects. The percentage is
+    None when no usage was reported; the wait is 0 when access is not blocked.
+    """
+    percents, regain_minutes = [], 0
+    for header in META_USAGE_HEADERS:
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            usage = json.loads(value)
+        except ValueError:
+            continue
+        if not isinstance(usage, dict):
+            continue
+        entries = [usage] + [e for v in usage.values() if isinstance(v, list) for e in v if isinstance(e, dict)]
+        for entry in entries:
+            for field in ("call_count", "total_cputime", "total_time", "acc_id_util_pct"):
+                if isinstance(entry.get(field), (int, float)):
+                    percents.append(float(entry[field]))
+            regain_minutes = max(regain_minutes, entry.get("estimated_time_to_regain_access") or 0)
+    return (max(percents) if percents else None), regain_minutes * 60.0
+
+
+def _regain_seconds(headers):
+    """
+    Seconds until the quota is available again: Meta's `estimated_time_to_regain_access`,
+    or the reset of an exhausted x-ratelimit window. 0 when not blocked.
+    """
+    try:
+        if float(headers.get("x-ratelimit-remaining", 1)) < 1:
+            return float(headers.get("x-ratelimit-reset", 0))
+    except ValueError:
+        pass
+    return meta_usage(headers)[1]
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    The process-wide limiter. With RATE_LIMIT_REDIS_URL set, buckets live in Redis
+    and are shared by every instance; otherwise they are per process.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                url = os.environ.get("RATE_LIMIT_REDIS_URL")
+                store = None
+                if url:
+                    import redis
+                    store = RedisBucketStore(redis.Redis.from_url(url))
+                _rate_limiter = RateLimiter(store)
+    return _rate_limiter
@@ -0,0 +1,102 @@
+import datetime
+
+GRAINS = ("week", "month")
+
+
+class Rollup:
+    """
+    A weekly/monthly aggregate of one fact table per tenant and `group_columns`.
+    `measures` maps rollup columns to the SQL aggregate computing them.
+    """
+
+    def __init__(self, table, fact_table, group_columns, measures):
+        self.table = table
+        self.fact_table = fact_table
+        self.group_columns = tuple(group_columns)
+        self.measures = dict(measures)
+
+
+_SEARCH_MEASURES = {
+    "impressions": "SUM(impressions)",
+    "clicks": "SUM(clicks)",
+    # Impression-weighted, as GSC itself averages position.
+    "position": "SUM(position * impressions) / NULLIF(SUM(impressions), 0)",
+    "ctr": "SUM(clicks)::DECIMAL / NULLIF(SUM(impressions), 0)",
+}
+
+ROLLUP_CAMPAIGN = Rollup("rollup_campaign", "fact_performance_daily", ("campaign_key",), {
+    "impressions": "SUM(impressions)",
+    "clicks": "SUM(clicks)",
+    "spend": "SUM(spend)",
+    "conversions": "SUM(conversions)",
+    "conversion_value": "SUM(conversion_value)",
+})
+ROLLUP_KEYWORD = Rollup("rollup_keyword", "fact_search_daily", ("keyword_key",), _SEARCH_MEASURES)
+ROLLUP_SEARCH_PAGE = Rollup("rollup_search_page", "fact_search_daily", ("page_url",), _SEARCH_MEASURES)
+ROLLUP_ORGANIC_PAGE = Rollup("rollup_organic_page", "fact_organic_daily", ("page_key",), {
+    "followers_total": "MAX(followers_total)",
+    "followers_gained": "SUM(followers_gained)",
+    "page_views": "SUM(page_views)",
+    "engagement_rate": "AVG(engagement_rate)",
+})
+
+ROLLUPS = (ROLLUP_CAMPAIGN, ROLLUP_KEYWORD, ROLLUP_SEARCH_PAGE, ROLLUP_ORGANIC_PAGE)
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(month):
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def period_bounds(grain, month):
+    """
+    [start, end) of the periods of `grain` that overlap `month`. Weeks start on Monday
+    (Postgres' date_trunc('week')), so a month's weeks can reach into its neighbours.
+    """
+    start, end = month, next_month(month)
+    if grain == "week":
+        start -= datetime.timedelta(days=start.weekday())
+        end += datetime.timedelta(days=(7 - end.weekday()) % 7)
+    return start, end
+
+
+def refresh_rollups(cursor, fact_table, tenant_id, months):
+    """
+    Rebuilds every rollup of `fact_table` for one tenant over the weeks and months
+    overlapping `months`, from the fact rows. Other tenants and periods are untouched.
+
+    Refreshes of one tenant's rollup are serialized for the rest of the transaction:
+    the rollup tables have no unique key, so two interleaved DELETE + INSERTs would
+    both commit and double the rows. The lock covers the whole tenant rather than a
+    month because a month's weeks reach into its neighbours.
+    """
+    for rollup in ROLLUPS:
+        if rollup.fact_table != fact_table:
+            continue
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s), hashtext(%s))", (rollup.table, str(tenant_id)))
+        for month in sorted(months):
+            for grain in GRAINS:
+                _refresh(cursor, rollup, tenant_id, grain, *period_bounds(grain, month))
+
+
+def _refresh(cursor, rollup, tenant_id, grain, start, end):
+    groups = ", ".join(rollup.group_columns)
+    measures = ", ".join(rollup.measures)
+    aggregates = ", ".join(rollup.measures.values())
+    cursor.execute(
+        f"DELETE FROM {rollup.table} WHERE tenant_id = %s AND grain = %s AND period_start >= %s AND period_start < %s",
+        (tenant_id, grain, start, end)
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {rollup.table} (tenant_id, grain, period_start, {groups}, {measures})
+        SELECT tenant_id, %s, date_trunc(%s, date)::date AS period_start, {groups}, {aggregates}
+        FROM {rollup.fact_table}
+        WHERE tenant_id = %s AND date >= %s AND date < %s
+        GROUP BY tenant_id, period_start, {groups}
+        """,
+        (grain, grain, tenant_id, start, end)
+    )
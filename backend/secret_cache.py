@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class KeyVaultSecretSource:
+    """Reads secrets from Azure Key Vault with one credential and client for the life of the process."""
+
+    def __init__(self, vault_url):
+        from azure.identity import DefaultAzureCredential
+        from azure.keyvault.secrets import SecretClient
+
+        self.client = SecretClient(vault_url=vault_url, credential=DefaultAzureCredential())
+
+    def get(self, name):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self.client.get_secret(name).value
+        except ResourceNotFoundError:
+            logging.error(f"Secret {name} not found.")
+            return None
+
+
+class InMemorySecretSource:
+    """
+    Local fake vault backed by a dict. Used when no Key Vault is configured and in tests.
+    `default` is returned for unknown names; `latency` simulates the network round trip.
+    """
+
+    def __init__(self, secrets=None, default=None, latency=0.0):
+        self.secrets = dict(secrets or {})
+        self.default = default
+        self.latency = latency
+        self.calls = 0
+
+    def get(self, name):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.secrets.get(name, self.default)
+
+
+class SecretCache:
+    """
+    Process-wide TTL + LRU cache in front of a secret source.
+
+    Concurrent lookups of the same missing name share one fetch. Not-found
+    results are cached for `negative_ttl` so a missing token does not cost a
+    round trip on every job.
+    """
+
+    def __init__(self, source, ttl=900, negative_ttl=60, max_entries=1024, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # name -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._inflight = {}  # name -> lock held by the thread fetching it
+
+    def get(self, name):
+        value, hit = self._lookup(name)
+        if hit:
+            return value
+
+        with self._lock:
+            fetch_lock = self._inflight.setdefault(name, threading.Lock())
+        with fetch_lock:
+            # Another thread may have filled the entry while we waited.
+            value, hit = self._lookup(name)
+            if hit:
+                return value
+            try:
+                value = self.source.get(name)
+                self._store(name, value)
+            finally:
+                with self._lock:
+                    self._inflight.pop(name, None)
+            return value
+
+    def prefetch(self, names, max_workers=16):
+        """Resolves many names in parallel, skipping ones already cached. Returns {name: value}."""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as pool:
+            return dict(zip(names, pool.map(self.get, names)))
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def _lookup(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None, False
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[name]
+                return None, False
+            self._entries.move_to_end(name)
+            return value, True
+
+    def _store(self, name, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[name] = (value, self.clock() + ttl)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_secret_cache():
+    """Returns the process-wide cache, backed by Key Vault when KEY_VAULT_NAME is set."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                key_vault_name = os.environ.get("KEY_VAULT_NAME")
+                if key_vault_name:
+                    source = KeyVaultSecretSource(f"https://{key_vault_name}.vault.azure.net")
+                else:
+                    source = InMemorySecretSource(default="mock-secret-value")
+                _cache = SecretCache(source, ttl=int(os.environ.get("SECRET_CACHE_TTL_SECONDS", 900)))
+    return _cache
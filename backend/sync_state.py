@@ -0,0 +1,185 @@
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Days before the high-water mark that are refetched on every run, because the
+# platform keeps restating them (attribution windows, late conversions, GSC lag).
+RESTATEMENT_LOOKBACK_DAYS = {
+    'Meta': 7,  # default 7-day click attribution window
+    'TikTok': 7,
+    'GoogleSearchConsole': 3,
+    'GoogleAnalytics': 3,
+    'LinkedIn': 7,
+    'Reddit': 3,
+    'MicrosoftAds': 7,
+}
+
+INITIAL_BACKFILL_DAYS = int(os.environ.get("SYNC_INITIAL_BACKFILL_DAYS", 90))
+
+
+def plan_window(high_water_mark, today, lookback_days, initial_days=INITIAL_BACKFILL_DAYS):
+    """
+    Returns the (start, end) dates to fetch, or None when there is nothing to do.
+    `end` is yesterday, the last complete day. A source that has never synced
+    starts `initial_days` back; otherwise the window starts `lookback_days`
+    before the day after the high-water mark.
+    """
+    end = today - datetime.timedelta(days=1)
+    if high_water_mark is None:
+        start = end - datetime.timedelta(days=initial_days - 1)
+    else:
+        start = high_water_mark + datetime.timedelta(days=1 - lookback_days)
+    if start > end:
+        return None
+    return start, end
+
+
+def chunk_range(start, end, chunk_days):
+    """Splits [start, end] into consecutive inclusive (start, end) chunks of at most `chunk_days`."""
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + datetime.timedelta(days=chunk_days - 1))
+        chunks.append((start, chunk_end))
+        start = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+class InMemorySyncStateStore:
+    """Watermarks kept in process memory. Used when no database is configured."""
+
+    def __init__(self):
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id, platform_id, account_id):
+        with self._lock:
+            return self._marks.get((tenant_id, platform_id, account_id))
+
+    def advance(self, tenant_id, platform_id, account_id, high_water_mark):
+        with self._lock:
+            key = (tenant_id, platform_id, account_id)
+            current = self._marks.get(key)
+            self._marks[key] = max(current, high_water_mark) if current else high_water_mark
+
+
+class PostgresSyncStateStore:
+    """
+    Watermarks in the `sync_state` table. Each call borrows its own connection from
+    `connection` (loader.pooled_connection by default), so a failed statement is
+    rolled back instead of breaking every later sync in the process.
+    """
+
+    def __init__(self, connection=None):
+        if connection is None:
+            from loader import pooled_connection
+            connection = pooled_connection
+        self.connection = connection
+
+    def get(self, tenant_id, platform_id, account_id):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT high_water_mark FROM sync_state WHERE tenant_id = %s AND platform_id = %s AND account_id = %s",
+                (tenant_id, platform_id, account_id)
+            )
+            row = cursor.fetchone()
+            conn.commit()
+            return row[0] if row else None
+
+    def advance(self, tenant_id, platform_id, account_id, high_water_mark):
+        # GREATEST keeps the mark monotonic when a shorter manual re-sync finishes later.
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO sync_state (tenant_id, platform_id, account_id, high_water_mark, updated_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (tenant_id, platform_id, account_id) DO UPDATE
+                SET high_water_mark = GREATEST(sync_state.high_water_mark, EXCLUDED.high_water_mark),
+                    updated_at = now()
+                """,
+                (tenant_id, platform_id, account_id, high_water_mark)
+            )
+            conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sync_state_store():
+    """Process-wide store: Postgres when a database is configured, otherwise in memory."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from loader import database_configured
+                if database_configured():
+                    _store = PostgresSyncStateStore()
+                else:
+                    _store = InMemorySyncStateStore()
+    return _store
+
+
+class IncrementalSync:
+    """
+    Fetches only the days a source is missing, plus its restatement lookback.
+
+    The window is split into `chunk_days` chunks fetched by up to `max_workers`
+    threads. The watermark then advances to the end of the longest run of
+    chunks that completed from the start of the window, so a failed backfill
+    resumes from its first failed chunk on the next run.
+    """
+
+    def __init__(self, store, chunk_days=7, max_workers=4, lookback_days=None, initial_days=INITIAL_BACKFILL_DAYS):
+        self.store = store
+        self.chunk_days = chunk_days
+        self.max_workers = max_workers
+        self.lookback_days = {**RESTATEMENT_LOOKBACK_DAYS, **(lookback_days or {})}
+        self.initial_days = initial_days
+
+    def run(self, tenant_id, platform_id, account_id, fetch_chunk, today=None):
+        """
+        `fetch_chunk(start_date, end_date)` is called with ISO date strings and returns
+        an ingestion summary dict with a `rows` count. Returns a summary of the sync.
+        """
+        today = today or datetime.date.today()
+        high_water_mark = self.store.get(tenant_id, platform_id, account_id)
+        window = plan_window(high_water_mark, today, self.lookback_days.get(platform_id, 3), self.initial_days)
+        if window is None:
+            return {"rows": 0, "chunks": 0, "high_water_mark": _iso(high_water_mark),
+                    "message": f"{platform_id} already up to date"}
+
+        chunks = chunk_range(window[0], window[1], self.chunk_days)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+            futures = [pool.submit(fetch_chunk, start.isoformat(), end.isoformat()) for start, end in chunks]
+
+            rows, written, unchanged, completed_through, error = 0, 0, 0, None, None
+            for (start, end), future in zip(chunks, futures):
+                try:
+                    summary = future.result()
+                    rows += summary["rows"]
+                    written += summary.get("written", 0)
+                    unchanged += summary.get("unchanged", 0)
+                except Exception as e:
+                    logging.error(f"Sync chunk {start}..{end} failed for {tenant_id}/{platform_id}/{account_id}: {str(e)}")
+                    error = error or e
+                    continue
+                if error is None:
+                    completed_through = end
+
+        if completed_through:
+            self.store.advance(tenant_id, platform_id, account_id, completed_through)
+        if error is not None:
+            raise error
+
+        summary = {"rows": rows, "chunks": len(chunks), "high_water_mark": completed_through.isoformat(),
+                   "message": f"{platform_id} synced {window[0]}..{window[1]}: {rows} rows in {len(chunks)} chunks"}
+        if written or unchanged:
+            summary.update(written=written, unchanged=unchanged, change_ratio=round(written / (written + unchanged), 4))
+            summary["message"] += f" ({written} new or changed, {unchanged} unchanged)"
+        return summary
+
+
+def _iso(date):
+    return date.isoformat() if date else None
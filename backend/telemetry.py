@@ -0,0 +1,247 @@
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager, nullcontext
+
+# In-process counters and histograms, rendered in the Prometheus text format by
+# the telemetry/metrics endpoint. Recording is a dict update under a per-metric
+# lock, so it stays on in production; TELEMETRY_ENABLED=false turns it off.
+ENABLED = os.environ.get("TELEMETRY_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_bound(bound)}, cumulative
+            yield f"{self.name}_sum", labels, state[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text else f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "connector_http_request_seconds", "Platform API request latency per attempt.", ("platform", "endpoint", "status")))
+HTTP_RESPONSE_BYTES = REGISTRY.register(Counter(
+    "connector_http_response_bytes_total", "Response bytes received from platform APIs.", ("platform", "endpoint")))
+HTTP_RETRIES = REGISTRY.register(Counter(
+    "connector_http_retries_total", "Platform API retries by reason.", ("platform", "endpoint", "reason")))
+HTTP_RETRY_WAIT_SECONDS = REGISTRY.register(Counter(
+    "connector_http_retry_wait_seconds_total", "Time slept before retries; reason=throttled is rate limiting.",
+    ("platform", "reason")))
+CONNECTOR_PAGES = REGISTRY.register(Counter(
+    "connector_pages_total", "Pages yielded by connectors.", ("platform",)))
+CONNECTOR_ROWS = REGISTRY.register(Counter(
+    "connector_rows_total", "Raw rows yielded by connectors.", ("platform",)))
+INGEST_SECONDS = REGISTRY.register(Histogram(
+    "ingestion_run_seconds", "Duration of one platform ingestion.", ("platform", "outcome")))
+NORMALIZE_SECONDS = REGISTRY.register(Histogram(
+    "ingestion_normalize_seconds", "Time normalizing one page.", ("platform",)))
+LOAD_SECONDS = REGISTRY.register(Histogram(
+    "loader_write_seconds", "Time writing to Postgres: COPY batches and rollup refreshes.", ("table", "stage")))
+LOAD_ROWS = REGISTRY.register(Counter(
+    "loader_rows_total", "Rows written to fact tables.", ("table",)))
+LOAD_UNCHANGED_ROWS = REGISTRY.register(Counter(
+    "loader_unchanged_rows_total", "Reloaded rows skipped because their content hash matched the stored row.",
+    ("table",)))
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(Counter(
+    "rate_limit_wait_seconds_total", "Time connectors waited for a platform rate-limit bucket.", ("platform",)))
+LLM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "llm_request_seconds", "Chat completion latency.", ("deployment", "outcome")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens reported by the model, by kind (prompt, completion).", ("deployment", "kind")))
+LLM_WAIT_SECONDS = REGISTRY.register(Counter(
+    "llm_rate_limit_wait_seconds_total", "Time waiting for the in-flight cap and tokens-per-minute budget.",
+    ("deployment",)))
+
+
+# --- HTTP labels ---
+
+HOST_PLATFORMS = {
+    "graph.facebook.com": "Meta",
+    "business-api.tiktok.com": "TikTok",
+    "ads-api.reddit.com": "Reddit",
+    "api.linkedin.com": "LinkedIn",
+    "www.googleapis.com": "GoogleSearchConsole",
+    "searchconsole.googleapis.com": "GoogleSearchConsole",
+    "analyticsdata.googleapis.com": "GoogleAnalytics",
+    "bingads.microsoft.com": "MicrosoftAds",
+}
+
+_VERSION_SEGMENT = re.compile(r"v\d+(\.\d+)*")
+_ID_SEGMENT = re.compile(r"\d.*|.*\d.*\d.*|.*%.*")
+
+
+@functools.lru_cache(maxsize=4096)
+def endpoint_labels(url):
+    """
+    (platform, endpoint) for a request URL. Path segments naming accounts, sites or
+    reports (starting with a digit, holding two or more, or URL-escaped; API versions
+    excepted) become `{id}`, so the endpoint label stays low-cardinality.
+    """
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or ""
+    platform = next((p for h, p in HOST_PLATFORMS.items() if host == h or host.endswith("." + h)), host)
+    segments = []
+    for segment in parts.path.split("/"):
+        name, colon, method = segment.partition(":")
+        if _ID_SEGMENT.fullmatch(name) and not _VERSION_SEGMENT.fullmatch(name):
+            name = "{id}"
+        segments.append(name + colon + method)
+    return platform, "/".join(segments)
+
+
+def record_http(url, status, elapsed, response_bytes=0):
+    platform, endpoint = endpoint_labels(url.split("?", 1)[0])
+    HTTP_REQUEST_SECONDS.observe(elapsed, platform=platform, endpoint=endpoint, status=status or "error")
+    if response_bytes:
+        HTTP_RESPONSE_BYTES.inc(response_bytes, platform=platform, endpoint=endpoint)
+
+
+def record_retry(url, reason, delay):
+    platform, endpoint = endpoint_labels(url.split("?", 1)[0])
+    HTTP_RETRIES.inc(platform=platform, endpoint=endpoint, reason=reason)
+    HTTP_RETRY_WAIT_SECONDS.inc(delay, platform=platform, reason=reason)
+
+
+def record_page(platform, rows):
+    CONNECTOR_PAGES.inc(platform=platform)
+    CONNECTOR_ROWS.inc(rows, platform=platform)
+
+
+# --- Spans ---
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """The OpenTelemetry tracer when the SDK is installed (e.g. with Azure Monitor), else None."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                try:
+                    from opentelemetry import trace
+                    _tracer = trace.get_tracer("marketing-lens")
+                except ImportError:
+                    _tracer = False
+    return _tracer or None
+
+
+@contextmanager
+def span(name, histogram=None, **attributes):
+    """
+    Times a block as a span. The duration is observed into `histogram`, labelled from
+    `attributes` (plus `outcome`, ok or error, when the histogram has that label).
+    With OpenTelemetry installed the block also runs inside a real span of that name.
+    """
+    if not ENABLED:
+        yield
+        return
+    tracer = get_tracer()
+    attributes_text = {k: str(v) for k, v in attributes.items()}
+    with tracer.start_as_current_span(name, attributes=attributes_text) if tracer else nullcontext():
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if histogram is not None:
+                histogram.observe(time.perf_counter() - started, outcome=outcome, **attributes)
+
+
+def render():
+    return REGISTRY.render()
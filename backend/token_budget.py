@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from collections import deque
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to a character heuristic
+    tiktoken = None
+
+# Average characters per token for English text and Markdown tables.
+CHARS_PER_TOKEN = 4
+
+_encodings = {}
+
+
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def estimate_tokens(text, model="gpt-4o"):
+    """Token count for `text`, using tiktoken when installed and ~4 chars/token otherwise."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_markdown_table(markdown, token_budget, model="gpt-4o"):
+    """
+    Splits a Markdown table into tables of at most `token_budget` tokens each.
+    Every chunk repeats the header and separator lines. A single row larger than
+    the budget still gets a chunk of its own.
+    """
+    lines = markdown.splitlines()
+    header, rows = lines[:2], lines[2:]
+    header_tokens = sum(estimate_tokens(line, model) for line in header)
+
+    chunks, current, used = [], [], header_tokens
+    for row in rows:
+        cost = estimate_tokens(row, model)
+        if current and used + cost > token_budget:
+            chunks.append("\n".join(header + current))
+            current, used = [], header_tokens
+        current.append(row)
+        used += cost
+    if current or not chunks:
+        chunks.append("\n".join(header + current))
+    return chunks
+
+
+class TokensPerMinuteLimiter:
+    """
+    Sliding one-minute window over tokens sent to the model.
+    `acquire(tokens)` blocks until the request fits under `tokens_per_minute`.
+    """
+
+    def __init__(self, tokens_per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self._spent = deque()  # (timestamp, tokens)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        # A request bigger than the whole budget would wait forever; let it through alone.
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = self.clock()
+                while self._spent and self._spent[0][0] <= now - 60:
+                    self._total -= self._spent.popleft()[1]
+                if self._total + tokens <= self.tokens_per_minute:
+                    self._spent.append((now, tokens))
+                    self._total += tokens
+                    return
+                wait = self._spent[0][0] + 60 - now
+            logging.info(f"Token budget exhausted, waiting {wait:.1f}s")
+            self.sleep(wait)
@@ -0,0 +1,532 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import asdict, dataclass
+
+from ingestion import DEFAULT_ACCOUNTS, UnknownPlatformError, ingest_platform
+from sync_state import RESTATEMENT_LOOKBACK_DAYS, INITIAL_BACKFILL_DAYS, chunk_range, get_sync_state_store, plan_window
+
+# Dead-lettered items go to "<name>-poison", where the Functions runtime puts messages it gives up on.
+QUEUE_NAME = os.environ.get("INGEST_QUEUE_NAME", "ingest-work-items")
+# Deliveries before an item is dead-lettered; keep at or below host.json's queues.maxDequeueCount (default 5).
+MAX_DEQUEUE_COUNT = int(os.environ.get("INGEST_MAX_DEQUEUE_COUNT", 5))
+# Days per work item. Small enough that one item finishes well inside the function timeout.
+WORK_ITEM_DAYS = int(os.environ.get("INGEST_WORK_ITEM_DAYS", 7))
+# How long a received message stays hidden from other workers while it is processed.
+VISIBILITY_TIMEOUT = int(os.environ.get("INGEST_VISIBILITY_TIMEOUT", 600))
+
+
+@dataclass
+class WorkItem:
+    """One queued shard of an ingestion run: a tenant's platform account over a few days."""
+    run_id: str
+    seq: int
+    tenant_id: str
+    platform_id: str
+    account_id: str
+    start_date: str
+    end_date: str
+    incremental: bool = False
+
+    @property
+    def key(self):
+        return (self.run_id, self.seq)
+
+    def to_message(self):
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_message(cls, text):
+        data = json.loads(text)
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if k in data})
+
+
+def plan_work_items(tenant_id, platform_id, account_id=None, start_date=None, end_date=None,
+                    chunk_days=WORK_ITEM_DAYS, sync_store=None, today=None):
+    """
+    Splits one tenant/platform/account ingestion into consecutive WorkItems of
+    `chunk_days` days. Without explicit dates the window is the days missing since
+    the stored high-water mark plus the restatement lookback, and the run advances
+    the mark as its items complete. Returns [] when the source is up to date.
+    """
+    if platform_id not in DEFAULT_ACCOUNTS:
+        raise UnknownPlatformError(f"Unknown Platform: {platform_id}")
+    account_id = account_id or DEFAULT_ACCOUNTS[platform_id]
+
+    incremental = not (start_date and end_date)
+    if incremental:
+        sync_store = sync_store or get_sync_state_store()
+        high_water_mark = sync_store.get(tenant_id, platform_id, account_id)
+        window = plan_window(high_water_mark, today or datetime.date.today(),
+                             RESTATEMENT_LOOKBACK_DAYS.get(platform_id, 3), INITIAL_BACKFILL_DAYS)
+        if window is None:
+            return []
+        start, end = window
+    else:
+        start, end = datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
+
+    run_id = str(uuid.uuid4())
+    return [
+        WorkItem(run_id, seq, tenant_id, platform_id, account_id, chunk_start.isoformat(), chunk_end.isoformat(),
+                 incremental)
+        for seq, (chunk_start, chunk_end) in enumerate(chunk_range(start, end, chunk_days))
+    ]
+
+
+def enqueue_ingestion(jobs, queue=None, store=None, chunk_days=WORK_ITEM_DAYS):
+    """
+    Plans every IngestionJob into work items, records them in the checkpoint store
+    and sends them to the queue. Returns one summary per job with its `run_id`.
+    """
+    queue = get_work_queue() if queue is None else queue
+    store = store or get_checkpoint_store()
+    runs = []
+    for job in jobs:
+        items = plan_work_items(job.tenant_id, job.platform_id, job.account_id, job.start_date, job.end_date,
+                                chunk_days)
+        store.add(items)
+        for item in items:
+            queue.send(item.to_message())
+        runs.append({
+            "run_id": items[0].run_id if items else None,
+            "tenant_id": job.tenant_id,
+            "platform_id": job.platform_id,
+            "items": len(items),
+            "date_range": [items[0].start_date, items[-1].end_date] if items else None,
+        })
+    return runs
+
+
+# --- Checkpoints ---
+
+class InMemoryCheckpointStore:
+    """Work item progress kept in process memory. Used when no database is configured."""
+
+    def __init__(self):
+        self._items = {}  # (run_id, seq) -> {"item", "status", "cursor", "rows", "attempts", "error"}
+        self._lock = threading.Lock()
+
+    def add(self, items):
+        with self._lock:
+            for item in items:
+                self._items.setdefault(item.key, {"item": item, "status": "queued", "cursor": None, "rows": 0,
+                                                  "attempts": 0, "error": None})
+
+    def start(self, item):
+        """Marks a delivery of `item` and returns its state: `status`, resume `cursor` and `rows` so far."""
+        with self._lock:
+            state = self._items.setdefault(item.key, {"item": item, "status": "queued", "cursor": None, "rows": 0,
+                                                      "attempts": 0, "error": None})
+            if state["status"] not in ("done", "dead"):
+                state["status"] = "running"
+                state["attempts"] += 1
+            return {k: state[k] for k in ("status", "cursor", "rows")}
+
+    def save(self, item, cursor, rows):
+        with self._lock:
+            self._items[item.key].update(cursor=cursor, rows=rows)
+
+    def finish(self, item, rows):
+        with self._lock:
+            self._items[item.key].update(status="done", cursor=None, rows=rows, error=None)
+
+    def fail(self, item, error, dead=False):
+        with self._lock:
+            self._items[item.key].update(status="dead" if dead else "queued", error=error)
+
+    def completed_through(self, run_id):
+        """End date of the longest run of done items from the start of the run, or None."""
+        with self._lock:
+            states = sorted((s for (r, _), s in self._items.items() if r == run_id), key=lambda s: s["item"].seq)
+            return _completed_through([(s["item"].end_date, s["status"]) for s in states])
+
+    def run_status(self, run_id):
+        with self._lock:
+            states = sorted((s for (r, _), s in self._items.items() if r == run_id), key=lambda s: s["item"].seq)
+            return [_status_row(s["item"].seq, s["item"].start_date, s["item"].end_date, s["status"], s["rows"],
+                                s["attempts"], s["error"]) for s in states]
+
+
+class PostgresCheckpointStore:
+    """
+    Work item progress in the `ingest_work_items` table. Cursors are stored as JSON.
+    Each call borrows its own connection from `connection` (loader.pooled_connection
+    by default), so worker threads don't share a transaction and a failed statement
+    is rolled back instead of leaving the store unusable.
+    """
+
+    def __init__(self, connection=None):
+        if connection is None:
+            from loader import pooled_connection
+            connection = pooled_connection
+        self.connection = connection
+
+    def add(self, items):
+        from psycopg2.extras import execute_values
+
+        if not items:
+            return
+        with self.connection() as conn, conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO ingest_work_items
+                    (run_id, seq, tenant_id, platform_id, account_id, start_date, end_date, incremental)
+                VALUES %s ON CONFLICT (run_id, seq) DO NOTHING
+                """,
+                [(i.run_id, i.seq, i.tenant_id, i.platform_id, i.account_id, i.start_date, i.end_date, i.incremental)
+                 for i in items]
+            )
+            conn.commit()
+
+    def start(self, item):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE ingest_work_items
+                SET status = CASE WHEN status IN ('done', 'dead') THEN status ELSE 'running' END,
+                    attempts = attempts + CASE WHEN status IN ('done', 'dead') THEN 0 ELSE 1 END,
+                    updated_at = now()
+                WHERE run_id = %s AND seq = %s
+                RETURNING status, cursor, rows
+                """,
+                (item.run_id, item.seq)
+            )
+            row = cursor.fetchone()
+            conn.commit()
+        if row is None:
+            # Enqueued without being recorded (e.g. replayed from the poison queue by hand).
+            self.add([item])
+            return self.start(item)
+        return {"status": row[0], "cursor": json.loads(row[1]) if row[1] else None, "rows": row[2]}
+
+    def save(self, item, cursor, rows):
+        self._update(item, "cursor = %s, rows = %s", (json.dumps(cursor), rows))
+
+    def finish(self, item, rows):
+        self._update(item, "status = 'done', cursor = NULL, rows = %s, error = NULL", (rows,))
+
+    def fail(self, item, error, dead=False):
+        self._update(item, "status = %s, error = %s", ("dead" if dead else "queued", error))
+
+    def completed_through(self, run_id):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT end_date, status FROM ingest_work_items WHERE run_id = %s ORDER BY seq", (run_id,))
+            rows = cursor.fetchall()
+            conn.commit()
+        return _completed_through([(end_date.isoformat(), status) for end_date, status in rows])
+
+    def run_status(self, run_id):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT seq, start_date, end_date, status, rows, attempts, error
+                FROM ingest_work_items WHERE run_id = %s ORDER BY seq
+                """,
+                (run_id,)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+        return [_status_row(seq, start.isoformat(), end.isoformat(), *rest) for seq, start, end, *rest in rows]
+
+    def _update(self, item, assignments, params):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE ingest_work_items SET {assignments}, updated_at = now() WHERE run_id = %s AND seq = %s",
+                (*params, item.run_id, item.seq)
+            )
+            conn.commit()
+
+
+def _completed_through(items):
+    """`items` is [(end_date, status)] in run order."""
+    through = None
+    for end_date, status in items:
+        if status != "done":
+            break
+        through = end_date
+    return datetime.date.fromisoformat(through) if through else None
+
+
+def _status_row(seq, start_date, end_date, status, rows, attempts, error):
+    return {"seq": seq, "start_date": start_date, "end_date": end_date, "status": status, "rows": rows,
+            "attempts": attempts, "error": error}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """Process-wide store: Postgres when a database is configured, otherwise in memory."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from loader import database_configured
+                if database_configured():
+                    _store = PostgresCheckpointStore()
+                else:
+                    _store = InMemoryCheckpointStore()
+    return _store
+
+
+# --- Queues ---
+
+@dataclass
+class QueueMessage:
+    id: str
+    content: str
+    dequeue_count: int = 1
+    pop_receipt: str = None
+
+
+class InMemoryWorkQueue:
+    """
+    Stand-in for an Azure Storage queue with the same delivery semantics, for
+    local runs and benchmarks: a received message is hidden for its visibility
+    timeout and is delivered again (with a higher `dequeue_count`) unless it is
+    deleted first.
+    """
+
+    def __init__(self, name=QUEUE_NAME, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self._messages = deque()  # [QueueMessage, visible_at]
+        self._lock = threading.Lock()
+        self._dead_letter = None
+
+    def send(self, content, visibility_delay=0):
+        with self._lock:
+            self._messages.append([QueueMessage(str(uuid.uuid4()), content, 0), self.clock() + visibility_delay])
+
+    def receive(self, max_messages=32, visibility_timeout=VISIBILITY_TIMEOUT):
+        with self._lock:
+            now = self.clock()
+            received = []
+            for entry in self._messages:
+                if len(received) >= max_messages:
+                    break
+                message, visible_at = entry
+                if visible_at <= now:
+                    message.dequeue_count += 1
+                    message.pop_receipt = str(uuid.uuid4())
+                    entry[1] = now + visibility_timeout
+                    received.append(QueueMessage(message.id, message.content, message.dequeue_count,
+                                                 message.pop_receipt))
+            return received
+
+    def release(self, message, delay=0):
+        """Makes a received message visible again after `delay` seconds."""
+        with self._lock:
+            for entry in self._messages:
+                if entry[0].id == message.id and entry[0].pop_receipt == message.pop_receipt:
+                    entry[1] = self.clock() + delay
+
+    def delete(self, message):
+        with self._lock:
+            self._messages = deque(e for e in self._messages
+                                   if not (e[0].id == message.id and e[0].pop_receipt == message.pop_receipt))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    @property
+    def dead_letter(self):
+        with self._lock:
+            if self._dead_letter is None:
+                self._dead_letter = InMemoryWorkQueue(f"{self.name}-poison", self.clock)
+            return self._dead_letter
+
+
+class AzureWorkQueue:
+    """
+    An Azure Storage queue (or Azurite, with UseDevelopmentStorage=true). Messages
+    are base64 encoded, as the Functions queue trigger expects by default.
+    """
+
+    def __init__(self, connection_string, name=QUEUE_NAME):
+        from azure.storage.queue import QueueClient, TextBase64DecodePolicy, TextBase64EncodePolicy
+
+        self.connection_string = connection_string
+        self.name = name
+        self.client = QueueClient.from_connection_string(
+            connection_string, name,
+            message_encode_policy=TextBase64EncodePolicy(), message_decode_policy=TextBase64DecodePolicy()
+        )
+        self._created = False
+
+    def send(self, content, visibility_delay=0):
+        self._ensure_queue()
+        self.client.send_message(content, visibility_timeout=visibility_delay or None)
+
+    def receive(self, max_messages=32, visibility_timeout=VISIBILITY_TIMEOUT):
+        self._ensure_queue()
+        messages = self.client.receive_messages(messages_per_page=max_messages, visibility_timeout=visibility_timeout)
+        received = []
+        for message in messages:
+            received.append(QueueMessage(message.id, message.content, message.dequeue_count, message.pop_receipt))
+            if len(received) >= max_messages:
+                break
+        return received
+
+    def release(self, message, delay=0):
+        self.client.update_message(message.id, message.pop_receipt, visibility_timeout=delay)
+
+    def delete(self, message):
+        self.client.delete_message(message.id, message.pop_receipt)
+
+    def __len__(self):
+        self._ensure_queue()
+        return self.client.get_queue_properties().approximate_message_count
+
+    @property
+    def dead_letter(self):
+        return AzureWorkQueue(self.connection_string, f"{self.name}-poison")
+
+    def _ensure_queue(self):
+        if self._created:
+            return
+        from azure.core.exceptions import ResourceExistsError
+
+        try:
+            self.client.create_queue()
+        except ResourceExistsError:
+            pass
+        self._created = True
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_work_queue():
+    """
+    The ingestion queue: in the storage account named by INGEST_QUEUE_CONNECTION
+    (default AzureWebJobsStorage, which is Azurite locally), or an in-process
+    InMemoryWorkQueue when neither is set.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                connection_string = os.environ.get("INGEST_QUEUE_CONNECTION") or os.environ.get("AzureWebJobsStorage")
+                _queue = AzureWorkQueue(connection_string) if connection_string else InMemoryWorkQueue()
+    return _queue
+
+
+# --- Workers ---
+
+class IngestionWorker:
+    """
+    Processes work items, resuming each from its last checkpointed page cursor.
+
+    A failed item is raised so the queue redelivers it, until its delivery count
+    reaches `max_dequeue_count`; it is then moved to the dead-letter queue and
+    marked dead, as are items that can never succeed (unknown platform, rejected
+    credentials, malformed messages). Deliveries of an item that is already done
+    are skipped, so at-least-once delivery does no duplicate work. Incremental runs
+    advance the sync high-water mark over their completed prefix.
+    """
+
+    def __init__(self, token_provider, queue=None, store=None, sync_store=None, max_dequeue_count=MAX_DEQUEUE_COUNT):
+        self.token_provider = token_provider
+        self.queue = get_work_queue() if queue is None else queue  # an empty queue is falsy
+        self.store = store or get_checkpoint_store()
+        self.sync_store = sync_store
+        self.max_dequeue_count = max_dequeue_count
+
+    def handle(self, message):
+        """Processes one queue message. Returns the item result; raises to have the message redelivered."""
+        try:
+            item = WorkItem.from_message(message.content)
+        except (ValueError, TypeError) as e:
+            logging.error(f"Dead-lettering malformed work item {message.id}: {str(e)}")
+            self.queue.dead_letter.send(message.content)
+            return {"status": "dead", "rows": 0, "error": f"Malformed work item: {str(e)}"}
+        return self.process(item, message.content, message.dequeue_count)
+
+    def process(self, item, content=None, dequeue_count=1):
+        started = time.monotonic()
+        result = {"run_id": item.run_id, "seq": item.seq, "tenant_id": item.tenant_id,
+                  "platform_id": item.platform_id, "account_id": item.account_id}
+        state = self.store.start(item)
+        if state["status"] in ("done", "dead"):
+            logging.info(f"Skipping {state['status']} work item {item.run_id}/{item.seq}")
+            return {**result, "status": "skipped", "rows": 0}
+
+        resumed_rows = state["rows"] if state["cursor"] is not None else 0
+        try:
+            token = self.token_provider(item.tenant_id, item.platform_id)
+            summary = ingest_platform(
+                item.platform_id, token, item.account_id, item.start_date, item.end_date, item.tenant_id,
+                cursor=state["cursor"],
+                checkpoint=lambda cursor, rows: self.store.save(item, cursor, resumed_rows + rows)
+            )
+        except Exception as e:
+            dead = dequeue_count >= self.max_dequeue_count or not _retryable(e)
+            logging.error(f"Work item {item.run_id}/{item.seq} ({item.tenant_id}/{item.platform_id} "
+                          f"{item.start_date}..{item.end_date}) failed on attempt {dequeue_count}: {str(e)}")
+            self.store.fail(item, str(e), dead=dead)
+            if not dead:
+                raise
+            self.queue.dead_letter.send(content or item.to_message())
+            return {**result, "status": "dead", "rows": 0, "error": str(e)}
+
+        # Sources without a resumable cursor started over, so their rows are the whole item's.
+        rows = (resumed_rows if summary.get("resumed") else 0) + summary["rows"]
+        self.store.finish(item, rows)
+        if item.incremental:
+            through = self.store.completed_through(item.run_id)
+            if through:
+                (self.sync_store or get_sync_state_store()).advance(item.tenant_id, item.platform_id,
+                                                                   item.account_id, through)
+        result.update(status="ok", rows=rows, duration_s=round(time.monotonic() - started, 3))
+        if "change_ratio" in summary:
+            result.update(written=summary["written"], unchanged=summary["unchanged"],
+                          change_ratio=summary["change_ratio"])
+        return result
+
+    def drain(self, max_workers=8, retry_delay=1.0, poll_interval=0.05):
+        """
+        Works the queue with a local thread pool until it is empty, the way queue
+        triggered instances would. Returns the results of completed deliveries.
+        """
+        results = []
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while True:
+                free = max_workers - len(in_flight)
+                if free:
+                    for message in self.queue.receive(max_messages=free):
+                        in_flight[pool.submit(self.handle, message)] = message
+                if not in_flight:
+                    if not len(self.queue):
+                        return results
+                    time.sleep(poll_interval)  # only messages waiting out a retry delay are left
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    message = in_flight.pop(future)
+                    try:
+                        results.append(future.result())
+                    except Exception:
+                        self.queue.release(message, retry_delay)
+                        continue
+                    self.queue.delete(message)
+
+
+def _retryable(error):
+    """False for failures a redelivery cannot fix: unknown platforms and rejected requests other than throttling."""
+    if isinstance(error, UnknownPlatformError):
+        return False
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return not (status and 400 <= status < 500 and status not in (408, 429))
@@ -46,9 +46,13 @@ CREATE TABLE dim_page (
     metadata JSONB
 );
 
+-- Fact tables are range-partitioned by month on `date` so date-bounded queries
+-- prune to the months they need. Partitions are named <table>_YYYY_MM; the
+-- loader creates them as data for a new month arrives.
+
 -- Fact Table: Daily Performance (Paid Media)
 CREATE TABLE fact_performance_daily (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     tenant_id UUID NOT NULL,
     date DATE NOT NULL,
     campaign_key BIGINT REFERENCES dim_campaign(campaign_key),
@@ -59,26 +63,31 @@ CREATE TABLE fact_performance_daily (
     spend DECIMAL(19,4) DEFAULT 0.0000,
     conversions BIGINT DEFAULT 0,
     conversion_value DECIMAL(19,4) DEFAULT 0.0000,
-    custom_metrics JSONB
-);
+    custom_metrics JSONB,
+    row_hash BIGINT, -- Hash of the non-key columns; reloads skip rows whose hash is unchanged
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
 
 -- Fact Table: Daily Search Performance (GSC)
 CREATE TABLE fact_search_daily (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     tenant_id UUID NOT NULL,
     date DATE NOT NULL,
     keyword_key BIGINT REFERENCES dim_keyword(keyword_key),
     page_url TEXT, -- Can be a dimension if URL cardinality is low, usually text is fine for GSC
+    device TEXT, -- GSC device dimension (DESKTOP, MOBILE, TABLET)
     impressions BIGINT DEFAULT 0,
     clicks BIGINT DEFAULT 0,
     position DECIMAL(10,2), -- Average Position
     ctr DECIMAL(10,4), -- Click Through Rate
-    custom_metrics JSONB
-);
+    custom_metrics JSONB,
+    row_hash BIGINT,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
 
 -- Fact Table: Daily Organic/Page Performance (LinkedIn, Meta Page, TikTok Profile)
 CREATE TABLE fact_organic_daily (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     tenant_id UUID NOT NULL,
     date DATE NOT NULL,
     page_key BIGINT REFERENCES dim_page(page_key),
@@ -86,7 +95,92 @@ CREATE TABLE fact_organic_daily (
     followers_gained BIGINT DEFAULT 0,
     page_views BIGINT DEFAULT 0,
     engagement_rate DECIMAL(10,4),
-    custom_metrics JSONB -- To store platform specific things like "Interactive Sticker Taps" or "LinkedIn Unique Visitors"
+    custom_metrics JSONB, -- To store platform specific things like "Interactive Sticker Taps" or "LinkedIn Unique Visitors"
+    row_hash BIGINT,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+-- Rollups: weekly and monthly aggregates per tenant, rebuilt by the loader for the months it writes.
+-- `grain` is 'week' (periods start on Monday) or 'month'; `period_start` is the first day of the period.
+CREATE TABLE rollup_campaign (
+    tenant_id UUID NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    campaign_key BIGINT,
+    impressions BIGINT,
+    clicks BIGINT,
+    spend DECIMAL(19,4),
+    conversions BIGINT,
+    conversion_value DECIMAL(19,4)
+);
+
+CREATE TABLE rollup_keyword (
+    tenant_id UUID NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    keyword_key BIGINT,
+    impressions BIGINT,
+    clicks BIGINT,
+    position DECIMAL(10,2), -- Impression-weighted average position
+    ctr DECIMAL(10,4)
+);
+
+CREATE TABLE rollup_search_page (
+    tenant_id UUID NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    page_url TEXT,
+    impressions BIGINT,
+    clicks BIGINT,
+    position DECIMAL(10,2),
+    ctr DECIMAL(10,4)
+);
+
+CREATE TABLE rollup_organic_page (
+    tenant_id UUID NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    page_key BIGINT,
+    followers_total BIGINT, -- Highest total in the period
+    followers_gained BIGINT,
+    page_views BIGINT,
+    engagement_rate DECIMAL(10,4)
+);
+
+-- Sync State: per-source high-water marks for incremental ingestion
+CREATE TABLE sync_state (
+    tenant_id UUID NOT NULL,
+    platform_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    high_water_mark DATE, -- Last day fully ingested; the next run resumes after it minus the restatement lookback
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (tenant_id, platform_id, account_id)
+);
+
+-- Ingestion Work Items: queued shards of a planned ingestion run and their page-cursor checkpoints
+CREATE TABLE ingest_work_items (
+    run_id UUID NOT NULL,
+    seq INT NOT NULL, -- Position in the run; items are consecutive date chunks
+    tenant_id UUID NOT NULL,
+    platform_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    incremental BOOLEAN NOT NULL DEFAULT FALSE, -- Advance sync_state as the run completes
+    status TEXT NOT NULL DEFAULT 'queued', -- queued, running, done, dead
+    cursor TEXT, -- Last checkpointed page cursor; the next attempt resumes from it
+    rows BIGINT NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (run_id, seq)
+);
+
+-- Tenant Data Version: bumped after each ingestion that loads rows; derived-result caches key on it
+CREATE TABLE tenant_data_version (
+    tenant_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 -- Indexes
@@ -95,4 +189,27 @@ CREATE INDEX idx_fact_search_tenant_date ON fact_search_daily (tenant_id, date);
 CREATE INDEX idx_fact_organic_tenant_date ON fact_organic_daily (tenant_id, date);
 
 CREATE INDEX idx_fact_perf_campaign ON fact_performance_daily (campaign_key);
+
+-- Natural keys of the facts, matched by the loader when a reload replaces rows (NULL keys compare as -1 / '').
+-- row_hash is included so the unchanged-row check is served by the same index.
+CREATE INDEX idx_fact_perf_natural_key ON fact_performance_daily
+    (tenant_id, date, coalesce(campaign_key, -1), coalesce(adgroup_key, -1), coalesce(ad_key, -1)) INCLUDE (row_hash);
+CREATE INDEX idx_fact_search_natural_key ON fact_search_daily
+    (tenant_id, date, coalesce(keyword_key, -1), coalesce(page_url, ''), coalesce(device, '')) INCLUDE (row_hash);
+CREATE INDEX idx_fact_organic_natural_key ON fact_organic_daily (tenant_id, date, coalesce(page_key, -1)) INCLUDE (row_hash);
+
+-- Rows arrive roughly in date order, so BRIN ranges stay tight and cost almost nothing to keep
+CREATE INDEX brin_fact_perf_date ON fact_performance_daily USING BRIN (date);
+CREATE INDEX brin_fact_search_date ON fact_search_daily USING BRIN (date);
+CREATE INDEX brin_fact_organic_date ON fact_organic_daily USING BRIN (date);
+
+CREATE INDEX idx_rollup_campaign_tenant_period ON rollup_campaign (tenant_id, grain, period_start);
+CREATE INDEX idx_rollup_keyword_tenant_period ON rollup_keyword (tenant_id, grain, period_start);
+CREATE INDEX idx_rollup_search_page_tenant_period ON rollup_search_page (tenant_id, grain, period_start);
+CREATE INDEX idx_rollup_organic_page_tenant_period ON rollup_organic_page (tenant_id, grain, period_start);
 CREATE INDEX idx_dim_campaign_platform_id ON dim_campaign (platform_campaign_id);
+
+-- Natural keys of the dimensions, used by the loader's INSERT ... ON CONFLICT key resolution
+CREATE UNIQUE INDEX uq_dim_campaign_source_id ON dim_campaign (platform_source, platform_campaign_id);
+CREATE UNIQUE INDEX uq_dim_keyword_text ON dim_keyword (keyword_text);
+CREATE UNIQUE INDEX uq_dim_page_source_id ON dim_page (platform_source, platform_page_id);